@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+gh-proxy のツール検証・ディスパッチのマイクロベンチマーク
+
+gh コマンドの実行をスタブに置き換え、validate_arguments と execute_tool の
+1回あたりの所要時間を計測します。複数の gh-proxy.py を指定すると並べて比較できます。
+
+使い方:
+    python3 tools/gh-proxy/bench/bench-dispatch.py
+    git show HEAD~1:tools/gh-proxy/gh-proxy.py > /tmp/gh-proxy-before.py
+    python3 tools/gh-proxy/bench/bench-dispatch.py /tmp/gh-proxy-before.py tools/gh-proxy/gh-proxy.py
+"""
+
+import argparse
+import importlib.util
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_TARGET = Path(__file__).resolve().parent.parent / "gh-proxy.py"
+
+# 計測に使うツール呼び出し（ツール定義の並びの前方・後方を混ぜる）
+CALLS: List[Tuple[str, Dict[str, Any]]] = [
+    ("gh_repo_view", {"owner": "octocat", "repository_name": "hello-world"}),
+    ("gh_pr_list", {"owner": "octocat", "repository_name": "hello-world", "state": "open", "limit": 30}),
+    ("gh_pr_view", {"owner": "octocat", "repository_name": "hello-world", "number": 42}),
+    ("gh_issue_list", {"owner": "octocat", "repository_name": "hello-world", "search": "label:bug"}),
+    ("gh_issue_comments", {"owner": "octocat", "repository_name": "hello-world", "number": 7, "refresh": True}),
+]
+
+
+def load_module(path: Path, index: int):
+    """gh-proxy.py をキャッシュ無効・gh 実行スタブ付きで読み込む"""
+    os.environ["GH_PROXY_CACHE"] = "0"
+    os.environ.pop("GH_PROXY_DISK_CACHE", None)
+    spec = importlib.util.spec_from_file_location(f"gh_proxy_bench_{index}", str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.execute_gh_command = lambda args, timeout=None: ("[]\n", "", 0)
+    return module
+
+
+def measure(module, iterations: int) -> Dict[str, float]:
+    """ツールごとの 1 呼び出しあたりの所要時間（マイクロ秒）を返す"""
+    results = {}
+    for tool_name, arguments in CALLS:
+        # ウォームアップ
+        for _ in range(min(iterations, 1000)):
+            module.validate_arguments(tool_name, arguments)
+            module.execute_tool(tool_name, arguments)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            module.validate_arguments(tool_name, arguments)
+            module.execute_tool(tool_name, arguments)
+        results[tool_name] = (time.perf_counter() - start) / iterations * 1e6
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="gh-proxy のツール検証・ディスパッチのマイクロベンチマーク")
+    parser.add_argument("targets", nargs="*", type=Path, help="計測する gh-proxy.py（省略時はこのリポジトリのもの）")
+    parser.add_argument("-n", "--iterations", type=int, default=20000, help="ツールごとの呼び出し回数")
+    args = parser.parse_args()
+
+    targets = args.targets or [DEFAULT_TARGET]
+    table = []
+    for index, target in enumerate(targets):
+        module = load_module(target, index)
+        table.append((str(target), measure(module, args.iterations)))
+
+    name_width = max(len(name) for name, _ in CALLS)
+    print(f"{'tool':<{name_width}}  " + "  ".join(f"[{i}] us/call" for i in range(len(table))))
+    for tool_name, _ in CALLS:
+        row = "  ".join(f"{results[tool_name]:>12.2f}" for _, results in table)
+        print(f"{tool_name:<{name_width}}  {row}")
+    total = "  ".join(f"{sum(results.values()) / len(results):>12.2f}" for _, results in table)
+    print(f"{'mean':<{name_width}}  {total}")
+    print()
+    for i, (target, _) in enumerate(table):
+        print(f"[{i}] {target}")
+
+
+if __name__ == "__main__":
+    main()
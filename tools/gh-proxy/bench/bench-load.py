@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+gh-proxy の負荷試験
+
+fakes/fake-gh.py を gh として PATH の先頭に置いた状態で gh-proxy.py を起動し、
+複数の keep-alive 接続から tools/call リクエストを並行に送信して、
+スループット（req/s）、レイテンシ（p50/p95/p99）、gh-proxy の RSS を計測します。
+結果は JSON で保存でき、--baseline に以前の結果を指定すると差分を表示します。
+
+使い方:
+    python3 tools/gh-proxy/bench/bench-load.py --concurrency 32 --requests 5000 --output after.json
+    python3 tools/gh-proxy/bench/bench-load.py --proxy /tmp/gh-proxy-before.py --output before.json
+    python3 tools/gh-proxy/bench/bench-load.py --baseline before.json
+
+    # キャッシュを無効にして gh の実行を含めて計測し、pr view の出力を大きくする
+    python3 tools/gh-proxy/bench/bench-load.py --env GH_PROXY_CACHE=0 --output-size "pr view=200000"
+
+    # 記録したカセット（GH_PROXY_CASSETTE_MODE=record）の tools/call を、記録した gh の結果で再生して計測する
+    python3 tools/gh-proxy/bench/bench-load.py --cassette session.jsonl.gz --cassette-latency
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_PROXY = BENCH_DIR.parent / "gh-proxy.py"
+FAKE_GH = BENCH_DIR.parent / "fakes" / "fake-gh.py"
+
+# デフォルトのリクエストの構成（ツール名=重み）
+DEFAULT_MIX = "gh_pr_list=4,gh_issue_list=2,gh_pr_view=3,gh_issue_view=2,gh_pr_comments=1,gh_repo_view=1"
+DEFAULT_LATENCY = "default=0.05"
+DEFAULT_OUTPUT_SIZE = "default=4000"
+
+
+def parse_weights(value: str) -> List[Tuple[str, float]]:
+    """「gh_pr_list=4,gh_pr_view=3」形式の重みを解析"""
+    weights = []
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        weights.append((name.strip(), float(weight or 1)))
+    return weights
+
+
+def make_arguments(tool_name: str, rng: random.Random, repos: int, distinct: int) -> Dict[str, Any]:
+    """ツールの引数を生成（repos 個のリポジトリ・distinct 個の番号から選ぶ）"""
+    arguments: Dict[str, Any] = {"owner": "bench", "repository_name": f"repo{rng.randrange(repos)}"}
+    if tool_name.endswith("_list"):
+        arguments["limit"] = rng.choice([10, 30, 50])
+        arguments["state"] = rng.choice(["open", "all"])
+    elif tool_name != "gh_repo_view":
+        arguments["number"] = rng.randrange(distinct) + 1
+    return arguments
+
+
+def load_cassette_calls(path: Path) -> List[Tuple[str, Dict[str, Any]]]:
+    """カセットに記録された tools/call（ツール名と引数）を記録順に読み込む"""
+    opener = gzip.open if path.suffix == ".gz" else open
+    calls = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("type") == "call":
+                calls.append((record["tool"], record["arguments"]))
+    if not calls:
+        raise ValueError(f"カセットに tools/call の記録がありません: {path}")
+    return calls
+
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    """プロセスの RSS（KB）を取得"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        output = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout
+        return int(output.strip()) if output.strip() else None
+    except (OSError, ValueError):
+        return None
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_proxy(proxy: Path, port: int, env_overrides: Dict[str, str], latency: str,
+                output_size: str, workdir: Path) -> subprocess.Popen:
+    """fake-gh を gh として PATH に置いて gh-proxy を起動し、応答するまで待つ"""
+    bin_dir = workdir / "bin"
+    bin_dir.mkdir()
+    shim = bin_dir / "gh"
+    shim.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_GH}" "$@"\n')
+    shim.chmod(0o755)
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": f"{bin_dir}{os.pathsep}{env.get('PATH', '')}",
+        "GH_PROXY_PORT": str(port),
+        "FAKE_GH_LATENCY": latency,
+        "FAKE_GH_OUTPUT_SIZE": output_size,
+    })
+    env.update(env_overrides)
+    log = open(workdir / "gh-proxy.log", "wb")
+    process = subprocess.Popen([sys.executable, str(proxy)], env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gh-proxy が終了しました（ログ: {workdir / 'gh-proxy.log'}）")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("POST", "/", json.dumps({"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {}}),
+                         {"Content-Type": "application/json"})
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("gh-proxy が起動しませんでした")
+
+
+class LoadGenerator:
+    """
+    keep-alive 接続ごとに1スレッドで tools/call を送信する負荷生成器
+
+    calls を指定した場合はツールの重みの代わりに、記録された tools/call を記録順に（最後まで送ったら先頭から）送信する。
+    """
+
+    def __init__(self, port: int, mix: List[Tuple[str, float]], repos: int, distinct: int, seed: int,
+                 calls: Optional[List[Tuple[str, Dict[str, Any]]]] = None):
+        self.port = port
+        self.mix = mix
+        self.repos = repos
+        self.distinct = distinct
+        self.seed = seed
+        self.calls = calls
+        self.lock = threading.Lock()
+        self.remaining = 0
+        self.sent = 0
+        self.results: List[Tuple[str, float, bool]] = []
+
+    def _take(self) -> bool:
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def _next_call(self, rng: random.Random, names: List[str], weights: List[float]) -> Tuple[str, Dict[str, Any]]:
+        if self.calls:
+            with self.lock:
+                call = self.calls[self.sent % len(self.calls)]
+                self.sent += 1
+            return call
+        tool_name = rng.choices(names, weights)[0]
+        return tool_name, make_arguments(tool_name, rng, self.repos, self.distinct)
+
+    def _worker(self, index: int, deadline: Optional[float], record: bool) -> None:
+        rng = random.Random(self.seed * 1000 + index)
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+        local: List[Tuple[str, float, bool]] = []
+        request_id = 0
+        while (deadline is None or time.monotonic() < deadline) and self._take():
+            tool_name, arguments = self._next_call(rng, names, weights)
+            request_id += 1
+            body = json.dumps({
+                "jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+                "params": {"name": tool_name, "arguments": arguments}
+            })
+            started = time.perf_counter()
+            try:
+                conn.request("POST", "/", body, {"Content-Type": "application/json"})
+                response = json.loads(conn.getresponse().read())
+                ok = "result" in response and not response["result"].get("isError")
+            except (OSError, http.client.HTTPException, ValueError):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+                ok = False
+            local.append((tool_name, time.perf_counter() - started, ok))
+        conn.close()
+        if record:
+            with self.lock:
+                self.results.extend(local)
+
+    def run(self, concurrency: int, requests: int, duration: Optional[float], record: bool = True) -> float:
+        """リクエストを送信し、経過時間（秒）を返す"""
+        self.remaining = requests if duration is None else sys.maxsize
+        deadline = time.monotonic() + duration if duration is not None else None
+        threads = [
+            threading.Thread(target=self._worker, args=(i, deadline, record), daemon=True)
+            for i in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def git_revision(path: Path) -> Optional[str]:
+    try:
+        output = subprocess.run(["git", "-C", str(path.parent), "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True)
+        return output.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    overall = result["overall"]
+    print(f"requests: {overall['count']}  errors: {result['errors']}  "
+          f"elapsed: {result['elapsed_s']:.2f}s  throughput: {result['requests_per_second']:.1f} req/s")
+    print(f"RSS: start {result['rss_kb']['start']} KB  peak {result['rss_kb']['peak']} KB  "
+          f"end {result['rss_kb']['end']} KB")
+    print()
+    header = f"{'tool':<20} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    rows = [("overall", overall)] + sorted(result["tools"].items())
+    for name, stats in rows:
+        print(f"{name:<20} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+
+    if baseline:
+        print()
+        print(f"baseline: {baseline.get('label') or baseline.get('revision') or ''}")
+
+        def delta(new: float, old: float) -> str:
+            return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+        print(f"  throughput: {baseline['requests_per_second']:.1f} -> {result['requests_per_second']:.1f} req/s "
+              f"({delta(result['requests_per_second'], baseline['requests_per_second'])})")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            old = baseline["overall"][key]
+            print(f"  {key}: {old:.2f} -> {overall[key]:.2f} ({delta(overall[key], old)})")
+        print(f"  peak RSS: {baseline['rss_kb']['peak']} -> {result['rss_kb']['peak']} KB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="gh-proxy の負荷試験")
+    parser.add_argument("--proxy", type=Path, default=DEFAULT_PROXY, help="計測する gh-proxy.py")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="同時接続数")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="送信するリクエスト数")
+    parser.add_argument("-d", "--duration", type=float, help="指定した場合、リクエスト数の代わりにこの秒数だけ送信")
+    parser.add_argument("--warmup", type=int, default=100, help="計測前に送信するリクエスト数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"ツールごとの重み（デフォルト: {DEFAULT_MIX}）")
+    parser.add_argument("--repos", type=int, default=5, help="リクエストに使うリポジトリ数")
+    parser.add_argument("--distinct", type=int, default=200, help="PR / Issue 番号の種類数")
+    parser.add_argument("--latency", default=DEFAULT_LATENCY,
+                        help=f"fake gh のサブコマンドごとの遅延（秒、デフォルト: {DEFAULT_LATENCY}）")
+    parser.add_argument("--output-size", default=DEFAULT_OUTPUT_SIZE,
+                        help=f"fake gh のサブコマンドごとの出力サイズ（バイト、デフォルト: {DEFAULT_OUTPUT_SIZE}）")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="gh-proxy に渡す環境変数（複数指定可）")
+    parser.add_argument("--cassette", type=Path,
+                        help="指定した場合、このカセットに記録された tools/call を送信し、gh の結果もカセットから再生する")
+    parser.add_argument("--cassette-latency", action="store_true",
+                        help="カセットの再生時に記録した gh の実行時間だけ待つ")
+    parser.add_argument("--seed", type=int, default=1, help="乱数のシード")
+    parser.add_argument("--label", default="", help="結果に記録するラベル")
+    parser.add_argument("-o", "--output", type=Path, help="結果を保存する JSON ファイル")
+    parser.add_argument("--baseline", type=Path, help="比較する以前の結果（JSON）")
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    mix = parse_weights(args.mix)
+    port = free_port()
+    calls = None
+    if args.cassette:
+        calls = load_cassette_calls(args.cassette)
+        env_overrides.setdefault("GH_PROXY_CASSETTE", str(args.cassette.resolve()))
+        env_overrides.setdefault("GH_PROXY_CASSETTE_MODE", "replay")
+        env_overrides.setdefault("GH_PROXY_CASSETTE_LATENCY", "1" if args.cassette_latency else "0")
+
+    with tempfile.TemporaryDirectory(prefix="gh-proxy-bench-") as workdir:
+        process = start_proxy(args.proxy, port, env_overrides, args.latency, args.output_size, Path(workdir))
+        try:
+            generator = LoadGenerator(port, mix, args.repos, args.distinct, args.seed, calls)
+            if args.warmup:
+                generator.run(args.concurrency, args.warmup, None, record=False)
+            rss_start = read_rss_kb(process.pid)
+
+            # 計測中は RSS を定期的に取得して最大値を記録する
+            rss_peak = [rss_start or 0]
+            stop = threading.Event()
+
+            def sample_rss():
+                while not stop.wait(0.1):
+                    rss = read_rss_kb(process.pid)
+                    if rss:
+                        rss_peak[0] = max(rss_peak[0], rss)
+
+            sampler = threading.Thread(target=sample_rss, daemon=True)
+            sampler.start()
+            elapsed = generator.run(args.concurrency, args.requests, args.duration)
+            stop.set()
+            sampler.join()
+            rss_end = read_rss_kb(process.pid)
+        finally:
+            process.terminate()
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    by_tool: Dict[str, List[float]] = {}
+    for tool_name, latency, _ in generator.results:
+        by_tool.setdefault(tool_name, []).append(latency)
+    result = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "proxy": str(args.proxy),
+        "revision": git_revision(args.proxy),
+        "python": platform.python_version(),
+        "parameters": {
+            "concurrency": args.concurrency, "requests": args.requests, "duration": args.duration,
+            "warmup": args.warmup, "mix": args.mix, "repos": args.repos, "distinct": args.distinct,
+            "latency": args.latency, "output_size": args.output_size, "env": env_overrides, "seed": args.seed,
+            "cassette": str(args.cassette) if args.cassette else None, "cassette_latency": args.cassette_latency,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(len(generator.results) / elapsed, 2) if elapsed else 0.0,
+        "errors": sum(1 for _, _, ok in generator.results if not ok),
+        "overall": summarize([latency for _, latency, _ in generator.results]),
+        "tools": {name: summarize(values) for name, values in by_tool.items()},
+        "rss_kb": {"start": rss_start, "peak": max(rss_peak[0], rss_end or 0), "end": rss_end},
+    }
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print_report(result, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n")
+        print(f"\n結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
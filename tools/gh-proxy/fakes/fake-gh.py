@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+gh コマンドのスタンドイン
+
+gh-proxy の負荷試験（bench/bench-load.py）で PATH の先頭に置く gh として使用します。
+gh-proxy が実行するサブコマンド（repo view / pr list / pr view / issue list / issue view / api）に対して、
+指定した遅延の後に gh の --json 出力と同じ形のダミーデータを返します。
+pr diff に対しては指定したサイズになるまでファイルを並べた unified diff を返します。
+api rate_limit には十分な残りクォータを返し、REST リソースの api -i には ETag ヘッダー付きで応答します
+（If-None-Match が一致する場合は gh と同じく 304 を出力して終了コード 1 で終了します）。
+
+環境変数:
+    FAKE_GH_LATENCY: サブコマンドごとの遅延（秒）。例: "pr list=0.05,pr view=0.1,default=0.02"
+    FAKE_GH_OUTPUT_SIZE: サブコマンドごとの出力サイズの目安（バイト）。例: "pr view=20000,default=2000"
+    FAKE_GH_VERSION: 変更すると REST リソースの ETag が変わる（デフォルト 1）
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+
+def parse_settings(value: str) -> Dict[str, float]:
+    """「pr list=0.05,default=0.02」形式の設定を解析"""
+    settings = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, number = item.rsplit("=", 1)
+            settings[name.strip()] = float(number)
+    return settings
+
+
+def setting_for(settings: Dict[str, float], subcommand: str, default: float) -> float:
+    return settings.get(subcommand, settings.get("default", default))
+
+
+def option(args: List[str], name: str, default: str) -> str:
+    return args[args.index(name) + 1] if name in args and args.index(name) + 1 < len(args) else default
+
+
+def api_request(args: List[str]) -> Tuple[str, bool, Dict[str, str]]:
+    """gh api の引数からエンドポイント、-i の有無、-H で指定したヘッダー（小文字キー）を取り出す"""
+    endpoint = ""
+    include = False
+    headers = {}
+    index = 1
+    while index < len(args):
+        arg = args[index]
+        if arg in ("-i", "--include"):
+            include = True
+        elif arg in ("-H", "--header") and index + 1 < len(args):
+            name, _, value = args[index + 1].partition(":")
+            headers[name.strip().lower()] = value.strip()
+            index += 1
+        elif arg.startswith("-"):
+            # -X / -f / -F などの値を取るオプション
+            index += 1
+        elif not endpoint:
+            endpoint = arg
+        index += 1
+    return endpoint, include, headers
+
+
+def api_response(args: List[str]) -> int:
+    """gh api の応答（-i の場合はステータス行とヘッダーを先に出力する）"""
+    endpoint, include, headers = api_request(args)
+    reset = int(time.time()) + 3600
+    status_line = "HTTP/2.0 200 OK"
+    response_headers = {
+        "Content-Type": "application/json; charset=utf-8",
+        "X-Ratelimit-Limit": "5000",
+        "X-Ratelimit-Remaining": "4999",
+        "X-Ratelimit-Reset": str(reset),
+    }
+    if endpoint == "rate_limit":
+        quota = {"limit": 5000, "used": 1, "remaining": 4999, "reset": reset}
+        body: Any = {"resources": {"core": quota, "graphql": quota, "search": dict(quota, limit=30, remaining=29)},
+                     "rate": quota}
+    elif endpoint.startswith("repos/"):
+        version = os.environ.get("FAKE_GH_VERSION", "1")
+        etag = 'W/"' + hashlib.sha1((endpoint + version).encode("utf-8")).hexdigest() + '"'
+        response_headers["Etag"] = etag
+        if headers.get("if-none-match") == etag:
+            if include:
+                print("HTTP/2.0 304 Not Modified")
+                for name, value in response_headers.items():
+                    if name != "Content-Type":
+                        print(f"{name}: {value}")
+                print()
+            sys.stderr.write("gh: HTTP 304\n")
+            return 1
+        body = {"url": f"https://api.github.com/{endpoint}", "version": version}
+    else:
+        body = {}
+    if include:
+        print(status_line)
+        for name, value in response_headers.items():
+            print(f"{name}: {value}")
+        print()
+    print(json.dumps(body))
+    return 0
+
+
+def padding(size: int) -> str:
+    return ("Lorem ipsum dolor sit amet. " * (size // 28 + 1))[:max(size, 0)]
+
+
+def make_item(n: int, fields: List[str], body_size: int) -> Dict[str, Any]:
+    values = {
+        "number": n,
+        "title": f"Item {n}",
+        "body": padding(body_size),
+        "state": "OPEN" if n % 3 else "CLOSED",
+        "author": {"id": f"U_{n % 7}", "is_bot": False, "login": f"user{n % 7}", "name": f"User {n % 7}"},
+        "createdAt": "2024-01-01T00:00:00Z",
+        "updatedAt": "2024-01-02T00:00:00Z",
+        "mergeable": "MERGEABLE",
+        "mergedAt": None,
+        "comments": [
+            {"author": {"login": f"user{i}"}, "body": padding(body_size // 10), "createdAt": "2024-01-03T00:00:00Z"}
+            for i in range(10)
+        ],
+    }
+    return {field: values.get(field) for field in fields}
+
+
+def make_diff(number: int, size: int) -> str:
+    """size バイト程度になるまで、1ファイルあたり数個の hunk を持つ diff を生成"""
+    chunks = []
+    total = 0
+    index = 0
+    while total < max(size, 1):
+        path = f"src/module{index}/file{number}_{index}.py"
+        lines = [
+            f"diff --git a/{path} b/{path}",
+            f"index {index:07x}..{index + 1:07x} 100644",
+            f"--- a/{path}",
+            f"+++ b/{path}",
+        ]
+        for hunk in range(index % 3 + 1):
+            lines.append(f"@@ -{hunk * 20 + 1},4 +{hunk * 20 + 1},{4 + index % 2} @@ def f{hunk}():")
+            lines.append("     context = True")
+            lines.append(f"-    value = {hunk}")
+            lines.append(f"+    value = {hunk + 1}  # {padding(40)}")
+            if index % 2:
+                lines.append(f"+    extra = {index}")
+            lines.append("     return value")
+        chunk = "\n".join(lines) + "\n"
+        chunks.append(chunk)
+        total += len(chunk)
+        index += 1
+    return "".join(chunks)
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    subcommand = " ".join(args[:2])
+    latency = setting_for(parse_settings(os.environ.get("FAKE_GH_LATENCY", "")), subcommand, 0.0)
+    size = int(setting_for(parse_settings(os.environ.get("FAKE_GH_OUTPUT_SIZE", "")), subcommand, 2000))
+    time.sleep(latency)
+
+    if subcommand == "auth token":
+        print("fake-token")
+        return 0
+    if args[:1] == ["api"]:
+        return api_response(args)
+    if subcommand == "pr diff":
+        sys.stdout.write(make_diff(int(args[2]), size))
+        return 0
+
+    fields = option(args, "--json", "number,title").split(",")
+    if subcommand == "repo view":
+        repo = args[2] if len(args) > 2 else "fake/fake"
+        data: Any = {
+            "name": repo.split("/")[-1], "owner": {"id": "O_1", "login": repo.split("/")[0]},
+            "description": padding(min(size, 200)), "url": f"https://github.com/{repo}",
+            "stargazerCount": 42, "forkCount": 7,
+            "createdAt": "2024-01-01T00:00:00Z", "updatedAt": "2024-01-02T00:00:00Z",
+        }
+        data = {field: data.get(field) for field in fields}
+    elif args[1:2] == ["list"]:
+        limit = int(option(args, "--limit", "30"))
+        data = [make_item(n, fields, size // max(limit, 1)) for n in range(limit, 0, -1)]
+    elif args[1:2] == ["view"]:
+        data = make_item(int(args[2]), fields, size)
+    else:
+        sys.stderr.write(f"fake-gh: unsupported command: {' '.join(args)}\n")
+        return 1
+
+    # gh と同じくインデント付きで出力する
+    print(json.dumps(data, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
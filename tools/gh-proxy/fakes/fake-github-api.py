@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+GitHub API スタンドイン サーバー
+
+gh-proxy の HTTP バックエンド（GH_PROXY_BACKEND=http）をオフラインで動作確認するための
+ローカル HTTP サーバーです。gh-proxy が発行する GraphQL クエリと REST リクエストに対して、
+決定的に生成したダミーデータを返します。
+
+GraphQL は汎用的な実装ではなく、gh-proxy が使用するルートフィールド
+（repository / pullRequest(s) / issue(s) / comments / search）を正規表現で解釈し、
+要求されたフィールドを含む上位集合のオブジェクトを返します。
+
+使い方:
+    FAKE_GITHUB_PORT=30780 python3 tools/gh-proxy/fakes/fake-github-api.py
+    GH_TOKEN=dummy GH_PROXY_BACKEND=http GH_PROXY_API_URL=http://127.0.0.1:30780 \\
+        python3 tools/gh-proxy/gh-proxy.py
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+PORT = int(os.environ.get('FAKE_GITHUB_PORT', '30780'))
+# リポジトリごとの PR / Issue の件数
+ITEM_COUNT = int(os.environ.get('FAKE_GITHUB_ITEMS', '250'))
+# 1リクエストあたりの応答遅延（秒）
+LATENCY = float(os.environ.get('FAKE_GITHUB_LATENCY', '0'))
+# 変更すると REST リソースの ETag が変わる
+DATA_VERSION = os.environ.get('FAKE_GITHUB_VERSION', '1')
+# 起動時刻に更新されたものとして扱う PR / Issue の番号（カンマ区切り、差分同期の確認用）
+TOUCHED = {int(n) for n in os.environ.get('FAKE_GITHUB_TOUCH', '').split(',') if n.strip()}
+STARTED_AT = int(time.time())
+
+BASE_TIME = 1704067200  # 2024-01-01T00:00:00Z
+
+# エイリアス付きのルートフィールド呼び出し（例: pr12: pullRequest(number: 12)）
+FIELD_CALL = re.compile(r'(?:(\w+)\s*:\s*)?\b(pullRequests|issues|pullRequest|issue|search)\s*\(([^)]*)\)')
+ARGUMENT = re.compile(r'(\w+)\s*:\s*(\$\w+|-?\d+|"(?:[^"\\]|\\.)*"|\[[^\]]*\]|\w+)')
+
+
+def timestamp(seconds: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+def make_author(n: int) -> Dict[str, Any]:
+    if n % 11 == 0:
+        return {"__typename": "Bot", "login": "dependabot", "id": f"BOT_{n}"}
+    return {"__typename": "User", "login": f"user{n % 5}", "id": f"USER_{n % 5}", "name": f"User {n % 5}"}
+
+
+def item_state(kind: str, n: int) -> str:
+    if n % 3 != 0:
+        return "OPEN"
+    if kind == "pr" and n % 2 == 0:
+        return "MERGED"
+    return "CLOSED"
+
+
+def make_comment(kind: str, n: int, index: int) -> Dict[str, Any]:
+    return {
+        "id": f"IC_{kind}_{n}_{index}",
+        "author": make_author(n + index),
+        "authorAssociation": "MEMBER",
+        "body": f"Comment {index} on {kind} #{n}",
+        "createdAt": timestamp(BASE_TIME + n * 3600 + index * 60),
+        "includesCreatedEdit": False,
+        "isMinimized": False,
+        "minimizedReason": "",
+        "reactionGroups": [{"content": "THUMBS_UP", "users": {"totalCount": index % 2}}],
+        "url": f"https://github.com/fake/fake/issues/{n}#issuecomment-{index}",
+        "viewerDidAuthor": False,
+    }
+
+
+def connection(items: List[Any], args: Dict[str, Any]) -> Dict[str, Any]:
+    """first / after 引数に従ってページを切り出す（カーソルは "cursor:<オフセット>"）"""
+    first = int(args.get("first") or 30)
+    after = args.get("after")
+    start = int(after.split(":", 1)[1]) if after else 0
+    page = items[start:start + first]
+    end = start + len(page)
+    return {
+        "nodes": page,
+        "totalCount": len(items),
+        "pageInfo": {"hasNextPage": end < len(items), "endCursor": f"cursor:{end}" if page else after},
+    }
+
+
+def make_item(kind: str, n: int, comment_args: Dict[str, Any]) -> Dict[str, Any]:
+    comments = [make_comment(kind, n, i) for i in range(n % 7)]
+    item = {
+        "__typename": "PullRequest" if kind == "pr" else "Issue",
+        "number": n,
+        "title": f"{'Pull request' if kind == 'pr' else 'Issue'} {n}",
+        "body": f"Body of {kind} #{n}\n" + "Lorem ipsum dolor sit amet. " * (n % 20),
+        "state": item_state(kind, n),
+        "author": make_author(n),
+        "createdAt": timestamp(BASE_TIME + n * 3600),
+        "updatedAt": timestamp(BASE_TIME + n * 3600 + (n % 13) * 86400),
+        "url": f"https://github.com/fake/fake/{'pull' if kind == 'pr' else 'issues'}/{n}",
+        "labels": {"nodes": [{"name": "bug" if n % 2 else "enhancement"}]},
+        "comments": connection(comments, comment_args),
+    }
+    if n in TOUCHED:
+        item["title"] += " (updated)"
+        item["updatedAt"] = timestamp(STARTED_AT)
+    if kind == "pr":
+        item.update({
+            "mergeable": "MERGEABLE",
+            "mergedAt": timestamp(BASE_TIME + n * 3600 + 7200) if item["state"] == "MERGED" else None,
+            "headRefName": f"feature-{n}",
+            "baseRefName": "main",
+            "additions": n * 3,
+            "deletions": n,
+            "changedFiles": n % 4 + 1,
+            "files": connection(
+                [{"path": f"src/file{i}.py", "additions": i + 1, "deletions": i} for i in range(n % 4 + 1)],
+                {"first": 100}
+            ),
+            "reviewThreads": connection(
+                [{
+                    "isResolved": i % 2 == 0,
+                    "path": f"src/file{i}.py",
+                    "line": i + 10,
+                    "comments": {"nodes": [make_comment("review", n, i)]},
+                } for i in range(n % 3)],
+                {"first": 100}
+            ),
+        })
+    return item
+
+
+def parse_arguments(text: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    args = {}
+    for name, value in ARGUMENT.findall(text):
+        if value.startswith("$"):
+            args[name] = variables.get(value[1:])
+        elif value.startswith('"'):
+            args[name] = json.loads(value)
+        elif value.lstrip("-").isdigit():
+            args[name] = int(value)
+        elif value.startswith("["):
+            args[name] = [v.strip() for v in value.strip("[]").split(",") if v.strip()]
+        else:
+            args[name] = value
+    return args
+
+
+def items_of(kind: str, states: Optional[List[str]], args: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """番号の降順（orderBy が UPDATED_AT の場合は更新日時の降順）に並べた PR / Issue"""
+    args = args or {}
+    numbers = range(ITEM_COUNT, 0, -1)
+    items = [make_item(kind, n, {"first": 100}) for n in numbers]
+    if states:
+        items = [item for item in items if item["state"] in states]
+    if args.get("since"):
+        items = [item for item in items if item["updatedAt"] >= args["since"]]
+    if args.get("field") == "UPDATED_AT":
+        items.sort(key=lambda item: item["updatedAt"], reverse=True)
+    return items
+
+
+def resolve_graphql(query: str, variables: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """gh-proxy が発行するクエリに対する (data, errors) を生成"""
+    data: Dict[str, Any] = {}
+    errors: List[Dict[str, Any]] = []
+    repository: Dict[str, Any] = {}
+    comment_match = re.search(r'comments\s*\(([^)]*)\)', query)
+    comment_args = parse_arguments(comment_match.group(1), variables) if comment_match else {"first": 100}
+
+    for alias, field, arg_text in FIELD_CALL.findall(query):
+        args = parse_arguments(arg_text, variables)
+        key = alias or field
+        if field == "search":
+            q = args.get("query", "")
+            kind = "pr" if "is:pr" in q else "issue"
+            items = items_of(kind, None)
+            for state in ("open", "closed", "merged"):
+                if f"is:{state}" in q:
+                    items = [item for item in items if item["state"] == state.upper()
+                             or (state == "closed" and item["state"] == "MERGED")]
+            since = re.search(r'updated:>=?(\S+)', q)
+            if since:
+                items = [item for item in items if item["updatedAt"] > since.group(1)]
+            result = connection(items, args)
+            result["issueCount"] = len(items)
+            data[key] = result
+        elif field in ("pullRequests", "issues"):
+            kind = "pr" if field == "pullRequests" else "issue"
+            repository[key] = connection(items_of(kind, args.get("states"), args), args)
+        else:
+            kind = "pr" if field == "pullRequest" else "issue"
+            number = int(args.get("number") or 0)
+            if not 1 <= number <= ITEM_COUNT:
+                # 存在しない番号は該当フィールドのみ null にして errors に記録する（GitHub と同じ部分エラー）
+                repository[key] = None
+                errors.append({
+                    "type": "NOT_FOUND",
+                    "path": ["repository", key],
+                    "message": f"Could not resolve to a {'PullRequest' if kind == 'pr' else 'Issue'} with the number of {number}."
+                })
+                continue
+            repository[key] = make_item(kind, number, comment_args)
+
+    if "repository(" in query:
+        repository.update({
+            "name": variables.get("name", "fake"),
+            "owner": {"id": "OWNER_1", "login": variables.get("owner", "fake")},
+            "description": "Fake repository served by fake-github-api.py",
+            "url": f"https://github.com/{variables.get('owner')}/{variables.get('name')}",
+            "stargazerCount": 42,
+            "forkCount": 7,
+            "createdAt": timestamp(BASE_TIME),
+            "updatedAt": timestamp(BASE_TIME + ITEM_COUNT * 3600),
+        })
+        data["repository"] = repository
+    return data, errors
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        if not self.headers.get("Authorization", "").lower().startswith(("bearer ", "token ")):
+            self._send(401, {"message": "Requires authentication"})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if LATENCY:
+            time.sleep(LATENCY)
+        if not self._authorized():
+            return
+        if self.path != "/graphql":
+            self._send(404, {"message": "Not Found"})
+            return
+        data, errors = resolve_graphql(request.get("query", ""), request.get("variables") or {})
+        payload: Dict[str, Any] = {"data": data}
+        if errors:
+            payload["errors"] = errors
+        self._send(200, payload)
+
+    def do_GET(self):
+        if LATENCY:
+            time.sleep(LATENCY)
+        if not self._authorized():
+            return
+        if self.path.startswith("/rate_limit"):
+            self._send(200, {"resources": {"core": {"limit": 5000, "remaining": 4999, "reset": int(time.time()) + 3600},
+                                           "graphql": {"limit": 5000, "remaining": 4999, "reset": int(time.time()) + 3600}}})
+            return
+        if not self.path.startswith("/repos/"):
+            self._send(404, {"message": "Not Found"})
+            return
+        etag = '"' + hashlib.sha1((self.path + DATA_VERSION).encode("utf-8")).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, None, {"ETag": etag})
+            return
+        self._send(200, {"path": self.path, "version": DATA_VERSION}, {"ETag": etag})
+
+
+def main():
+    with ThreadingHTTPServer(("127.0.0.1", PORT), Handler) as httpd:
+        print(f"Fake GitHub API on http://127.0.0.1:{PORT}")
+        httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
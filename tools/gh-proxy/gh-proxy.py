@@ -9,21 +9,160 @@ GitHub CLI (gh) コマンドへのreadonly操作を提供します。
 安全にgh コマンドを実行して結果を返します。
 """
 
+import asyncio
+import atexit
+import base64
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import gzip
+import heapq
+import http.client
+import io
+import ipaddress
+import itertools
 import json
+import mmap
 import subprocess
 import re
 import os
+import queue
+import select
+import shutil
+import signal
+import socket
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
+import urllib.parse
 from wsgiref.simple_server import make_server
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 
 # サーバー設定
 PORT = int(os.environ.get('GH_PROXY_PORT', '30721'))
 TIMEOUT = int(os.environ.get('GH_PROXY_TIMEOUT', '30'))
+# サーバーモード: async（asyncio + HTTP/1.1 keep-alive）または wsgi（wsgiref、1接続ずつ処理）
+SERVER_MODE = os.environ.get('GH_PROXY_SERVER', 'async')
+# 同時に実行する gh プロセスの上限（asyncモードのみ）
+MAX_CONCURRENCY = int(os.environ.get('GH_PROXY_MAX_CONCURRENCY', '8'))
+# リクエスト処理スレッド数（asyncモードのみ）
+HANDLER_THREADS = int(os.environ.get('GH_PROXY_THREADS', '32'))
+# keep-alive 接続のアイドルタイムアウト（秒）
+KEEPALIVE_TIMEOUT = int(os.environ.get('GH_PROXY_KEEPALIVE_TIMEOUT', '60'))
+# ワーカープロセス数（asyncモードのみ、0で単一プロセス。--workers で上書きできる）
+WORKERS = int(os.environ.get('GH_PROXY_WORKERS', '0'))
+# ワーカーを入れ替えるまでに処理するリクエスト数（0で無制限）
+WORKER_MAX_REQUESTS = int(os.environ.get('GH_PROXY_WORKER_MAX_REQUESTS', '0'))
+# ワーカーを入れ替える RSS の上限（MB、0で無制限）
+WORKER_MAX_RSS_MB = int(os.environ.get('GH_PROXY_WORKER_MAX_RSS_MB', '0'))
+# 停止・入れ替え時に処理中のリクエストの完了を待つ時間（秒）
+WORKER_GRACEFUL_TIMEOUT = float(os.environ.get('GH_PROXY_WORKER_GRACEFUL_TIMEOUT', '30'))
+# ワーカープロセスとして起動された場合の番号と親プロセスへの通知用パイプ（親プロセスが設定する内部用の環境変数）
+WORKER_ID = os.environ.get('GH_PROXY_WORKER_ID')
+WORKER_NOTIFY_FD = int(os.environ.get('GH_PROXY_WORKER_NOTIFY_FD', '-1'))
+# ワーカープロセスではレートとバックグラウンド更新の上限をワーカー間で分け合う（親プロセスが GH_PROXY_WORKERS を設定する）
+WORKER_SHARE = max(WORKERS, 1) if WORKER_ID is not None else 1
+# ツールの実行方式: gh（gh コマンドを実行）または http（GitHub API に直接接続）
+BACKEND = os.environ.get('GH_PROXY_BACKEND', 'gh')
+# HTTP バックエンドの接続先
+API_URL = os.environ.get('GH_PROXY_API_URL', 'https://api.github.com')
+# バッチリクエストの各エントリを並行に処理するワーカー数
+BATCH_WORKERS = int(os.environ.get('GH_PROXY_BATCH_WORKERS', '8'))
+# レスポンスキャッシュ（0で無効化）
+CACHE_ENABLED = os.environ.get('GH_PROXY_CACHE', '1') != '0'
+# キャッシュに保持するレスポンス本文の合計サイズ上限（バイト）
+CACHE_MAX_BYTES = int(os.environ.get('GH_PROXY_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Accept-Encoding: gzip を指定したクライアントへのレスポンス圧縮（0で無効化）
+GZIP_ENABLED = os.environ.get('GH_PROXY_GZIP', '1') != '0'
+# 圧縮するレスポンス本文の最小サイズ（バイト）
+GZIP_MIN_BYTES = int(os.environ.get('GH_PROXY_GZIP_MIN_BYTES', '1024'))
 PROTOCOL_VERSION = "2024-11-05"
 SERVER_NAME = "gh-proxy"
 SERVER_VERSION = "1.0.0"
 
+# ディスクキャッシュ（SQLite）のパス。未指定の場合はディスクキャッシュを使わない
+DISK_CACHE_PATH = os.environ.get('GH_PROXY_DISK_CACHE', '')
+
+# gh の呼び出しを記録・再生するカセットのパス（.gz の場合は gzip 圧縮）とモード（record / replay）
+CASSETTE_PATH = os.environ.get('GH_PROXY_CASSETTE', '')
+CASSETTE_MODE = os.environ.get('GH_PROXY_CASSETTE_MODE', 'replay')
+# 再生時に記録した実行時間だけ待ってから結果を返す（1で有効）
+CASSETTE_LATENCY = os.environ.get('GH_PROXY_CASSETTE_LATENCY', '0') == '1'
+# GET /debug/traces で参照できるように保持する直近のトレースの件数（0でトレースを記録しない）
+TRACE_BUFFER = int(os.environ.get('GH_PROXY_TRACE_BUFFER', '200'))
+
+# gh / GitHub API の呼び出しの平均レート（回/秒、0で無制限）とバースト
+RATE = float(os.environ.get('GH_PROXY_RATE', '0'))
+RATE_BURST = int(os.environ.get('GH_PROXY_RATE_BURST', '20'))
+# 残りクォータがこの値以下になると対話的な呼び出し（詳細・コメント）以外はリセットまで待機する
+RATE_RESERVE = int(os.environ.get('GH_PROXY_RATE_RESERVE', '100'))
+# 待ち時間がこの秒数を超える場合は待たずに再試行までの秒数を返す
+RATE_MAX_WAIT = float(os.environ.get('GH_PROXY_RATE_MAX_WAIT', '20'))
+# レート制限で失敗した呼び出しを待機後に再試行する回数
+RATE_RETRIES = int(os.environ.get('GH_PROXY_RATE_RETRIES', '2'))
+# gh api rate_limit で残りクォータを確認する間隔（秒、0で確認しない。gh バックエンドのみ）
+RATE_LIMIT_POLL = float(os.environ.get('GH_PROXY_RATE_LIMIT_POLL', '60'))
+
+# よく使われる呼び出しのバックグラウンド更新（1で有効化）
+PREFETCH_ENABLED = os.environ.get('GH_PROXY_PREFETCH', '0') == '1'
+# 更新対象とする上位の呼び出し数
+PREFETCH_TOP = int(os.environ.get('GH_PROXY_PREFETCH_TOP', '10'))
+# キャッシュエントリを更新するまでの最短の間隔（秒、TTL の8割の方が長い場合はそちら）
+PREFETCH_FRESHNESS = float(os.environ.get('GH_PROXY_PREFETCH_FRESHNESS', '20'))
+# アクセス回数の半減期（秒）
+PREFETCH_HALF_LIFE = float(os.environ.get('GH_PROXY_PREFETCH_HALF_LIFE', '1800'))
+# 更新対象とする最小スコア（減衰後のアクセス回数。デフォルトでは直近に2回以上アクセスされたもの）
+PREFETCH_MIN_SCORE = float(os.environ.get('GH_PROXY_PREFETCH_MIN_SCORE', '1.5'))
+# バックグラウンド更新で同時に実行するツール呼び出しの上限
+PREFETCH_CONCURRENCY = int(os.environ.get('GH_PROXY_PREFETCH_CONCURRENCY', '2'))
+# バックグラウンド更新の1分あたりの呼び出し回数の上限
+PREFETCH_CALLS_PER_MINUTE = int(os.environ.get('GH_PROXY_PREFETCH_CALLS_PER_MINUTE', '30'))
+# 更新対象を確認する間隔（秒）
+PREFETCH_INTERVAL = float(os.environ.get('GH_PROXY_PREFETCH_INTERVAL', '5'))
+
+# 複数リポジトリのツール（gh_multi_pr_list など）で同時に問い合わせるリポジトリ数の上限
+MULTI_CONCURRENCY = int(os.environ.get('GH_PROXY_MULTI_CONCURRENCY', '8'))
+
+# gh_pr_diff の1ページの最大サイズ（バイト）
+DIFF_PAGE_BYTES = int(os.environ.get('GH_PROXY_DIFF_PAGE_BYTES', '65536'))
+# 取得した差分を一時ファイルとして再利用する期間（秒）
+DIFF_TTL = int(os.environ.get('GH_PROXY_DIFF_TTL', '600'))
+# 一時ファイルとして保持する差分の合計サイズの上限（バイト）
+DIFF_MAX_BYTES = int(os.environ.get('GH_PROXY_DIFF_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# ローカル全文検索インデックスに取り込むリポジトリ（owner/repo のカンマ区切り、未指定の場合は無効）
+INDEX_REPOS = [repo.strip().lower() for repo in os.environ.get('GH_PROXY_INDEX_REPOS', '').split(',') if repo.strip()]
+# インデックス（SQLite）のパス。未指定の場合はメモリ上に保持する（起動のたびに全件を取り込む）
+INDEX_PATH = os.environ.get('GH_PROXY_INDEX', '')
+# インデックスを同期する間隔（秒）。前回の同期以降に更新されたものだけを取得する
+INDEX_INTERVAL = float(os.environ.get('GH_PROXY_INDEX_INTERVAL', '60'))
+# 全文検索のトークナイザー: unicode61（単語単位）または trigram（3文字単位の部分一致、日本語向け）
+INDEX_TOKENIZER = os.environ.get('GH_PROXY_INDEX_TOKENIZER', 'unicode61')
+
+# ツールごとのキャッシュ有効期間（秒）
+# GH_PROXY_CACHE_TTLS="gh_pr_list=10,gh_repo_view=300" の形式で上書きできる
+CACHE_TTLS = {
+    "gh_repo_view": 600,
+    "gh_pr_list": 30,
+    "gh_issue_list": 30,
+    "gh_pr_view": 60,
+    "gh_issue_view": 60,
+    "gh_pr_comments": 60,
+    "gh_issue_comments": 60,
+    "gh_pr_bundle": 60,
+    "gh_issue_bundle": 60,
+    "gh_pr_bundle_multi": 60,
+    "gh_pr_list_page": 30,
+    "gh_issue_list_page": 30,
+}
+for _item in os.environ.get('GH_PROXY_CACHE_TTLS', '').split(','):
+    if '=' in _item:
+        _name, _ttl = _item.split('=', 1)
+        CACHE_TTLS[_name.strip()] = int(_ttl)
+
 # JSON-RPCエラーコード
 PARSE_ERROR = -32700
 INVALID_REQUEST = -32600
@@ -31,6 +170,49 @@ METHOD_NOT_FOUND = -32601
 INVALID_PARAMS = -32602
 INTERNAL_ERROR = -32603
 
+# 各ツールで gh --json に指定するフィールド（fields 引数を省略した場合）
+REPO_VIEW_JSON_FIELDS = "name,owner,description,url,stargazerCount,forkCount,createdAt,updatedAt"
+LIST_JSON_FIELDS = "number,title,state,author,createdAt,updatedAt"
+PR_VIEW_JSON_FIELDS = "number,title,body,state,author,createdAt,updatedAt,mergeable,mergedAt"
+ISSUE_VIEW_JSON_FIELDS = "number,title,body,state,author,createdAt,updatedAt"
+
+
+def fields_property(json_fields: str) -> Dict[str, Any]:
+    """fields 引数のスキーマ（指定できるのは json_fields に含まれるフィールドのみ）"""
+    names = "|".join(json_fields.split(","))
+    return {
+        "type": "string",
+        "description": f"取得するフィールドのカンマ区切りリスト（省略時: {json_fields}）",
+        "pattern": f"^(?:{names})(?:,(?:{names}))*$"
+    }
+
+
+# 複数リポジトリのツールの対象リポジトリ（owner/repo 形式）の引数スキーマ
+REPOSITORIES_PROPERTY = {
+    "type": "array",
+    "description": "対象リポジトリ（owner/repo 形式）のリスト",
+    "items": {
+        "type": "string",
+        "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*/[a-zA-Z0-9._-]+$"
+    },
+    "minItems": 1,
+    "maxItems": 100
+}
+
+# 複数リポジトリのツールの並べ替え順の引数スキーマ
+MULTI_SORT_PROPERTY = {
+    "type": "string",
+    "description": "並べ替え順（updated: 更新日時の新しい順、created: 作成日時の新しい順、repository: 指定したリポジトリ順。省略時: updated）",
+    "enum": ["updated", "created", "repository"]
+}
+
+# 本文の切り詰め（max_body_length）の引数スキーマ
+MAX_BODY_LENGTH_PROPERTY = {
+    "type": "integer",
+    "description": "本文（body）をこの文字数で切り詰めます（PR・Issue・コメントの本文が対象）",
+    "minimum": 1
+}
+
 # ツール定義
 TOOLS = [
     {
@@ -48,6 +230,11 @@ TOOLS = [
                     "type": "string",
                     "description": "リポジトリ名",
                     "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "fields": fields_property(REPO_VIEW_JSON_FIELDS),
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
                 }
             },
             "required": ["owner", "repository_name"]
@@ -83,6 +270,11 @@ TOOLS = [
                 "search": {
                     "type": "string",
                     "description": "検索クエリ（例: created:>2024-01-01, updated:<2024-06-01）"
+                },
+                "fields": fields_property(LIST_JSON_FIELDS),
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
                 }
             },
             "required": ["owner", "repository_name"]
@@ -108,6 +300,12 @@ TOOLS = [
                     "type": "integer",
                     "description": "PR番号",
                     "minimum": 1
+                },
+                "fields": fields_property(PR_VIEW_JSON_FIELDS),
+                "max_body_length": MAX_BODY_LENGTH_PROPERTY,
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
                 }
             },
             "required": ["owner", "repository_name", "number"]
@@ -143,6 +341,11 @@ TOOLS = [
                 "search": {
                     "type": "string",
                     "description": "検索クエリ（例: created:>2024-01-01, updated:<2024-06-01）"
+                },
+                "fields": fields_property(LIST_JSON_FIELDS),
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
                 }
             },
             "required": ["owner", "repository_name"]
@@ -168,6 +371,12 @@ TOOLS = [
                     "type": "integer",
                     "description": "Issue番号",
                     "minimum": 1
+                },
+                "fields": fields_property(ISSUE_VIEW_JSON_FIELDS),
+                "max_body_length": MAX_BODY_LENGTH_PROPERTY,
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
                 }
             },
             "required": ["owner", "repository_name", "number"]
@@ -193,6 +402,11 @@ TOOLS = [
                     "type": "integer",
                     "description": "PR番号",
                     "minimum": 1
+                },
+                "max_body_length": MAX_BODY_LENGTH_PROPERTY,
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
                 }
             },
             "required": ["owner", "repository_name", "number"]
@@ -218,30 +432,431 @@ TOOLS = [
                     "type": "integer",
                     "description": "Issue番号",
                     "minimum": 1
+                },
+                "max_body_length": MAX_BODY_LENGTH_PROPERTY,
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["owner", "repository_name", "number"]
+        }
+    },
+    {
+        "name": "gh_pr_bundle",
+        "description": "指定されたPull Requestの詳細情報とコメント（任意でレビュースレッド・変更ファイル一覧）を1回の問い合わせで取得します",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "number": {
+                    "type": "integer",
+                    "description": "PR番号",
+                    "minimum": 1
+                },
+                "include_review_threads": {
+                    "type": "boolean",
+                    "description": "true の場合レビュースレッドを含めます"
+                },
+                "include_files": {
+                    "type": "boolean",
+                    "description": "true の場合変更ファイル一覧を含めます"
+                },
+                "max_body_length": MAX_BODY_LENGTH_PROPERTY,
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["owner", "repository_name", "number"]
+        }
+    },
+    {
+        "name": "gh_issue_bundle",
+        "description": "指定されたIssueの詳細情報とコメントを1回の問い合わせで取得します",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "number": {
+                    "type": "integer",
+                    "description": "Issue番号",
+                    "minimum": 1
+                },
+                "max_body_length": MAX_BODY_LENGTH_PROPERTY,
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["owner", "repository_name", "number"]
+        }
+    },
+    {
+        "name": "gh_pr_bundle_multi",
+        "description": "複数のPull Requestの詳細情報とコメントを1回の問い合わせでまとめて取得します",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "numbers": {
+                    "type": "array",
+                    "description": "PR番号のリスト",
+                    "items": {
+                        "type": "integer",
+                        "minimum": 1
+                    },
+                    "minItems": 1,
+                    "maxItems": 20
+                },
+                "include_review_threads": {
+                    "type": "boolean",
+                    "description": "true の場合レビュースレッドを含めます"
+                },
+                "include_files": {
+                    "type": "boolean",
+                    "description": "true の場合変更ファイル一覧を含めます"
+                },
+                "max_body_length": MAX_BODY_LENGTH_PROPERTY,
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["owner", "repository_name", "numbers"]
+        }
+    },
+    {
+        "name": "gh_pr_list_page",
+        "description": "指定されたリポジトリのPull Request一覧をページ単位で取得します。結果の nextCursor を cursor に指定すると続きを取得できます",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "state": {
+                    "type": "string",
+                    "description": "PRの状態",
+                    "enum": ["open", "closed", "merged", "all"]
+                },
+                "search": {
+                    "type": "string",
+                    "description": "検索クエリ（例: created:>2024-01-01, updated:<2024-06-01）"
+                },
+                "page_size": {
+                    "type": "integer",
+                    "description": "1ページの件数",
+                    "minimum": 1,
+                    "maximum": 100
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "前回の結果の nextCursor"
+                },
+                "max_items": {
+                    "type": "integer",
+                    "description": "指定した場合、この件数に達するまで続くページを取得します",
+                    "minimum": 1,
+                    "maximum": 10000
+                },
+                "fields": fields_property(LIST_JSON_FIELDS),
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["owner", "repository_name"]
+        }
+    },
+    {
+        "name": "gh_issue_list_page",
+        "description": "指定されたリポジトリのIssue一覧をページ単位で取得します。結果の nextCursor を cursor に指定すると続きを取得できます",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "state": {
+                    "type": "string",
+                    "description": "Issueの状態",
+                    "enum": ["open", "closed", "all"]
+                },
+                "search": {
+                    "type": "string",
+                    "description": "検索クエリ（例: created:>2024-01-01, updated:<2024-06-01）"
+                },
+                "page_size": {
+                    "type": "integer",
+                    "description": "1ページの件数",
+                    "minimum": 1,
+                    "maximum": 100
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "前回の結果の nextCursor"
+                },
+                "max_items": {
+                    "type": "integer",
+                    "description": "指定した場合、この件数に達するまで続くページを取得します",
+                    "minimum": 1,
+                    "maximum": 10000
+                },
+                "fields": fields_property(LIST_JSON_FIELDS),
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["owner", "repository_name"]
+        }
+    },
+    {
+        "name": "gh_pr_diff",
+        "description": "指定されたPull Requestの差分をページ単位で取得します。最初の要素に変更ファイルごとの追加・削除行数の一覧、続く要素に差分を返します。2ページ目以降やファイル指定の取得では gh を再実行しません",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "number": {
+                    "type": "integer",
+                    "description": "PR番号",
+                    "minimum": 1
+                },
+                "path": {
+                    "type": "string",
+                    "description": "指定した場合、このファイルの差分のみを取得します"
+                },
+                "page": {
+                    "type": "integer",
+                    "description": "取得するページ（省略時: 1）",
+                    "minimum": 1
+                },
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合保持している差分を使わずに gh を再実行します"
                 }
             },
             "required": ["owner", "repository_name", "number"]
         }
+    },
+    {
+        "name": "gh_multi_pr_list",
+        "description": "複数のリポジトリのPull Request一覧を並行して取得し、まとめて並べ替えて返します。取得に失敗したリポジトリは errors に記録します",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "repositories": REPOSITORIES_PROPERTY,
+                "state": {
+                    "type": "string",
+                    "description": "PRの状態",
+                    "enum": ["open", "closed", "merged", "all"]
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "リポジトリごとに取得する最大件数",
+                    "minimum": 1,
+                    "maximum": 100
+                },
+                "search": {
+                    "type": "string",
+                    "description": "検索クエリ（例: created:>2024-01-01, updated:<2024-06-01）"
+                },
+                "sort": MULTI_SORT_PROPERTY,
+                "fields": fields_property(LIST_JSON_FIELDS),
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["repositories"]
+        }
+    },
+    {
+        "name": "gh_multi_issue_list",
+        "description": "複数のリポジトリのIssue一覧を並行して取得し、まとめて並べ替えて返します。取得に失敗したリポジトリは errors に記録します",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "repositories": REPOSITORIES_PROPERTY,
+                "state": {
+                    "type": "string",
+                    "description": "Issueの状態",
+                    "enum": ["open", "closed", "all"]
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "リポジトリごとに取得する最大件数",
+                    "minimum": 1,
+                    "maximum": 100
+                },
+                "search": {
+                    "type": "string",
+                    "description": "検索クエリ（例: created:>2024-01-01, updated:<2024-06-01）"
+                },
+                "sort": MULTI_SORT_PROPERTY,
+                "fields": fields_property(LIST_JSON_FIELDS),
+                "refresh": {
+                    "type": "boolean",
+                    "description": "true の場合キャッシュを使わずに最新の情報を取得します"
+                }
+            },
+            "required": ["repositories"]
+        }
     }
 ]
 
-
-class ValidationError(Exception):
-    """引数バリデーションエラー"""
-    pass
-
-
-class ToolExecutionError(Exception):
-    """ツール実行エラー"""
-    pass
-
-
-def validate_string_pattern(value: str, pattern: str, field_name: str) -> None:
-    """文字列が指定されたパターンに一致するか検証"""
-    if not re.match(pattern, value):
-        raise ValidationError(
-            f"{field_name} が無効な形式です: {value}"
-        )
+# ローカルインデックスを使用するツール（GH_PROXY_INDEX_REPOS を指定した場合のみ公開する）
+LOCAL_INDEX_TOOLS = [
+    {
+        "name": "gh_search_local",
+        "description": "ローカルの全文検索インデックスから、タイトル・本文・ラベル・コメントにキーワードを含むPull Request / Issueを関連度順に検索します（GitHub API を呼び出しません）",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "query": {
+                    "type": "string",
+                    "description": "検索キーワード（空白区切りで指定したすべての語を含むものを検索します）"
+                },
+                "kind": {
+                    "type": "string",
+                    "description": "検索対象（省略時: all）",
+                    "enum": ["pr", "issue", "all"]
+                },
+                "state": {
+                    "type": "string",
+                    "description": "状態（省略時: all）",
+                    "enum": ["open", "closed", "merged", "all"]
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "取得する最大件数（省略時: 20）",
+                    "minimum": 1,
+                    "maximum": 100
+                }
+            },
+            "required": ["owner", "repository_name", "query"]
+        }
+    },
+    {
+        "name": "gh_changes_since",
+        "description": "ローカルインデックスから、前回の呼び出し以降に作成・更新されたPull Request / Issueを変更順に取得します。結果の cursor を次回の cursor に指定してください（GitHub API を呼び出しません）",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "owner": {
+                    "type": "string",
+                    "description": "リポジトリのオーナー名",
+                    "pattern": "^[a-zA-Z0-9][a-zA-Z0-9-]*$"
+                },
+                "repository_name": {
+                    "type": "string",
+                    "description": "リポジトリ名",
+                    "pattern": "^[a-zA-Z0-9._-]+$"
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "前回の結果の cursor（省略時はインデックスのすべての PR / Issue が対象）"
+                },
+                "since": {
+                    "type": "string",
+                    "description": "cursor を省略した場合に、この日時以降に更新されたものに絞り込みます（例: 2024-06-01, 2024-06-01T09:00:00Z）",
+                    "pattern": "^[0-9]{4}-[0-9]{2}-[0-9]{2}(?:T[0-9]{2}:[0-9]{2}:[0-9]{2}Z)?$"
+                },
+                "kind": {
+                    "type": "string",
+                    "description": "対象（省略時: all）",
+                    "enum": ["pr", "issue", "all"]
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "取得する最大件数（省略時: 100）",
+                    "minimum": 1,
+                    "maximum": 1000
+                }
+            },
+            "required": ["owner", "repository_name"]
+        }
+    }
+]
+if INDEX_REPOS:
+    TOOLS.extend(LOCAL_INDEX_TOOLS)
+
+
+class ValidationError(Exception):
+    """引数バリデーションエラー"""
+    pass
+
+
+class ToolExecutionError(Exception):
+    """ツール実行エラー"""
+    pass
+
+
+def is_integer(value: Any) -> bool:
+    """JSON の整数かどうか（bool は int のサブクラスだが整数として扱わない）"""
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
 def validate_integer_range(value: int, minimum: Optional[int], maximum: Optional[int], field_name: str) -> None:
@@ -256,66 +871,1023 @@ def validate_integer_range(value: int, minimum: Optional[int], maximum: Optional
         )
 
 
-def validate_enum(value: str, enum_values: List[str], field_name: str) -> None:
-    """文字列が指定された列挙値のいずれかに一致するか検証"""
-    if value not in enum_values:
-        raise ValidationError(
-            f"{field_name} は {', '.join(enum_values)} のいずれかである必要があります: {value}"
-        )
+def validate_array(value: Any, prop: Dict[str, Any], field_name: str,
+                   item_pattern: Optional["re.Pattern[str]"] = None) -> None:
+    """配列の要素数と各要素（整数・文字列に対応）を検証（item_pattern は事前にコンパイルした要素のパターン）"""
+    if not isinstance(value, list):
+        raise ValidationError(f"{field_name} は配列である必要があります")
+    if "minItems" in prop and len(value) < prop["minItems"]:
+        raise ValidationError(f"{field_name} は {prop['minItems']} 件以上である必要があります")
+    if "maxItems" in prop and len(value) > prop["maxItems"]:
+        raise ValidationError(f"{field_name} は {prop['maxItems']} 件以下である必要があります")
+    items = prop.get("items", {})
+    for index, item in enumerate(value):
+        item_name = f"{field_name}[{index}]"
+        if items.get("type") == "integer":
+            if not is_integer(item):
+                raise ValidationError(f"{item_name} は整数である必要があります")
+            validate_integer_range(item, items.get("minimum"), items.get("maximum"), item_name)
+        elif items.get("type") == "string":
+            if not isinstance(item, str):
+                raise ValidationError(f"{item_name} は文字列である必要があります")
+            if item_pattern is not None and not item_pattern.match(item):
+                raise ValidationError(f"{item_name} が無効な形式です: {item}")
+
+
+def compile_property_validator(field: str, prop: Dict[str, Any]) -> Callable[[Any], None]:
+    """
+    1つのプロパティ定義を検証関数にコンパイル
+
+    型ごとに専用のクロージャを生成し、正規表現と列挙値は事前にコンパイルしておく。
+    """
+    prop_type = prop.get("type")
+
+    if prop_type == "string":
+        pattern = re.compile(prop["pattern"]) if "pattern" in prop else None
+        enum_values = frozenset(prop["enum"]) if "enum" in prop else None
+        enum_text = ", ".join(prop.get("enum", []))
+
+        def validate_string(value: Any) -> None:
+            if not isinstance(value, str):
+                raise ValidationError(f"{field} は文字列である必要があります")
+            if pattern is not None and not pattern.match(value):
+                raise ValidationError(f"{field} が無効な形式です: {value}")
+            if enum_values is not None and value not in enum_values:
+                raise ValidationError(f"{field} は {enum_text} のいずれかである必要があります: {value}")
+        return validate_string
+
+    if prop_type == "integer":
+        minimum = prop.get("minimum")
+        maximum = prop.get("maximum")
+
+        def validate_integer(value: Any) -> None:
+            if not is_integer(value):
+                raise ValidationError(f"{field} は整数である必要があります")
+            validate_integer_range(value, minimum, maximum, field)
+        return validate_integer
+
+    if prop_type == "boolean":
+        def validate_boolean(value: Any) -> None:
+            if not isinstance(value, bool):
+                raise ValidationError(f"{field} は真偽値である必要があります")
+        return validate_boolean
+
+    if prop_type == "array":
+        items = prop.get("items", {})
+        item_pattern = re.compile(items["pattern"]) if "pattern" in items else None
+
+        def validate_items(value: Any) -> None:
+            validate_array(value, prop, field, item_pattern)
+        return validate_items
+
+    return lambda value: None
+
+
+def compile_validator(schema: Dict[str, Any]) -> Callable[[Dict[str, Any]], None]:
+    """inputSchema を引数全体の検証関数にコンパイル"""
+    validators = {
+        field: compile_property_validator(field, prop)
+        for field, prop in schema.get("properties", {}).items()
+    }
+    required = tuple(schema.get("required", []))
+
+    def validate(arguments: Dict[str, Any]) -> None:
+        # 必須フィールドの確認
+        for field in required:
+            if field not in arguments:
+                raise ValidationError(f"必須フィールドが不足しています: {field}")
+
+        # 各フィールドの検証
+        for field, value in arguments.items():
+            validator = validators.get(field)
+            if validator is None:
+                raise ValidationError(f"未知のフィールド: {field}")
+            validator(value)
+
+    return validate
 
 
 def validate_arguments(tool_name: str, arguments: Dict[str, Any]) -> None:
     """ツール引数を検証"""
-    # ツール定義を取得
-    tool_def = next((t for t in TOOLS if t["name"] == tool_name), None)
-    if not tool_def:
+    tool = TOOL_REGISTRY.get(tool_name)
+    if tool is None:
         raise ValidationError(f"未知のツール: {tool_name}")
+    tool.validate(arguments)
+
+
+class Metrics:
+    """
+    Prometheus のテキスト形式（0.0.4）で公開するメトリクス
+
+    define で登録したカウンター・ゲージ・ヒストグラムの値をラベルの組ごとに保持する。
+    ゲージの増減には inc、値の設定には set を使う。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> (種類, 説明, ヒストグラムのバケット境界)
+        self.definitions: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        # name -> {ラベルの組: 値（ヒストグラムは [バケットごとの件数, 合計, 件数]）}
+        self.values: Dict[str, Dict[Tuple[Tuple[str, str], ...], Any]] = {}
+
+    def define(self, name: str, metric_type: str, help_text: str, buckets: Tuple[float, ...] = ()) -> None:
+        self.definitions[name] = (metric_type, help_text, buckets)
+        self.values[name] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """カウンター・ゲージに値を加算"""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """ゲージの値を設定"""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """ヒストグラムに観測値を記録"""
+        buckets = self.definitions[name][2]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            state = self.values[name].get(key)
+            if state is None:
+                state = self.values[name][key] = [[0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def _format_labels(key: Tuple[Tuple[str, str], ...]) -> str:
+        if not key:
+            return ""
+        pairs = []
+        for name, value in key:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{name}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+
+    def render(self) -> str:
+        """テキスト形式で出力"""
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text, buckets) in self.definitions.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in sorted(self.values[name].items()):
+                    if metric_type != "histogram":
+                        lines.append(f"{name}{self._format_labels(key)} {value:g}")
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{self._format_labels(key + (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {total:g}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# グローバルメトリクス
+metrics = Metrics()
+metrics.define("gh_proxy_requests_total", "counter", "JSON-RPC requests by method")
+metrics.define("gh_proxy_tool_calls_total", "counter", "tools/call requests by tool")
+metrics.define("gh_proxy_tool_errors_total", "counter",
+               "Failed tool calls by tool and type (validation, execution, cancelled, internal)")
+metrics.define("gh_proxy_phase_seconds", "histogram",
+               "Time spent per tool in each phase (validation, execution, subprocess, api, serialization)",
+               LATENCY_BUCKETS)
+metrics.define("gh_proxy_response_bytes", "histogram", "Response body size as sent", SIZE_BUCKETS)
+metrics.define("gh_proxy_gh_in_flight", "gauge", "gh processes currently running")
+metrics.define("gh_proxy_timeouts_total", "counter", "Timed out gh processes and GitHub API requests by tool")
+metrics.define("gh_proxy_queue_wait_seconds", "histogram",
+               "Time spent waiting in the scheduler before a gh process or API request starts", LATENCY_BUCKETS)
+metrics.define("gh_proxy_rate_limited_total", "counter", "Calls that hit a GitHub rate limit")
+metrics.define("gh_proxy_rate_limit_remaining", "gauge", "Last known remaining GitHub API quota")
+metrics.define("gh_proxy_cancelled_requests_total", "counter",
+               "Requests cancelled by notifications/cancelled or client disconnect, by reason")
+metrics.define("gh_proxy_cancelled_calls_total", "counter",
+               "gh processes and GitHub API requests abandoned due to cancellation, by tool and stage (queued or running)")
+metrics.inc("gh_proxy_gh_in_flight", 0)
+
+# 現在のスレッドで処理しているリクエストの情報
+# tool: ツール名（gh プロセスなどのメトリクスのラベルとスケジューラーの優先度に使う）
+# priority: スケジューラーの優先度の明示的な指定（バックグラウンド更新など）
+# queue_wait / scheduled: スケジューラーでの待ち時間の合計と、スケジューラーを経由した呼び出しの有無
+# trace: スパンを記録するトレース（Tracer）
+_request_context = threading.local()
+
+
+def current_tool() -> str:
+    """現在のスレッドで処理しているツール名"""
+    return getattr(_request_context, "tool", "")
+
+
+class RequestCancelledError(ToolExecutionError):
+    """リクエストがキャンセルされた（notifications/cancelled またはクライアントの切断）"""
+
+    def __init__(self):
+        super().__init__("リクエストはキャンセルされました")
+
+
+class CancelToken:
+    """
+    リクエストのキャンセル通知
+
+    cancel() を呼び出すと登録済みのコールバック（gh のプロセスグループの強制終了など）を実行する。
+    キャンセル後に登録したコールバックは直ちに実行する。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.callbacks: Dict[int, Callable[[], None]] = {}
+        self.keys = itertools.count()
+
+    def cancel(self) -> bool:
+        """キャンセルし、初めてキャンセルした場合は True を返す"""
+        with self.lock:
+            if self.cancelled:
+                return False
+            self.cancelled = True
+            callbacks = list(self.callbacks.values())
+            self.callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"cancel callback failed: {e}", file=sys.stderr)
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """キャンセル時に実行するコールバックを登録し、登録を解除する関数を返す"""
+        with self.lock:
+            if not self.cancelled:
+                key = next(self.keys)
+                self.callbacks[key] = callback
+                return lambda: self._remove(key)
+        callback()
+        return lambda: None
+
+    def _remove(self, key: int) -> None:
+        with self.lock:
+            self.callbacks.pop(key, None)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    """現在のスレッドで処理しているリクエストのキャンセル通知（リクエスト外の呼び出しでは None）"""
+    return getattr(_request_context, "cancel", None)
+
+
+@contextlib.contextmanager
+def on_cancel(callback: Callable[[], None]) -> Iterator[None]:
+    """with ブロックの実行中に現在のリクエストがキャンセルされた場合に callback を実行"""
+    token = current_cancel_token()
+    remove = token.add_callback(callback) if token is not None else None
+    try:
+        yield
+    finally:
+        if remove is not None:
+            remove()
+
 
-    schema = tool_def["inputSchema"]
-    properties = schema.get("properties", {})
-    required = schema.get("required", [])
-
-    # 必須フィールドの確認
-    for field in required:
-        if field not in arguments:
-            raise ValidationError(f"必須フィールドが不足しています: {field}")
-
-    # 各フィールドの検証
-    for field, value in arguments.items():
-        if field not in properties:
-            raise ValidationError(f"未知のフィールド: {field}")
-
-        prop = properties[field]
-        prop_type = prop.get("type")
-
-        # 型チェック
-        if prop_type == "string" and not isinstance(value, str):
-            raise ValidationError(f"{field} は文字列である必要があります")
-        elif prop_type == "integer" and not isinstance(value, int):
-            raise ValidationError(f"{field} は整数である必要があります")
-
-        # パターン検証
-        if "pattern" in prop and isinstance(value, str):
-            validate_string_pattern(value, prop["pattern"], field)
-
-        # 列挙値検証
-        if "enum" in prop and isinstance(value, str):
-            validate_enum(value, prop["enum"], field)
-
-        # 整数範囲検証
-        if prop_type == "integer":
-            validate_integer_range(
-                value,
-                prop.get("minimum"),
-                prop.get("maximum"),
-                field
+def raise_if_cancelled(stage: str) -> None:
+    """現在のリクエストがキャンセルされていれば、メトリクスに記録して RequestCancelledError を送出"""
+    token = current_cancel_token()
+    if token is not None and token.cancelled:
+        metrics.inc("gh_proxy_cancelled_calls_total", tool=current_tool(), stage=stage)
+        raise RequestCancelledError()
+
+
+class Trace:
+    """1件の HTTP リクエストのトレース（開始からのオフセットと所要時間を記録したスパンの一覧）"""
+
+    __slots__ = ("id", "name", "path", "started_at", "origin", "duration", "attributes", "spans")
+
+    def __init__(self, trace_id: int, name: str, path: str):
+        self.id = trace_id
+        self.name = name
+        self.path = path
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes: Dict[str, Any] = {}
+        self.spans: List[Tuple[str, float, float, Dict[str, Any]]] = []
+
+    def add_span(self, name: str, started: float, ended: float, attributes: Dict[str, Any]) -> None:
+        # gh_multi_* やバッチリクエストでは複数のスレッドから記録する（list.append はスレッドセーフ）
+        self.spans.append((name, started - self.origin, ended - started, attributes))
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = []
+        for name, offset, duration, attributes in sorted(self.spans, key=lambda span: span[1]):
+            spans.append(dict({"name": name, "startMs": round(offset * 1000, 3),
+                               "durationMs": round(duration * 1000, 3)}, **attributes))
+        return {
+            "id": self.id,
+            "name": self.name,
+            "path": self.path,
+            "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started_at)),
+            "durationMs": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "spans": spans,
+        }
+
+
+class Tracer:
+    """
+    リクエストごとのスパンのトレース
+
+    HTTP リクエスト1件を1つのトレースとし、処理中のスレッドの _request_context.trace に設定する。
+    span() で囲んだ区間を現在のトレースに記録し、完了したトレースは直近 size 件をリングバッファに保持する。
+    size が 0 の場合はトレースを作成しない（span() は何も記録しない）。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = threading.Lock()
+        self.traces: "collections.deque[Trace]" = collections.deque(maxlen=max(size, 1))
+        self.ids = itertools.count(1)
+        self.recorded = 0
+
+    def begin(self, name: str, path: str = "") -> Optional[Trace]:
+        """トレースを作成（記録が無効な場合は None）"""
+        if self.size <= 0:
+            return None
+        return Trace(next(self.ids), name, path)
+
+    def finish(self, trace: Trace) -> None:
+        """トレースを完了してリングバッファに追加"""
+        trace.duration = time.perf_counter() - trace.origin
+        with self.lock:
+            self.traces.append(trace)
+            self.recorded += 1
+
+    def follow(self, chunks: Iterator[bytes], trace: Trace) -> Iterator[bytes]:
+        """
+        ストリーミング応答の送出が終わるまでトレースを続ける
+
+        チャンクの生成は next() を呼んだスレッドで実行されるため、再開のたびにトレースを設定し直す。
+        """
+        try:
+            iterator = iter(chunks)
+            while True:
+                _request_context.trace = trace
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _request_context.trace = None
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self.finish(trace)
+
+    def recent(self, limit: int, min_ms: float = 0.0, name: str = "") -> List[Dict[str, Any]]:
+        """新しい順に最大 limit 件のトレース（min_ms 未満のものと name が一致しないものは除く）"""
+        with self.lock:
+            traces = list(self.traces)
+        result = []
+        for trace in reversed(traces):
+            if trace.duration * 1000 < min_ms or (name and trace.name != name):
+                continue
+            result.append(trace.to_dict())
+            if len(result) >= limit:
+                break
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"size": self.size, "buffered": len(self.traces) if self.size > 0 else 0, "recorded": self.recorded}
+
+
+tracer = Tracer(TRACE_BUFFER)
+
+
+def current_trace() -> Optional[Trace]:
+    """現在のスレッドで処理しているリクエストのトレース（トレース外では None）"""
+    return getattr(_request_context, "trace", None)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    with ブロックの実行を現在のトレースのスパンとして記録（トレース外では何もしない）
+
+    yield する辞書に追加した値はスパンの属性として記録する。例外で抜けた場合は例外の型を error に記録する。
+    """
+    trace = current_trace()
+    if trace is None:
+        yield attributes
+        return
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        trace.add_span(name, started, time.perf_counter(), attributes)
+
+
+def annotate_trace(**attributes: Any) -> None:
+    """現在のトレース全体の属性を追加（キャッシュの参照結果など）"""
+    trace = current_trace()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+class InFlightRequests:
+    """
+    実行中の tools/call リクエストの JSON-RPC id ごとのキャンセル通知
+
+    id はクライアントごとに振られるため、Mcp-Session-Id ヘッダー（指定された場合）と組にして管理する。
+    各リクエストの通知は HTTP リクエスト単位の通知（クライアントの切断）にも連動する。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str], List[CancelToken]] = {}
+
+    @staticmethod
+    def make_key(session: str, request_id: Any) -> Tuple[str, str]:
+        # 1 と "1" を区別するため JSON 表現で比較する
+        return session, json.dumps(request_id)
+
+    @contextlib.contextmanager
+    def track(self, session: str, request_id: Any, connection: Optional[CancelToken]) -> Iterator[CancelToken]:
+        """with ブロックの間リクエストを登録し、そのキャンセル通知を返す（id のない通知は登録しない）"""
+        token = CancelToken()
+        detach = connection.add_callback(token.cancel) if connection is not None else None
+        key = self.make_key(session, request_id) if request_id is not None else None
+        if key is not None:
+            with self.lock:
+                self.requests.setdefault(key, []).append(token)
+        try:
+            yield token
+        finally:
+            if key is not None:
+                with self.lock:
+                    tokens = self.requests[key]
+                    tokens.remove(token)
+                    if not tokens:
+                        del self.requests[key]
+            if detach is not None:
+                detach()
+
+    def cancel(self, session: str, request_id: Any) -> int:
+        """id が一致する実行中のリクエストをキャンセルし、キャンセルした件数を返す"""
+        with self.lock:
+            tokens = list(self.requests.get(self.make_key(session, request_id), []))
+        return sum(1 for token in tokens if token.cancel())
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(len(tokens) for tokens in self.requests.values())
+
+
+# 実行中の tools/call リクエスト
+in_flight_requests = InFlightRequests()
+
+
+class RateLimitedError(ToolExecutionError):
+    """レート制限のため呼び出しを開始できない"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            f"GitHub のレート制限のため呼び出しを延期しています。{int(retry_after) + 1} 秒後に再試行してください"
+        )
+
+
+class GitHubScheduler:
+    """
+    gh コマンド・GitHub API の呼び出しのスケジューラー
+
+    呼び出しは優先度順（同じ優先度では到着順）に開始し、同時実行数・トークンバケットによる
+    平均レート・残りクォータを超えないように待機させる。
+    残りクォータは API のレスポンスヘッダーや gh api rate_limit から更新し、
+    予約分（reserve）を下回ると対話的な呼び出し以外はリセットまで待たせる。
+    レート制限で失敗した呼び出しは Retry-After（なければ指数バックオフ）の間すべての呼び出しを止めてから再試行する。
+    待ち時間が max_wait を超える場合は待たずに RateLimitedError を送出する。
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+    BACKGROUND = 2
+    PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+
+    # 一覧系のツール（対話的な呼び出しより後に実行する）
+    BULK_TOOLS = frozenset([
+        "gh_pr_list", "gh_issue_list", "gh_pr_list_page", "gh_issue_list_page", "gh_pr_bundle_multi"
+    ])
+
+    # Retry-After がない場合のバックオフ（秒）の初期値と上限
+    BACKOFF_INITIAL = 60.0
+    BACKOFF_MAX = 900.0
+
+    def __init__(self, max_concurrency: int, rate: float, burst: int, reserve: int,
+                 max_wait: float, retries: int):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.retries = retries
+        self.condition = threading.Condition()
+        self.waiting: List[Tuple[int, int]] = []
+        self.sequence = itertools.count()
+        self.running = 0
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        # バックオフ中はこの時刻（monotonic）まですべての呼び出しを止める
+        self.blocked_until = 0.0
+        self.consecutive_limited = 0
+        # 残りクォータ（不明な場合は None）とリセット時刻（UNIX 時刻）
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.quota_checked = 0.0
+        self.rate_limited = 0
+        self.rejected = 0
+
+    @classmethod
+    def priority_for(cls, tool_name: str) -> int:
+        """現在のリクエストの優先度"""
+        explicit = getattr(_request_context, "priority", None)
+        if explicit is not None:
+            return explicit
+        return cls.BULK if tool_name in cls.BULK_TOOLS else cls.INTERACTIVE
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def _start_delay(self, priority: int, now: float) -> Optional[float]:
+        """呼び出しを開始できるまでの秒数（0 は即時、None は実行中の呼び出しの終了待ち）"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.remaining is not None and self.reset_at is not None:
+            until_reset = self.reset_at - time.time()
+            if until_reset <= 0:
+                self.remaining = None
+            elif self.remaining <= 0 or (priority != self.INTERACTIVE and self.remaining <= self.reserve):
+                return until_reset
+        if self.running >= self.max_concurrency:
+            return None
+        if self.rate > 0 and self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0.0
+
+    def acquire(self, priority: int) -> float:
+        """
+        実行枠を確保し、待った秒数を返す
+
+        待機中に現在のリクエストがキャンセルされた場合は待ち行列から外して RequestCancelledError を送出する。
+        """
+        started = time.monotonic()
+        entry = (priority, next(self.sequence))
+        with on_cancel(self._wake), self.condition:
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    raise_if_cancelled("queued")
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._start_delay(priority, now) if self.waiting[0] == entry else None
+                    if delay == 0:
+                        break
+                    # 先頭以外の呼び出しにも max_wait を適用する
+                    timeout = started + self.max_wait - now
+                    if delay is not None and delay > timeout:
+                        self.rejected += 1
+                        raise RateLimitedError(delay)
+                    if timeout <= 0:
+                        self.rejected += 1
+                        raise RateLimitedError(self._start_delay(priority, now) or 1.0)
+                    self.condition.wait(timeout if delay is None else delay)
+            except BaseException:
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+                raise
+            heapq.heappop(self.waiting)
+            self.running += 1
+            if self.rate > 0:
+                self.tokens -= 1
+            if self.remaining is not None:
+                self.remaining -= 1
+            # 次の先頭の呼び出しが開始できるか確認させる
+            self.condition.notify_all()
+        waited = time.monotonic() - started
+        metrics.observe("gh_proxy_queue_wait_seconds", waited, priority=self.PRIORITY_NAMES[priority])
+        return waited
+
+    def release(self) -> None:
+        with self.condition:
+            self.running -= 1
+            self.condition.notify_all()
+
+    def _wake(self) -> None:
+        """待機中の呼び出しに状態を確認させる（キャンセル時）"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def update_quota(self, remaining: int, limit: Optional[int], reset_at: Optional[float]) -> None:
+        """残りクォータを更新"""
+        with self.condition:
+            self.remaining = remaining
+            self.limit = limit
+            self.reset_at = reset_at
+            self.quota_checked = time.monotonic()
+            self.condition.notify_all()
+        metrics.set("gh_proxy_rate_limit_remaining", remaining)
+
+    def backoff(self, retry_after: Optional[float]) -> None:
+        """レート制限に達したため retry_after 秒（不明な場合は指数バックオフ）呼び出しを止める"""
+        with self.condition:
+            if retry_after is None:
+                retry_after = min(self.BACKOFF_INITIAL * 2 ** self.consecutive_limited, self.BACKOFF_MAX)
+            self.consecutive_limited += 1
+            self.rate_limited += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        metrics.inc("gh_proxy_rate_limited_total")
+        print(f"GitHub のレート制限に達しました。{retry_after:.0f} 秒間呼び出しを停止します", file=sys.stderr)
+
+    def call(self, func: Callable[[], Any], retry_after_of: Callable[[Any], Tuple[bool, Optional[float]]]) -> Any:
+        """
+        スケジュールに従って func を実行
+
+        retry_after_of は結果からレート制限に達したかどうかと Retry-After の秒数を返す。
+        レート制限に達した場合はバックオフして retries 回まで再試行し、最後の結果を返す。
+        """
+        priority = self.priority_for(current_tool())
+        self.poll_quota()
+        result = None
+        for _ in range(self.retries + 1):
+            with span("queue", priority=self.PRIORITY_NAMES[priority]):
+                waited = self.acquire(priority)
+            _request_context.queue_wait = getattr(_request_context, "queue_wait", 0.0) + waited
+            _request_context.scheduled = True
+            try:
+                result = func()
+            finally:
+                self.release()
+            limited, retry_after = retry_after_of(result)
+            if not limited:
+                with self.condition:
+                    self.consecutive_limited = 0
+                return result
+            self.backoff(retry_after)
+        return result
+
+    def poll_quota(self) -> None:
+        """gh バックエンドでは一定間隔ごとにバックグラウンドで gh api rate_limit を実行して残りクォータを確認する"""
+        if BACKEND != "gh" or RATE_LIMIT_POLL <= 0:
+            return
+        with self.condition:
+            now = time.monotonic()
+            if now - self.quota_checked < RATE_LIMIT_POLL:
+                return
+            self.quota_checked = now
+        threading.Thread(target=self._poll_quota, name="gh-proxy-rate-limit", daemon=True).start()
+
+    def _poll_quota(self) -> None:
+        try:
+            stdout, _, code = _spawn_gh_command(["api", "rate_limit"], TIMEOUT)
+            if code != 0:
+                return
+            resources = json.loads(stdout)["resources"]
+            # gh は REST と GraphQL の両方を使うため、残りの少ない方を採用する
+            resource = min((resources[name] for name in ("core", "graphql") if name in resources),
+                           key=lambda r: r["remaining"])
+            self.update_quota(resource["remaining"], resource["limit"], resource["reset"])
+        except (ToolExecutionError, ValueError, KeyError, TypeError) as e:
+            print(f"rate_limit の取得に失敗しました: {e}", file=sys.stderr)
+
+    def quota_exhausted_for(self) -> Optional[float]:
+        """残りクォータが 0 の場合はリセットまでの秒数（リセット時刻が不明なら BACKOFF_INITIAL）、それ以外は None"""
+        with self.condition:
+            if self.remaining is None or self.remaining > 0:
+                return None
+            return max(0.0, self.reset_at - time.time()) if self.reset_at is not None else float(self.BACKOFF_INITIAL)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "waiting": len(self.waiting),
+                "running": self.running,
+                "tokens": round(self.tokens, 2),
+                "remaining": self.remaining,
+                "limit": self.limit,
+                "resetAt": self.reset_at,
+                "blockedFor": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+                "rateLimited": self.rate_limited,
+                "rejected": self.rejected,
+            }
+
+
+# レート制限を示す gh のエラーメッセージ
+RATE_LIMIT_PATTERN = re.compile(r"rate limit|abuse detection|submitted too quickly", re.IGNORECASE)
+
+
+def parse_rate_limit_headers(headers: Dict[str, str]) -> Optional[float]:
+    """X-RateLimit-* ヘッダー（小文字キー）でクォータを更新し、Retry-After の秒数を返す"""
+    if "x-ratelimit-remaining" in headers:
+        try:
+            gh_scheduler.update_quota(
+                int(headers["x-ratelimit-remaining"]),
+                int(headers["x-ratelimit-limit"]) if "x-ratelimit-limit" in headers else None,
+                float(headers["x-ratelimit-reset"]) if "x-ratelimit-reset" in headers else None
             )
+        except ValueError:
+            pass
+    try:
+        return float(headers["retry-after"]) if "retry-after" in headers else None
+    except ValueError:
+        return None
+
+
+def gh_retry_after(result: Tuple[str, str, int]) -> Tuple[bool, Optional[float]]:
+    """gh の実行結果がレート制限によるものか判定"""
+    stdout, stderr, code = result
+    retry_after = None
+    if stdout.startswith("HTTP/"):
+        # gh api -i の出力にはレスポンスヘッダーが含まれる
+        header_block = stdout.replace("\r\n", "\n").split("\n\n", 1)[0]
+        headers = {}
+        for line in header_block.split("\n")[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        retry_after = parse_rate_limit_headers(headers)
+    # メッセージだけでは他のリクエストに影響しないエラー（一部のリソースの制限など）と区別できないため、
+    # Retry-After があるか残りクォータが 0 の場合だけ全体をバックオフさせる
+    if code != 0 and RATE_LIMIT_PATTERN.search(stderr):
+        if retry_after is None:
+            retry_after = gh_scheduler.quota_exhausted_for()
+        if retry_after is not None:
+            return True, retry_after
+    return False, None
+
+
+def api_retry_after(result: Tuple[int, Dict[str, str], bytes]) -> Tuple[bool, Optional[float]]:
+    """GitHub API のレスポンスがレート制限によるものか判定"""
+    status, headers, _ = result
+    retry_after = parse_rate_limit_headers(headers)
+    if status in (403, 429):
+        if retry_after is None and headers.get("x-ratelimit-remaining") == "0":
+            retry_after = gh_scheduler.quota_exhausted_for()
+        if retry_after is not None:
+            return True, retry_after
+    return False, None
+
+
+# グローバルスケジューラー
+gh_scheduler = GitHubScheduler(MAX_CONCURRENCY, RATE / WORKER_SHARE, max(1, RATE_BURST // WORKER_SHARE),
+                               RATE_RESERVE, RATE_MAX_WAIT, RATE_RETRIES)
+
+
+class SingleFlight:
+    """
+    同一引数の gh 呼び出しの合流
+
+    実行中の呼び出しと同じ argv の呼び出しは新しいプロセスを起動せず、
+    先行する呼び出しの完了を待って同じ結果（または例外）を受け取る。
+
+    合流したリクエストの一部がキャンセルされても呼び出しは続け、参加しているリクエストが
+    すべてキャンセルされた場合にのみ呼び出し自体（gh プロセスなど）をキャンセルする。
+    """
+
+    class _Call:
+        def __init__(self, key: Tuple[str, ...]):
+            self.key = key
+            self.finished = False
+            self.result: Optional[Tuple[str, str, int]] = None
+            self.error: Optional[BaseException] = None
+            # 呼び出し自体のキャンセル通知と、キャンセルされていない参加リクエストの数
+            self.token = CancelToken()
+            self.participants = 0
+            self.waiters: List[threading.Event] = []
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[Tuple[str, ...], "SingleFlight._Call"] = {}
+        self.spawned = 0
+        self.coalesced = 0
+
+    def run(self, key: Tuple[str, ...], func) -> Tuple[str, str, int]:
+        """key が同じ実行中の呼び出しがあれば合流し、なければ func を実行"""
+        wake = threading.Event()
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._Call(key)
+                self.calls[key] = call
+                self.spawned += 1
+            else:
+                call.waiters.append(wake)
+                self.coalesced += 1
+            call.participants += 1
+
+        token = current_cancel_token()
+        with on_cancel(lambda: self._leave(call, wake)):
+            if not leader:
+                with span("coalesced"):
+                    wake.wait()
+                if not call.finished:
+                    raise RequestCancelledError()
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+            # func は参加リクエストではなく呼び出し自体のキャンセル通知のもとで実行する
+            _request_context.cancel = call.token
+            try:
+                call.result = func()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                _request_context.cancel = token
+                with self.lock:
+                    call.finished = True
+                    if self.calls.get(key) is call:
+                        del self.calls[key]
+                for waiter in call.waiters:
+                    waiter.set()
+
+    def _leave(self, call: "SingleFlight._Call", wake: threading.Event) -> None:
+        """参加リクエストのキャンセル（最後の参加リクエストの場合は呼び出し自体をキャンセル）"""
+        with self.lock:
+            call.participants -= 1
+            abandoned = call.participants == 0 and not call.finished
+            if abandoned and self.calls.get(call.key) is call:
+                # 以降の同じ呼び出しはキャンセルされた呼び出しに合流させない
+                del self.calls[call.key]
+        wake.set()
+        if abandoned:
+            call.token.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """起動したプロセス数と合流により省略したプロセス数"""
+        with self.lock:
+            return {
+                "spawned": self.spawned,
+                "coalesced": self.coalesced,
+                "inFlight": len(self.calls)
+            }
+
+
+# グローバル gh 呼び出し合流器
+gh_single_flight = SingleFlight()
+
+
+class Cassette:
+    """
+    gh の呼び出しを記録・再生するカセット
+
+    record モードでは gh の引数ごとに標準出力・標準エラー出力・終了コード・実行時間を、
+    tools/call ごとにツール名と引数を JSON Lines で追記する（.gz の場合は gzip 圧縮）。
+    ファイルは最初の記録の時点で開いてヘッダーを書き込む（起動に失敗した場合や何も記録しなかった場合は変更しない）。
+    replay モードでは起動時にファイル全体を読み込んで引数ごとに索引し、gh を起動せずに記録した結果を返す。
+    同じ引数が複数回記録されている場合は記録順に返し、最後まで返したら先頭に戻る。
+    gh auth token の出力は認証トークンを含むため記録しない。
+    """
+
+    VERSION = 1
+    # 記録しない gh の呼び出し
+    EXCLUDED = (["auth", "token"],)
+
+    def __init__(self, path: str, mode: str, replay_latency: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"GH_PROXY_CASSETTE_MODE は record または replay である必要があります: {mode}")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.lock = threading.Lock()
+        self.recorded = 0
+        self.hits = 0
+        self.misses = 0
+        # replay: 引数（JSON）-> [記録のリスト, 次に返す位置]
+        self.index: Dict[str, List[Any]] = {}
+        self.file = None
+        self.closed = False
+        if mode == "record":
+            atexit.register(self.close)
+        else:
+            with self._open("rt") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record.get("type") == "gh":
+                        self.index.setdefault(self.key(record["argv"]), [[], 0])[0].append(record)
+
+    def _open(self, mode: str) -> Any:
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode, encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    @staticmethod
+    def key(args: List[str]) -> str:
+        return json.dumps(args, ensure_ascii=False, separators=(",", ":"))
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.closed:
+                return
+            if self.file is None:
+                self.file = self._open("at")
+                header = {"type": "cassette", "version": self.VERSION,
+                          "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+                self.file.write(json.dumps(header, separators=(",", ":")) + "\n")
+            self.file.write(line)
+            self.file.flush()
+
+    def record_call(self, tool_name: str, arguments: Dict[str, Any]) -> None:
+        """tools/call のツール名と引数を記録（負荷試験での再送信用）"""
+        if self.mode == "record":
+            self._write({"type": "call", "tool": tool_name, "arguments": arguments})
+
+    def record_gh(self, args: List[str], result: Tuple[str, str, int], latency: float) -> None:
+        """gh の呼び出しの結果を記録"""
+        if self.mode != "record" or args[:2] in self.EXCLUDED:
+            return
+        stdout, stderr, code = result
+        self._write({"type": "gh", "argv": args, "stdout": stdout, "stderr": stderr,
+                     "code": code, "latency": round(latency, 4)})
+        with self.lock:
+            self.recorded += 1
+
+    def replay(self, args: List[str], stdout_path: Optional[str] = None) -> Tuple[str, str, int]:
+        """記録した結果を返す（記録がない場合は gh の失敗として返す）"""
+        with self.lock:
+            entry = self.index.get(self.key(args))
+            if entry is None:
+                self.misses += 1
+                return "", f"カセットに記録されていない gh の呼び出しです: gh {' '.join(args)}", 1
+            records, position = entry
+            record = records[position]
+            entry[1] = (position + 1) % len(records)
+            self.hits += 1
+
+        if self.replay_latency and record["latency"] > 0:
+            finished = threading.Event()
+            with on_cancel(finished.set):
+                finished.wait(record["latency"])
+            raise_if_cancelled("running")
+        stdout = record["stdout"]
+        if stdout_path:
+            with open(stdout_path, "w", encoding="utf-8") as f:
+                f.write(stdout)
+            stdout = ""
+        return stdout, record["stderr"], record["code"]
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats: Dict[str, Any] = {"path": self.path, "mode": self.mode}
+            if self.mode == "record":
+                stats["recorded"] = self.recorded
+            else:
+                stats.update({"calls": len(self.index), "hits": self.hits, "misses": self.misses})
+            return stats
+
+
+# gh の呼び出しのカセット（GH_PROXY_CASSETTE 指定時のみ）
+cassette: Optional[Cassette] = Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_LATENCY) if CASSETTE_PATH else None
 
 
 def execute_gh_command(args: List[str], timeout: int = None) -> Tuple[str, str, int]:
     """
     gh コマンドを安全に実行
 
+    同じ引数の呼び出しが実行中の場合はその結果を共有する。
+    gh プロセスはスケジューラー（gh_scheduler）の順番に従って起動する。
+
     Args:
         args: gh コマンドの引数リスト
         timeout: タイムアウト（秒）。Noneの場合はGH_PROXY_TIMEOUT環境変数またはデフォルト30秒を使用
@@ -325,159 +1897,2298 @@ def execute_gh_command(args: List[str], timeout: int = None) -> Tuple[str, str,
     """
     if timeout is None:
         timeout = TIMEOUT
+    return gh_single_flight.run(
+        tuple(args),
+        lambda: gh_scheduler.call(lambda: _spawn_gh_command(args, timeout), gh_retry_after)
+    )
+
+
+def kill_process_group(proc: Any) -> None:
+    """gh とその子プロセスをプロセスグループごと強制終了（終了済みの場合は何もしない）"""
+    if proc.returncode is not None:
+        return
     try:
-        result = subprocess.run(
-            ["gh"] + args,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            shell=False
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _spawn_gh_command(args: List[str], timeout: int, stdout_path: Optional[str] = None) -> Tuple[str, str, int]:
+    """
+    gh を実行（カセットの再生中は gh を起動せずに記録した結果を返し、記録中は結果を記録する）
+    """
+    if cassette is not None and cassette.replaying:
+        with span("cassette", command=" ".join(args[:2])):
+            return cassette.replay(args, stdout_path)
+    started = time.monotonic()
+    with span("subprocess", command=" ".join(args[:2])) as attributes:
+        result = _run_gh_process(args, timeout, stdout_path)
+        attributes["exitCode"] = result[2]
+    if cassette is not None:
+        stdout = result[0]
+        if stdout_path:
+            with open(stdout_path, "rb") as f:
+                stdout = f.read().decode("utf-8", "replace")
+        cassette.record_gh(args, (stdout, result[1], result[2]), time.monotonic() - started)
+    return result
+
+
+def _run_gh_process(args: List[str], timeout: int, stdout_path: Optional[str] = None) -> Tuple[str, str, int]:
+    """
+    gh プロセスを起動して実行
+
+    gh は新しいプロセスグループで起動し、タイムアウト時や現在のリクエストがキャンセルされた時は
+    gh が起動した子プロセスも含めて直ちに強制終了する。
+    stdout_path を指定した場合は標準出力をメモリに読み込まずにそのファイルへ書き出す（戻り値の stdout は空）。
+    """
+    # asyncモードではイベントループ上の asyncio サブプロセスとして実行する
+    if _gh_loop is not None:
+        future = asyncio.run_coroutine_threadsafe(
+            _execute_gh_command_async(args, timeout, current_tool(), stdout_path), _gh_loop
+        )
+        try:
+            with on_cancel(future.cancel):
+                return future.result()
+        except concurrent.futures.CancelledError:
+            raise RequestCancelledError()
+
+    raise_if_cancelled("queued")
+    tool_name = current_tool()
+    started = time.monotonic()
+    metrics.inc("gh_proxy_gh_in_flight")
+    try:
+        with contextlib.ExitStack() as stack:
+            output = stack.enter_context(open(stdout_path, "wb")) if stdout_path else subprocess.PIPE
+            proc = subprocess.Popen(
+                ["gh"] + args,
+                stdin=subprocess.DEVNULL,
+                stdout=output,
+                stderr=subprocess.PIPE,
+                text=True,
+                shell=False,
+                start_new_session=True
+            )
+            with on_cancel(lambda: kill_process_group(proc)):
+                try:
+                    stdout, stderr = proc.communicate(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    kill_process_group(proc)
+                    proc.communicate()
+                    metrics.inc("gh_proxy_timeouts_total", tool=tool_name, source="gh")
+                    raise ToolExecutionError(f"コマンド実行がタイムアウトしました（{timeout}秒）")
+        raise_if_cancelled("running")
+        return stdout or "", stderr, proc.returncode
+    except ToolExecutionError:
+        raise
+    except FileNotFoundError:
+        raise ToolExecutionError("gh コマンドが見つかりません。GitHub CLI をインストールしてください")
+    except Exception as e:
+        raise ToolExecutionError(f"コマンド実行中にエラーが発生しました: {str(e)}")
+    finally:
+        metrics.inc("gh_proxy_gh_in_flight", -1)
+        metrics.observe("gh_proxy_phase_seconds", time.monotonic() - started, tool=tool_name, phase="subprocess")
+
+
+# asyncモードで gh を実行するイベントループと同時実行数を制限するセマフォ
+_gh_loop: Optional[asyncio.AbstractEventLoop] = None
+_gh_semaphore: Optional[asyncio.Semaphore] = None
+
+
+async def _execute_gh_command_async(args: List[str], timeout: int, tool_name: str = "",
+                                    stdout_path: Optional[str] = None) -> Tuple[str, str, int]:
+    """
+    gh コマンドを asyncio サブプロセスとして実行
+
+    MAX_CONCURRENCY を超える呼び出しはセマフォで待機する。
+    タイムアウトとメトリクスの実行時間はセマフォ取得後のプロセス実行時間に対して適用する。
+    タスクがキャンセルされた場合（リクエストのキャンセル）は gh のプロセスグループを強制終了する。
+    """
+    try:
+        await _gh_semaphore.acquire()
+    except asyncio.CancelledError:
+        metrics.inc("gh_proxy_cancelled_calls_total", tool=tool_name, stage="queued")
+        raise
+    try:
+        started = time.monotonic()
+        try:
+            with contextlib.ExitStack() as stack:
+                output = stack.enter_context(open(stdout_path, "wb")) if stdout_path else asyncio.subprocess.PIPE
+                proc = await asyncio.create_subprocess_exec(
+                    "gh", *args,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=output,
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True
+                )
+        except FileNotFoundError:
+            raise ToolExecutionError("gh コマンドが見つかりません。GitHub CLI をインストールしてください")
+        except Exception as e:
+            raise ToolExecutionError(f"コマンド実行中にエラーが発生しました: {str(e)}")
+
+        metrics.inc("gh_proxy_gh_in_flight")
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            kill_process_group(proc)
+            await proc.wait()
+            metrics.inc("gh_proxy_timeouts_total", tool=tool_name, source="gh")
+            raise ToolExecutionError(f"コマンド実行がタイムアウトしました（{timeout}秒）")
+        except asyncio.CancelledError:
+            kill_process_group(proc)
+            await proc.wait()
+            metrics.inc("gh_proxy_cancelled_calls_total", tool=tool_name, stage="running")
+            raise
+        finally:
+            metrics.inc("gh_proxy_gh_in_flight", -1)
+            metrics.observe("gh_proxy_phase_seconds", time.monotonic() - started, tool=tool_name, phase="subprocess")
+
+        return (
+            stdout.decode("utf-8", errors="replace") if stdout is not None else "",
+            stderr.decode("utf-8", errors="replace"),
+            proc.returncode
+        )
+    finally:
+        _gh_semaphore.release()
+
+
+class GhCliTool:
+    """
+    gh コマンドを1回実行して標準出力（JSON）をコンパクト形式で返すツールの定義
+
+    argv の "{repo}" や "{number}" のようなプレースホルダーはリポジトリ名・引数の値で置き換え、
+    options に指定した引数は存在する場合のみ対応するフラグとして追加する。
+    "{fields}" は fields 引数の値（省略時は json_fields）で置き換える。
+    """
+
+    def __init__(self, argv: List[str], options: Optional[Dict[str, str]] = None,
+                 json_fields: Optional[str] = None):
+        self.argv = argv
+        self.options = options or {}
+        self.json_fields = json_fields
+        self.placeholders = [
+            (index, part[1:-1]) for index, part in enumerate(argv)
+            if part.startswith("{") and part.endswith("}")
+        ]
+        self.label = "gh " + " ".join(argv[:2])
+
+    def build_args(self, repo: str, arguments: Dict[str, Any]) -> List[str]:
+        """gh コマンドの引数リストを生成"""
+        args = list(self.argv)
+        for index, name in self.placeholders:
+            if name == "repo":
+                args[index] = repo
+            elif name == "fields":
+                args[index] = arguments.get("fields", self.json_fields)
+            else:
+                args[index] = str(arguments[name])
+        for name, flag in self.options.items():
+            if name in arguments:
+                args.extend([flag, str(arguments[name])])
+        return args
+
+    def __call__(self, repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+        stdout, stderr, code = execute_gh_command(self.build_args(repo, arguments))
+
+        if code != 0:
+            raise ToolExecutionError(f"{self.label} failed: {stderr}")
+
+        return compact_json_text(stdout)
+
+
+# gh コマンドで実行するツール
+LIST_OPTIONS = {"state": "--state", "limit": "--limit", "search": "--search"}
+GH_CLI_TOOLS = {
+    "gh_repo_view": GhCliTool(["repo", "view", "{repo}", "--json", "{fields}"],
+                              json_fields=REPO_VIEW_JSON_FIELDS),
+    "gh_pr_list": GhCliTool(["pr", "list", "--repo", "{repo}", "--json", "{fields}"], LIST_OPTIONS,
+                            json_fields=LIST_JSON_FIELDS),
+    "gh_pr_view": GhCliTool(["pr", "view", "{number}", "--repo", "{repo}", "--json", "{fields}"],
+                            json_fields=PR_VIEW_JSON_FIELDS),
+    "gh_issue_list": GhCliTool(["issue", "list", "--repo", "{repo}", "--json", "{fields}"], LIST_OPTIONS,
+                               json_fields=LIST_JSON_FIELDS),
+    "gh_issue_view": GhCliTool(["issue", "view", "{number}", "--repo", "{repo}", "--json", "{fields}"],
+                               json_fields=ISSUE_VIEW_JSON_FIELDS),
+    "gh_pr_comments": GhCliTool(["pr", "view", "{number}", "--repo", "{repo}", "--json", "comments"]),
+    "gh_issue_comments": GhCliTool(["issue", "view", "{number}", "--repo", "{repo}", "--json", "comments"]),
+}
+
+
+def abort_connection(conn: http.client.HTTPConnection) -> None:
+    """送受信中の接続のソケットを閉じ、ブロックしている読み書きを終了させる"""
+    sock = conn.sock
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class GitHubAPIClient:
+    """
+    GitHub API への keep-alive 接続プールを持つクライアント
+
+    トークンは最初の呼び出し時に gh auth token で一度だけ取得する。
+    同時に使用する接続数は pool_size で制限し、使い終えた接続は再利用する。
+    """
+
+    def __init__(self, base_url: str, pool_size: int, timeout: int):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self.token: Optional[str] = None
+        self.token_lock = threading.Lock()
+
+    def get_token(self) -> str:
+        """gh auth token で認証トークンを取得（取得済みの場合は再利用）"""
+        with self.token_lock:
+            if self.token is None:
+                try:
+                    result = subprocess.run(
+                        ["gh", "auth", "token"],
+                        capture_output=True,
+                        text=True,
+                        timeout=self.timeout,
+                        shell=False
+                    )
+                except FileNotFoundError:
+                    raise ToolExecutionError("gh コマンドが見つかりません。GitHub CLI をインストールしてください")
+                except subprocess.TimeoutExpired:
+                    raise ToolExecutionError(f"gh auth token がタイムアウトしました（{self.timeout}秒）")
+                if result.returncode != 0 or not result.stdout.strip():
+                    raise ToolExecutionError(f"gh auth token failed: {result.stderr}")
+                self.token = result.stdout.strip()
+            return self.token
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        API リクエストをスケジューラー（gh_scheduler）の順番に従って送信
+
+        Returns:
+            (status, headers（小文字キー）, body) のタプル
+        """
+        return gh_scheduler.call(lambda: self._send(method, path, body, headers), api_retry_after)
+
+    def _send(self, method: str, path: str, body: Optional[bytes],
+              headers: Optional[Dict[str, str]]) -> Tuple[int, Dict[str, str], bytes]:
+        """API リクエストを送信"""
+        request_headers = {
+            "Authorization": f"bearer {self.get_token()}",
+            "Accept": "application/vnd.github+json",
+            "User-Agent": f"{SERVER_NAME}/{SERVER_VERSION}",
+        }
+        if body is not None:
+            request_headers["Content-Type"] = "application/json"
+        request_headers.update(headers or {})
+
+        with self.slots, span("api", method=method, path=path) as attributes:
+            raise_if_cancelled("queued")
+            started = time.monotonic()
+            try:
+                conn = self.idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connect()
+                reused = False
+
+            # リクエストがキャンセルされた場合はソケットを閉じて応答の待機を打ち切る
+            with on_cancel(lambda: abort_connection(conn)):
+                while True:
+                    try:
+                        conn.request(method, self.base_path + path, body=body, headers=request_headers)
+                        response = conn.getresponse()
+                        data = response.read()
+                        break
+                    except (http.client.HTTPException, OSError) as e:
+                        conn.close()
+                        raise_if_cancelled("running")
+                        if isinstance(e, (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                                          http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)):
+                            # keep-alive 接続がサーバー側で閉じられていた場合は新しい接続で1回だけ再送する
+                            if not reused:
+                                raise ToolExecutionError("GitHub API への接続が切断されました")
+                            conn = self._connect()
+                            reused = False
+                        elif isinstance(e, socket.timeout):
+                            metrics.inc("gh_proxy_timeouts_total", tool=current_tool(), source="api")
+                            raise ToolExecutionError(f"GitHub API リクエストがタイムアウトしました（{self.timeout}秒）")
+                        elif isinstance(e, OSError):
+                            raise ToolExecutionError(f"GitHub API への接続に失敗しました: {str(e)}")
+                        else:
+                            raise
+
+            metrics.observe("gh_proxy_phase_seconds", time.monotonic() - started, tool=current_tool(), phase="api")
+            attributes["status"] = response.status
+            if response.will_close:
+                conn.close()
+            else:
+                self.idle.put(conn)
+
+        if response.status == 401:
+            # トークンが失効している可能性があるため次回の呼び出しで取得し直す
+            with self.token_lock:
+                self.token = None
+        return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+
+    def graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """GraphQL クエリを実行してレスポンス（data と errors）を返す"""
+        body = json.dumps({"query": query, "variables": variables}).encode("utf-8")
+        status, _, data = self.request("POST", "/graphql", body)
+        if status != 200:
+            raise ToolExecutionError(f"GitHub API request failed: HTTP {status}: {data.decode('utf-8', errors='replace')}")
+        return json.loads(data.decode("utf-8"))
+
+
+# GraphQL で取得する作成者情報（gh の --json author と同じ形に整形する）
+AUTHOR_FIELDS = "author { __typename login ... on User { id name } ... on Bot { id } ... on Organization { id name } }"
+
+COMMENT_FIELDS = (
+    "id " + AUTHOR_FIELDS + " authorAssociation body createdAt includesCreatedEdit isMinimized minimizedReason "
+    "reactionGroups { content users { totalCount } } url viewerDidAuthor"
+)
+COMMENT_JSON_FIELDS = (
+    "author,authorAssociation,body,createdAt,id,includesCreatedEdit,isMinimized,minimizedReason,"
+    "reactionGroups,url,viewerDidAuthor"
+)
+
+# gh の --json フィールド名と GraphQL の選択の対応（スカラーフィールドは同名のため省略）
+GRAPHQL_FIELD_SELECTIONS = {"author": AUTHOR_FIELDS, "owner": "owner { id login }"}
+
+
+def graphql_selection(json_fields: str) -> str:
+    """gh の --json 形式のフィールドリストを GraphQL の選択に変換"""
+    return " ".join(GRAPHQL_FIELD_SELECTIONS.get(field, field) for field in json_fields.split(","))
+
+
+# gh_pr_list / gh_issue_list の state 引数と GraphQL の状態の対応
+PR_STATES = {"open": ["OPEN"], "closed": ["CLOSED", "MERGED"], "merged": ["MERGED"], "all": None}
+ISSUE_STATES = {"open": ["OPEN"], "closed": ["CLOSED"], "all": None}
+
+
+def shape_author(author: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """GraphQL の author を gh の --json 出力と同じ形に整形"""
+    if author is None:
+        return {"id": "", "is_bot": False, "login": "ghost", "name": "Ghost"}
+    is_bot = author.get("__typename") == "Bot"
+    return {
+        "id": author.get("id", ""),
+        "is_bot": is_bot,
+        "login": f"app/{author['login']}" if is_bot else author["login"],
+        "name": author.get("name", "")
+    }
+
+
+def shape_comment(comment: Dict[str, Any]) -> Dict[str, Any]:
+    """GraphQL のコメントを gh の --json comments と同じ形に整形"""
+    shaped = {field: comment.get(field) for field in COMMENT_JSON_FIELDS.split(",")}
+    shaped["author"] = {"login": shape_author(comment.get("author"))["login"]}
+    shaped["reactionGroups"] = [
+        group for group in comment.get("reactionGroups", [])
+        if group["users"]["totalCount"] > 0
+    ]
+    return shaped
+
+
+def shape_node(node: Dict[str, Any], json_fields: str) -> Dict[str, Any]:
+    """ノードを gh の --json に指定するフィールドのみに絞り、author を整形"""
+    shaped = {field: node.get(field) for field in json_fields.split(",")}
+    if "author" in shaped:
+        shaped["author"] = shape_author(shaped["author"])
+    if isinstance(shaped.get("owner"), dict):
+        shaped["owner"] = {"id": shaped["owner"].get("id"), "login": shaped["owner"].get("login")}
+    return shaped
+
+
+def gh_json_text(data: Any) -> List[Dict[str, Any]]:
+    """gh の --json 出力（キー順ソート・コンパクト形式）と同じテキストの content を生成"""
+    text = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")) + "\n"
+    return [{"type": "text", "text": text}]
+
+
+def compact_json_text(output: str) -> List[Dict[str, Any]]:
+    """gh の出力（インデント付き JSON）をコンパクト形式の content に変換（JSON でない場合はそのまま）"""
+    try:
+        return gh_json_text(json.loads(output))
+    except ValueError:
+        return [{"type": "text", "text": output}]
+
+
+def run_graphql(query: str, variables: Dict[str, Any],
+                allow_partial: bool = False) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    GraphQL クエリを実行
+
+    gh バックエンドでは gh api graphql、HTTP バックエンドでは接続プールを使用する。
+    allow_partial が True の場合、一部のフィールドのみエラーになった結果をそのまま返す。
+
+    Returns:
+        (data, errors) のタプル
+    """
+    if BACKEND == "http":
+        key = ("graphql", query, json.dumps(variables, sort_keys=True))
+        payload = gh_single_flight.run(key, lambda: github_client.graphql(query, variables))
+    else:
+        args = ["api", "graphql", "-f", f"query={query}"]
+        for name, value in variables.items():
+            if value is None:
+                continue
+            if isinstance(value, str):
+                args.extend(["-f", f"{name}={value}"])
+            else:
+                args.extend(["-F", f"{name}={json.dumps(value)}"])
+        stdout, stderr, code = execute_gh_command(args)
+        try:
+            payload = json.loads(stdout)
+        except ValueError:
+            raise ToolExecutionError(f"gh api graphql failed: {stderr}")
+        if code != 0 and not payload.get("errors"):
+            raise ToolExecutionError(f"gh api graphql failed: {stderr}")
+
+    errors = payload.get("errors") or []
+    if errors and (not allow_partial or not payload.get("data")):
+        messages = "; ".join(error.get("message", "") for error in errors)
+        raise ToolExecutionError(f"GitHub API request failed: {messages}")
+    return payload.get("data") or {}, errors
+
+
+def graphql_data(query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    """GraphQL クエリを実行して data を返す"""
+    return run_graphql(query, variables)[0]
+
+
+def repository_query(fields: str, declarations: str = "") -> str:
+    """
+    repository(owner, name) 配下のフィールドを取得するクエリを生成
+
+    declarations には $owner / $name 以外に使用する変数の宣言（例: "$number: Int!"）を指定する。
+    """
+    if declarations:
+        declarations = ", " + declarations
+    return (
+        "query($owner: String!, $name: String!" + declarations + ") {"
+        " repository(owner: $owner, name: $name) { " + fields + " } }"
+    )
+
+
+def repository_variables(repo: str, **extra: Any) -> Dict[str, Any]:
+    owner, name = repo.split("/", 1)
+    variables = {"owner": owner, "name": name}
+    variables.update(extra)
+    return variables
+
+
+def fetch_all_comments(repo: str, kind: str, number: int) -> List[Dict[str, Any]]:
+    """PR / Issue のコメントをすべてのページにわたって取得"""
+    query = repository_query(
+        kind + "(number: $number) { comments(first: $first, after: $after) { nodes { " + COMMENT_FIELDS + " }"
+        " pageInfo { hasNextPage endCursor } } }",
+        "$number: Int!, $first: Int!, $after: String"
+    )
+    comments: List[Dict[str, Any]] = []
+    after = None
+    while True:
+        data = graphql_data(query, repository_variables(repo, number=number, first=100, after=after))
+        connection = data["repository"][kind]["comments"]
+        comments.extend(shape_comment(node) for node in connection["nodes"])
+        if not connection["pageInfo"]["hasNextPage"]:
+            return comments
+        after = connection["pageInfo"]["endCursor"]
+
+
+def http_repo_view(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """gh_repo_view の HTTP バックエンド実装"""
+    json_fields = arguments.get("fields", REPO_VIEW_JSON_FIELDS)
+    data = graphql_data(repository_query(graphql_selection(json_fields)), repository_variables(repo))
+    return gh_json_text(shape_node(data["repository"], json_fields))
+
+
+def http_list(repo: str, arguments: Dict[str, Any], kind: str) -> List[Dict[str, Any]]:
+    """gh_pr_list / gh_issue_list の HTTP バックエンド実装"""
+    state = arguments.get("state", "open")
+    limit = arguments.get("limit", 30)
+    json_fields = arguments.get("fields", LIST_JSON_FIELDS)
+    item_fields = graphql_selection(json_fields)
+
+    if "search" in arguments:
+        # gh と同様に検索 API で取得する
+        qualifiers = [f"repo:{repo}", "is:pr" if kind == "pr" else "is:issue"]
+        if state != "all":
+            qualifiers.append(f"is:{state}")
+        qualifiers.extend(["sort:created-desc", arguments["search"]])
+        query = (
+            "query($q: String!, $first: Int!) { search(query: $q, type: ISSUE, first: $first) { nodes {"
+            " ... on PullRequest { " + item_fields + " } ... on Issue { " + item_fields + " } } } }"
+        )
+        data = graphql_data(query, {"q": " ".join(qualifiers), "first": limit})
+        nodes = data["search"]["nodes"]
+    else:
+        if kind == "pr":
+            connection = "pullRequests(first: $first, states: $states, orderBy: {field: CREATED_AT, direction: DESC})"
+            declarations = "$first: Int!, $states: [PullRequestState!]"
+            variables = repository_variables(repo, first=limit, states=PR_STATES[state])
+        else:
+            connection = "issues(first: $first, states: $states, orderBy: {field: CREATED_AT, direction: DESC})"
+            declarations = "$first: Int!, $states: [IssueState!]"
+            variables = repository_variables(repo, first=limit, states=ISSUE_STATES[state])
+        query = repository_query(connection + " { nodes { " + item_fields + " } }", declarations)
+        data = graphql_data(query, variables)
+        nodes = next(iter(data["repository"].values()))["nodes"]
+
+    return gh_json_text([shape_node(node, json_fields) for node in nodes])
+
+
+def http_pr_view(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """gh_pr_view の HTTP バックエンド実装"""
+    json_fields = arguments.get("fields", PR_VIEW_JSON_FIELDS)
+    query = repository_query(
+        "pullRequest(number: $number) { " + graphql_selection(json_fields) + " }",
+        "$number: Int!"
+    )
+    data = graphql_data(query, repository_variables(repo, number=arguments["number"]))
+    return gh_json_text(shape_node(data["repository"]["pullRequest"], json_fields))
+
+
+def http_issue_view(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """gh_issue_view の HTTP バックエンド実装"""
+    json_fields = arguments.get("fields", ISSUE_VIEW_JSON_FIELDS)
+    query = repository_query(
+        "issue(number: $number) { " + graphql_selection(json_fields) + " }",
+        "$number: Int!"
+    )
+    data = graphql_data(query, repository_variables(repo, number=arguments["number"]))
+    return gh_json_text(shape_node(data["repository"]["issue"], json_fields))
+
+
+# HTTP バックエンドで実行するツール
+HTTP_TOOL_HANDLERS = {
+    "gh_repo_view": http_repo_view,
+    "gh_pr_list": lambda repo, arguments: http_list(repo, arguments, "pr"),
+    "gh_pr_view": http_pr_view,
+    "gh_issue_list": lambda repo, arguments: http_list(repo, arguments, "issue"),
+    "gh_issue_view": http_issue_view,
+    "gh_pr_comments": lambda repo, arguments: gh_json_text(
+        {"comments": fetch_all_comments(repo, "pullRequest", arguments["number"])}
+    ),
+    "gh_issue_comments": lambda repo, arguments: gh_json_text(
+        {"comments": fetch_all_comments(repo, "issue", arguments["number"])}
+    ),
+}
+
+# グローバル GitHub API クライアント（HTTP バックエンド用）
+github_client = GitHubAPIClient(API_URL, MAX_CONCURRENCY, TIMEOUT)
+
+
+# バンドルツールで取得するコメント・レビュースレッド・変更ファイルの上限
+BUNDLE_COMMENTS_LIMIT = 100
+BUNDLE_REVIEW_THREADS_LIMIT = 50
+BUNDLE_FILES_LIMIT = 100
+
+
+def bundle_fields(kind: str, include_review_threads: bool = False, include_files: bool = False) -> str:
+    """バンドルツールで1件の PR / Issue について取得するフィールド"""
+    json_fields = PR_VIEW_JSON_FIELDS if kind == "pullRequest" else ISSUE_VIEW_JSON_FIELDS
+    fields = graphql_selection(json_fields)
+    fields += f" comments(first: {BUNDLE_COMMENTS_LIMIT}) {{ totalCount nodes {{ {COMMENT_FIELDS} }} }}"
+    if include_review_threads:
+        fields += (
+            f" reviewThreads(first: {BUNDLE_REVIEW_THREADS_LIMIT}) {{ totalCount nodes {{ isResolved path line"
+            " comments(first: 20) { nodes { author { login } body createdAt } } } }"
+        )
+    if include_files:
+        fields += f" additions deletions changedFiles files(first: {BUNDLE_FILES_LIMIT}) {{ totalCount nodes {{ path additions deletions }} }}"
+    return fields
+
+
+def shape_bundle(node: Dict[str, Any], kind: str, include_review_threads: bool = False,
+                 include_files: bool = False) -> Dict[str, Any]:
+    """バンドルツールの結果を整形（詳細情報は gh の --json と同じ形）"""
+    json_fields = PR_VIEW_JSON_FIELDS if kind == "pullRequest" else ISSUE_VIEW_JSON_FIELDS
+    bundle = shape_node(node, json_fields)
+    bundle["comments"] = [shape_comment(comment) for comment in node["comments"]["nodes"]]
+    bundle["commentsTotalCount"] = node["comments"]["totalCount"]
+    if include_review_threads:
+        bundle["reviewThreads"] = [
+            {
+                "isResolved": thread["isResolved"],
+                "path": thread["path"],
+                "line": thread["line"],
+                "comments": [
+                    {
+                        "author": {"login": shape_author(comment.get("author"))["login"]},
+                        "body": comment["body"],
+                        "createdAt": comment["createdAt"]
+                    }
+                    for comment in thread["comments"]["nodes"]
+                ]
+            }
+            for thread in node["reviewThreads"]["nodes"]
+        ]
+        bundle["reviewThreadsTotalCount"] = node["reviewThreads"]["totalCount"]
+    if include_files:
+        bundle["additions"] = node["additions"]
+        bundle["deletions"] = node["deletions"]
+        bundle["changedFiles"] = node["changedFiles"]
+        bundle["files"] = [
+            {"path": f["path"], "additions": f["additions"], "deletions": f["deletions"]}
+            for f in node["files"]["nodes"]
+        ]
+    return bundle
+
+
+def execute_gh_pr_bundle(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """gh_pr_bundle ツールの実行"""
+    include_review_threads = arguments.get("include_review_threads", False)
+    include_files = arguments.get("include_files", False)
+    query = repository_query(
+        "pullRequest(number: $number) { " + bundle_fields("pullRequest", include_review_threads, include_files) + " }",
+        "$number: Int!"
+    )
+    data = graphql_data(query, repository_variables(repo, number=arguments["number"]))
+    return gh_json_text(shape_bundle(data["repository"]["pullRequest"], "pullRequest",
+                                     include_review_threads, include_files))
+
+
+def execute_gh_issue_bundle(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """gh_issue_bundle ツールの実行"""
+    query = repository_query(
+        "issue(number: $number) { " + bundle_fields("issue") + " }",
+        "$number: Int!"
+    )
+    data = graphql_data(query, repository_variables(repo, number=arguments["number"]))
+    return gh_json_text(shape_bundle(data["repository"]["issue"], "issue"))
+
+
+def execute_gh_pr_bundle_multi(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    gh_pr_bundle_multi ツールの実行
+
+    PR番号ごとにエイリアスを付けた1つのクエリで取得する。
+    存在しない番号はクエリ全体を失敗させず errors に記録する。
+    """
+    include_review_threads = arguments.get("include_review_threads", False)
+    include_files = arguments.get("include_files", False)
+    numbers = list(dict.fromkeys(arguments["numbers"]))
+    fields = bundle_fields("pullRequest", include_review_threads, include_files)
+    # numbers はバリデーション済みの整数のためクエリに直接埋め込む
+    query = repository_query(" ".join(
+        f"pr{number}: pullRequest(number: {number}) {{ {fields} }}" for number in numbers
+    ))
+    data, errors = run_graphql(query, repository_variables(repo), allow_partial=True)
+
+    messages: Dict[str, str] = {}
+    for error in errors:
+        path = error.get("path") or []
+        if len(path) >= 2:
+            messages[path[1]] = error.get("message", "")
+
+    pull_requests = []
+    failures = []
+    for number in numbers:
+        node = (data.get("repository") or {}).get(f"pr{number}")
+        if node is None:
+            failures.append({"number": number, "message": messages.get(f"pr{number}", "取得できませんでした")})
+        else:
+            pull_requests.append(shape_bundle(node, "pullRequest", include_review_threads, include_files))
+    return gh_json_text({"pullRequests": pull_requests, "errors": failures})
+
+
+# ページ単位の一覧ツールのデフォルトのページサイズ
+DEFAULT_PAGE_SIZE = 30
+
+
+def encode_list_cursor(tool_name: str, repo: str, arguments: Dict[str, Any], end_cursor: str) -> str:
+    """続きのページを取得するための不透明なカーソルを生成"""
+    token = {
+        "tool": tool_name,
+        "repo": repo.lower(),
+        "state": arguments.get("state", "open"),
+        "search": arguments.get("search"),
+        "after": end_cursor
+    }
+    return base64.urlsafe_b64encode(json.dumps(token, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_list_cursor(tool_name: str, repo: str, arguments: Dict[str, Any]) -> Optional[str]:
+    """cursor 引数を検証し、GraphQL の after に指定するカーソルを返す"""
+    if "cursor" not in arguments:
+        return None
+    try:
+        token = json.loads(base64.urlsafe_b64decode(arguments["cursor"].encode("ascii")).decode("utf-8"))
+        after = token["after"]
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        raise ValidationError("cursor が無効な形式です")
+    if (token.get("tool") != tool_name or token.get("repo") != repo.lower()
+            or token.get("state") != arguments.get("state", "open")
+            or token.get("search") != arguments.get("search")):
+        raise ValidationError("cursor は異なる条件で発行されたものです。同じ state / search を指定してください")
+    return after
+
+
+def fetch_list_page(repo: str, kind: str, arguments: Dict[str, Any], first: int,
+                    after: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str], bool, int]:
+    """
+    PR / Issue 一覧の1ページを GraphQL で取得
+
+    Returns:
+        (整形済みノード, endCursor, hasNextPage, totalCount) のタプル
+    """
+    state = arguments.get("state", "open")
+    json_fields = arguments.get("fields", LIST_JSON_FIELDS)
+    item_fields = graphql_selection(json_fields)
+    page_fields = " totalCount nodes { " + item_fields + " } pageInfo { hasNextPage endCursor }"
+
+    if "search" in arguments:
+        qualifiers = [f"repo:{repo}", "is:pr" if kind == "pr" else "is:issue"]
+        if state != "all":
+            qualifiers.append(f"is:{state}")
+        qualifiers.extend(["sort:created-desc", arguments["search"]])
+        query = (
+            "query($q: String!, $first: Int!, $after: String) {"
+            " search(query: $q, type: ISSUE, first: $first, after: $after) { issueCount"
+            " nodes { ... on PullRequest { " + item_fields + " } ... on Issue { " + item_fields + " } }"
+            " pageInfo { hasNextPage endCursor } } }"
+        )
+        data = graphql_data(query, {"q": " ".join(qualifiers), "first": first, "after": after})
+        connection = data["search"]
+        total = connection["issueCount"]
+    else:
+        # 状態はバリデーション済みの列挙値のためクエリに直接埋め込む（gh api graphql -F は配列を渡せない）
+        states = (PR_STATES if kind == "pr" else ISSUE_STATES)[state]
+        states_argument = f", states: [{', '.join(states)}]" if states else ""
+        field = "pullRequests" if kind == "pr" else "issues"
+        query = repository_query(
+            f"{field}(first: $first, after: $after{states_argument}, orderBy: {{field: CREATED_AT, direction: DESC}}) {{"
+            + page_fields + " }",
+            "$first: Int!, $after: String"
+        )
+        data = graphql_data(query, repository_variables(repo, first=first, after=after))
+        connection = data["repository"][field]
+        total = connection["totalCount"]
+
+    nodes = [shape_node(node, json_fields) for node in connection["nodes"]]
+    page_info = connection["pageInfo"]
+    return nodes, page_info["endCursor"], page_info["hasNextPage"], total
+
+
+def iter_list_pages(tool_name: str, repo: str, arguments: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    ページ単位の一覧ツールの content を1ページずつ生成
+
+    各ページは gh_pr_list / gh_issue_list と同じ形式の配列テキストとして生成し、
+    最後に nextCursor と件数をまとめたテキストを生成する。
+    max_items が指定されていない場合は1ページのみ取得する。
+    """
+    kind = "pr" if tool_name == "gh_pr_list_page" else "issue"
+    page_size = arguments.get("page_size", DEFAULT_PAGE_SIZE)
+    max_items = arguments.get("max_items", page_size)
+    after = decode_list_cursor(tool_name, repo, arguments)
+
+    fetched = 0
+    total = 0
+    has_next = True
+    while has_next and fetched < max_items:
+        nodes, end_cursor, has_next, total = fetch_list_page(
+            repo, kind, arguments, min(page_size, max_items - fetched), after
+        )
+        fetched += len(nodes)
+        after = end_cursor
+        yield gh_json_text(nodes)[0]
+        if not nodes:
+            break
+
+    summary = {
+        "itemCount": fetched,
+        "totalCount": total,
+        "nextCursor": encode_list_cursor(tool_name, repo, arguments, after) if has_next and after else None
+    }
+    yield {"type": "text", "text": json.dumps(summary, ensure_ascii=False, separators=(",", ":"))}
+
+
+def execute_gh_list_page(repo: str, arguments: Dict[str, Any], tool_name: str) -> List[Dict[str, Any]]:
+    """gh_pr_list_page / gh_issue_list_page ツールの実行"""
+    return list(iter_list_pages(tool_name, repo, arguments))
+
+
+# 複数リポジトリのツールと、リポジトリごとに実行するツール・結果のキー
+MULTI_LIST_TOOLS = {
+    "gh_multi_pr_list": ("gh_pr_list", "pullRequests"),
+    "gh_multi_issue_list": ("gh_issue_list", "issues"),
+}
+# 並べ替え順（sort 引数）と並べ替えに使うフィールド
+MULTI_SORT_FIELDS = {"updated": "updatedAt", "created": "createdAt"}
+
+
+def execute_gh_multi_list(repo: str, arguments: Dict[str, Any], tool_name: str) -> List[Dict[str, Any]]:
+    """
+    gh_multi_pr_list / gh_multi_issue_list ツールの実行
+
+    リポジトリごとの一覧ツールを最大 MULTI_CONCURRENCY 件ずつ並行に実行する。
+    各呼び出しは単独で呼び出した場合と同じくキャッシュ・合流・スケジューラーを経由する。
+    結果には repository を付けて1つの配列にまとめ、失敗したリポジトリは呼び出し全体を
+    失敗させずに errors に記録する。
+    """
+    list_tool, result_key = MULTI_LIST_TOOLS[tool_name]
+    repositories = []
+    seen = set()
+    for name in arguments["repositories"]:
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            repositories.append(name)
+
+    sort_field = MULTI_SORT_FIELDS.get(arguments.get("sort", "updated"))
+    list_arguments = {name: arguments[name] for name in ("state", "limit", "search", "refresh") if name in arguments}
+    if "fields" in arguments:
+        fields = arguments["fields"].split(",")
+        # 並べ替えに使うフィールドは指定がなくても取得する
+        if sort_field is not None and sort_field not in fields:
+            fields.append(sort_field)
+        list_arguments["fields"] = ",".join(fields)
+
+    token = current_cancel_token()
+    trace = current_trace()
+
+    def fetch(name: str) -> Tuple[Any, float, bool]:
+        owner, repository_name = name.split("/", 1)
+        _request_context.tool = list_tool
+        _request_context.cancel = token
+        _request_context.trace = trace
+        _request_context.queue_wait = 0.0
+        _request_context.scheduled = False
+        try:
+            with span("repository", repository=name):
+                raise_if_cancelled("queued")
+                content = execute_tool_cached(list_tool, dict(list_arguments, owner=owner, repository_name=repository_name))
+            return json.loads(content[0]["text"]), _request_context.queue_wait, _request_context.scheduled
+        finally:
+            _request_context.tool = ""
+            _request_context.cancel = None
+            _request_context.trace = None
+
+    items = []
+    failures = []
+    queue_wait = 0.0
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(MULTI_CONCURRENCY, len(repositories)), thread_name_prefix="gh-multi"
+    ) as executor:
+        futures = [executor.submit(fetch, name) for name in repositories]
+        for name, future in zip(repositories, futures):
+            try:
+                data, wait, scheduled = future.result()
+            except RequestCancelledError:
+                raise
+            except (ToolExecutionError, ValueError) as e:
+                failures.append({"repository": name, "message": str(e)})
+                continue
+            # 待ち時間は並行に実行した呼び出しのうち最も長いものを呼び出し全体の待ち時間とする
+            queue_wait = max(queue_wait, wait)
+            if scheduled:
+                _request_context.scheduled = True
+            items.extend(dict(item, repository=name) for item in data)
+    _request_context.queue_wait = getattr(_request_context, "queue_wait", 0.0) + queue_wait
+
+    if sort_field is not None:
+        items.sort(key=lambda item: item.get(sort_field) or "", reverse=True)
+    return gh_json_text({result_key: items, "errors": failures})
+
+
+# SSE でページごとに送出できるツール
+STREAMING_TOOLS = {"gh_pr_list_page", "gh_issue_list_page"}
+
+
+def wants_event_stream(environ: Dict[str, Any], request: Any) -> bool:
+    """
+    SSE でのストリーミング応答を行うかどうか
+
+    クライアントが text/event-stream を受け付け、max_items を指定したページ単位の一覧ツールの
+    単一リクエストである場合のみ対象とする。
+    """
+    if "text/event-stream" not in environ.get("HTTP_ACCEPT", ""):
+        return False
+    if not isinstance(request, dict) or is_notification(request) or request.get("method") != "tools/call":
+        return False
+    params = request.get("params")
+    if not isinstance(params, dict) or params.get("name") not in STREAMING_TOOLS:
+        return False
+    arguments = params.get("arguments")
+    return isinstance(arguments, dict) and "max_items" in arguments
+
+
+def stream_tool_call(request_id: Any, tool_name: str, arguments: Dict[str, Any], session: str = "",
+                     connection: Optional[CancelToken] = None) -> Iterator[bytes]:
+    """
+    ページ単位の一覧ツールの結果を SSE で送出
+
+    JSON-RPC レスポンス全体を1つの message イベントとし、content の各要素を
+    ページを取得するたびに data 行として書き出す（data 行は改行で連結され、有効な JSON になる）。
+    プロキシが保持するのは常に1ページ分のみ。
+    """
+    repo = f"{arguments['owner']}/{arguments['repository_name']}"
+    head = '{"jsonrpc":"2.0","id":' + dump_json(request_id) + ',"result":{"content":['
+    yield f"event: message\ndata: {head}\n".encode("utf-8")
+
+    separator = ""
+    tail = "]}}"
+    with in_flight_requests.track(session, request_id, connection) as token:
+        # ページの取得は next() を呼んだスレッドで実行されるため、再開のたびにツール名とキャンセル通知を設定し直す
+        _request_context.tool = tool_name
+        _request_context.cancel = token
+        try:
+            for item in iter_list_pages(tool_name, repo, arguments):
+                _request_context.tool = ""
+                _request_context.cancel = None
+                yield f"data: {separator}{dump_json(item)}\n".encode("utf-8")
+                separator = ","
+                _request_context.tool = tool_name
+                _request_context.cancel = token
+        except ToolExecutionError as e:
+            error_type = "cancelled" if isinstance(e, RequestCancelledError) else "execution"
+            metrics.inc("gh_proxy_tool_errors_total", tool=tool_name, type=error_type)
+            error_item = {"type": "text", "text": f"エラー: {str(e)}"}
+            yield f"data: {separator}{dump_json(error_item)}\n".encode("utf-8")
+            tail = "],\"isError\":true}}"
+        finally:
+            _request_context.tool = ""
+            _request_context.cancel = None
+    yield f"data: {tail}\n\n".encode("utf-8")
+
+
+# インデックスで使用できるトークナイザー（GH_PROXY_INDEX_TOKENIZER）と FTS5 の tokenize オプションの対応
+INDEX_TOKENIZERS = {"unicode61": "unicode61 remove_diacritics 2", "trigram": "trigram"}
+
+# インデックスに取り込むラベル・コメントの件数の上限（1件あたり）
+INDEX_LABELS_LIMIT = 20
+INDEX_COMMENTS_LIMIT = 50
+
+# インデックスの同期で1件の PR / Issue について取得するフィールド
+INDEX_ITEM_FIELDS = (
+    "number title body state url createdAt updatedAt " + AUTHOR_FIELDS
+    + f" labels(first: {INDEX_LABELS_LIMIT}) {{ nodes {{ name }} }}"
+    + f" comments(first: {INDEX_COMMENTS_LIMIT}) {{ nodes {{ body }} }}"
+)
+
+
+def format_timestamp(seconds: float) -> str:
+    """UNIX 時刻を GitHub と同じ ISO 8601 形式（UTC）に変換"""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+class LocalIndex:
+    """
+    PR / Issue の全文検索インデックス（SQLite FTS5）
+
+    タイトル・本文・ラベル・コメントを items テーブルに保持し、FTS5 の外部コンテンツテーブルで
+    索引付けする。検索結果は bm25 のスコア（タイトルとラベルの一致を重視）の順に返す。
+
+    追加・更新した行には単調増加する変更番号（seq）を振り、変更番号をカーソルとして
+    前回以降の変更を返せるようにする。変更番号はインデックスごとの epoch と組にして扱い、
+    インデックスを作り直した場合（メモリ上のインデックスでの再起動など）に古いカーソルを判別する。
+    """
+
+    # bm25 の列ごとの重み（title, body, labels, comments）
+    BM25_WEIGHTS = (10.0, 1.0, 5.0, 0.5)
+    # 結果として返す列（shape_row で整形する）
+    ITEM_COLUMNS = "items.kind, items.number, items.title, items.state, items.author, items.labels, items.url, items.updated_at"
+
+    def __init__(self, path: str, tokenizer: str):
+        if tokenizer not in INDEX_TOKENIZERS:
+            raise RuntimeError(f"未知のトークナイザー: {tokenizer}（{', '.join(INDEX_TOKENIZERS)} のいずれかを指定してください）")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        if path:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                repo TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                body TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                comments TEXT NOT NULL,
+                state TEXT NOT NULL,
+                author TEXT NOT NULL,
+                url TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                seq INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (repo, kind, number)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5 (
+                title, body, labels, comments, content='items', content_rowid='id', tokenize='%s'
+            );
+            CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+                INSERT INTO items_fts (rowid, title, body, labels, comments)
+                VALUES (new.id, new.title, new.body, new.labels, new.comments);
+            END;
+            CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+                INSERT INTO items_fts (items_fts, rowid, title, body, labels, comments)
+                VALUES ('delete', old.id, old.title, old.body, old.labels, old.comments);
+            END;
+            CREATE TRIGGER IF NOT EXISTS items_au AFTER UPDATE ON items BEGIN
+                INSERT INTO items_fts (items_fts, rowid, title, body, labels, comments)
+                VALUES ('delete', old.id, old.title, old.body, old.labels, old.comments);
+                INSERT INTO items_fts (rowid, title, body, labels, comments)
+                VALUES (new.id, new.title, new.body, new.labels, new.comments);
+            END;
+            CREATE TABLE IF NOT EXISTS repos (
+                repo TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS watermarks (
+                repo TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (repo, kind)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """ % INDEX_TOKENIZERS[tokenizer]
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(items)")]
+        if "seq" not in columns:
+            # 変更番号を持たないインデックスから移行する場合は、既存の行に追加順の番号を振る
+            self.conn.execute("ALTER TABLE items ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("UPDATE items SET seq = id")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_repo_seq ON items (repo, seq)")
+        self.conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (base64.b32encode(os.urandom(5)).decode("ascii"),)
+        )
+        self.epoch = self.conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        # trigram では3文字未満の語は一致を判定できないため検索語から除く
+        self.min_term_length = 3 if tokenizer == "trigram" else 1
+        self.searches = 0
+
+    def upsert(self, repo: str, kind: str, nodes: List[Dict[str, Any]]) -> int:
+        """
+        GraphQL で取得した PR / Issue を1トランザクションで追加・更新
+
+        updatedAt が保存済みのものと同じ行は変更せず、追加・更新した行には新しい変更番号を振る。
+
+        Returns:
+            追加・更新した件数
+        """
+        rows = [
+            (
+                repo, kind, node["number"], node["title"], node.get("body") or "",
+                "\n".join(label["name"] for label in node["labels"]["nodes"]),
+                "\n\n".join(comment["body"] for comment in node["comments"]["nodes"]),
+                node["state"], shape_author(node.get("author"))["login"], node["url"],
+                node["createdAt"], node["updatedAt"]
+            )
+            for node in nodes
+        ]
+        if not rows:
+            return 0
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                base = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM items").fetchone()[0]
+                cursor = self.conn.executemany(
+                    "INSERT INTO items (repo, kind, number, title, body, labels, comments, state, author, url,"
+                    " created_at, updated_at, seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (repo, kind, number) DO UPDATE SET title = excluded.title, body = excluded.body,"
+                    " labels = excluded.labels, comments = excluded.comments, state = excluded.state,"
+                    " author = excluded.author, url = excluded.url, updated_at = excluded.updated_at,"
+                    " seq = excluded.seq WHERE items.updated_at != excluded.updated_at",
+                    [row + (base + i,) for i, row in enumerate(rows, 1)]
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def high_water(self, repo: str, kind: str) -> Optional[str]:
+        """取り込み済みの PR / Issue の updatedAt の最大値（未同期の場合は None）"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT updated_at FROM watermarks WHERE repo = ? AND kind = ?", (repo, kind)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_high_water(self, repo: str, kind: str, updated_at: str) -> None:
+        """updatedAt の最大値を記録（次回の同期ではこれ以降に更新されたものだけを取得する）"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO watermarks (repo, kind, updated_at) VALUES (?, ?, ?)",
+                (repo, kind, updated_at)
+            )
+
+    def mark_synced(self, repo: str) -> None:
+        """リポジトリの同期完了時刻を記録"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO repos (repo, synced_at) VALUES (?, ?)", (repo, time.time())
+            )
+
+    def synced_at(self, repo: str) -> Optional[float]:
+        """リポジトリの最後の同期完了時刻（未同期の場合は None）"""
+        with self.lock:
+            row = self.conn.execute("SELECT synced_at FROM repos WHERE repo = ?", (repo,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def shape_row(row: Tuple[Any, ...]) -> Dict[str, Any]:
+        """ITEM_COLUMNS の順に取得した行を結果の形式に整形"""
+        return {
+            "kind": row[0],
+            "number": row[1],
+            "title": row[2],
+            "state": row[3],
+            "author": {"login": row[4]},
+            "labels": row[5].split("\n") if row[5] else [],
+            "url": row[6],
+            "updatedAt": row[7]
+        }
+
+    def match_expression(self, query: str) -> str:
+        """検索キーワードを FTS5 の MATCH 式に変換（各語をフレーズとして引用し、すべてを含むものに一致させる）"""
+        terms = [term for term in query.split() if len(term) >= self.min_term_length]
+        if not terms:
+            raise ValidationError(f"query に{self.min_term_length}文字以上の検索キーワードを指定してください")
+        return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+    def search(self, repo: str, query: str, kind: Optional[str], states: Optional[List[str]],
+               limit: int) -> List[Dict[str, Any]]:
+        """キーワードに一致する PR / Issue をスコアの高い順に返す"""
+        conditions = ["items_fts MATCH ?", "items.repo = ?"]
+        params: List[Any] = [self.match_expression(query), repo]
+        if kind is not None:
+            conditions.append("items.kind = ?")
+            params.append(kind)
+        if states is not None:
+            conditions.append(f"items.state IN ({', '.join('?' for _ in states)})")
+            params.extend(states)
+        params.append(limit)
+        sql = (
+            "SELECT %s, bm25(items_fts, %s), snippet(items_fts, -1, '[', ']', '…', 16)"
+            " FROM items_fts JOIN items ON items.id = items_fts.rowid"
+            " WHERE %s ORDER BY 9 LIMIT ?"
+        ) % (self.ITEM_COLUMNS, ", ".join(str(weight) for weight in self.BM25_WEIGHTS), " AND ".join(conditions))
+        with self.lock:
+            self.searches += 1
+            rows = self.conn.execute(sql, params).fetchall()
+        return [
+            dict(self.shape_row(row), score=round(-row[8], 3), snippet=row[9])
+            for row in rows
+        ]
+
+    def changes(self, repo: str, after: int, since: Optional[str], kind: Optional[str],
+                limit: int) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """
+        変更番号が after より大きい PR / Issue を変更順に返す
+
+        Returns:
+            (変更された PR / Issue, 次回のカーソルとする変更番号, 続きがあるかどうか) のタプル
+        """
+        conditions = ["items.repo = ?", "items.seq > ?"]
+        params: List[Any] = [repo, after]
+        if since is not None:
+            conditions.append("items.updated_at >= ?")
+            params.append(since)
+        if kind is not None:
+            conditions.append("items.kind = ?")
+            params.append(kind)
+        params.append(limit + 1)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT " + self.ITEM_COLUMNS + ", items.seq FROM items"
+                " WHERE " + " AND ".join(conditions) + " ORDER BY items.seq LIMIT ?", params
+            ).fetchall()
+            latest = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM items WHERE repo = ?", (repo,)).fetchone()[0]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        # 続きがない場合は条件に一致しなかった変更も含めて読み終えたものとする
+        next_seq = rows[-1][8] if has_more else max(after, latest)
+        return [self.shape_row(row) for row in rows], next_seq, has_more
+
+    def stats(self) -> Dict[str, Any]:
+        """リポジトリごとの件数と同期時刻"""
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT repo, COUNT(*) FROM items GROUP BY repo").fetchall())
+            synced = dict(self.conn.execute("SELECT repo, synced_at FROM repos").fetchall())
+        return {
+            "searches": self.searches,
+            "repos": {
+                repo: {
+                    "items": counts.get(repo, 0),
+                    "syncedAt": format_timestamp(synced[repo]) if repo in synced else None
+                }
+                for repo in sorted(set(counts) | set(synced))
+            }
+        }
+
+
+class IndexSyncer:
+    """
+    ローカルインデックスのバックグラウンド同期
+
+    対象リポジトリの PR / Issue を更新日時の新しい順に GraphQL でページ単位に取得し、
+    ページごとにインデックスへ反映する。呼び出しはバックグラウンドの優先度でスケジューラーを経由する。
+
+    種類ごとに取り込み済みの updatedAt の最大値（high-water mark）を記録し、2回目以降は
+    それ以降に更新されたものだけを取得する（Issue は filterBy の since で絞り込み、
+    PR は更新日時の順に取得して最大値より古いものが現れた時点で打ち切る）。
+    最大値と同時刻に更新されたものを取りこぼさないよう、最大値と同じ updatedAt のものも取得し直す。
+    """
+
+    # 1回の GraphQL クエリで取得する件数
+    PAGE_SIZE = 50
+
+    def __init__(self, index: LocalIndex, repos: List[str], interval: float):
+        self.index = index
+        self.repos = repos
+        self.interval = interval
+        self.synced = 0
+        self.failed = 0
+        self.last_duration: Optional[float] = None
+
+    def fetch_page(self, repo: str, kind: str, after: Optional[str],
+                   since: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        更新日時の新しい順に PR / Issue の1ページを取得
+
+        Returns:
+            (ノード, 続きのページの endCursor（最後のページの場合は None）) のタプル
+        """
+        if kind == "pr":
+            field = "pullRequests"
+            query = repository_query(
+                "pullRequests(first: $first, after: $after, orderBy: {field: UPDATED_AT, direction: DESC}) {"
+                " nodes { " + INDEX_ITEM_FIELDS + " } pageInfo { hasNextPage endCursor } }",
+                "$first: Int!, $after: String"
+            )
+            variables = repository_variables(repo, first=self.PAGE_SIZE, after=after)
+        else:
+            field = "issues"
+            query = repository_query(
+                "issues(first: $first, after: $after, filterBy: {since: $since},"
+                " orderBy: {field: UPDATED_AT, direction: DESC}) {"
+                " nodes { " + INDEX_ITEM_FIELDS + " } pageInfo { hasNextPage endCursor } }",
+                "$first: Int!, $after: String, $since: DateTime"
+            )
+            variables = repository_variables(repo, first=self.PAGE_SIZE, after=after, since=since)
+        data = graphql_data(query, variables)
+        connection = data["repository"][field]
+        page_info = connection["pageInfo"]
+        return connection["nodes"], page_info["endCursor"] if page_info["hasNextPage"] else None
+
+    def sync_repo(self, repo: str) -> int:
+        """
+        前回の同期以降に更新された PR / Issue を取得してインデックスに反映し、追加・更新した件数を返す
+
+        high-water mark は種類ごとに全ページを反映し終えてから進めるため、途中で失敗した場合は
+        次回の同期で同じ範囲を取得し直す。
+        """
+        count = 0
+        for kind in ("pr", "issue"):
+            high_water = self.index.high_water(repo, kind)
+            newest = high_water
+            after = None
+            while True:
+                nodes, after = self.fetch_page(repo, kind, after, high_water)
+                fresh = [node for node in nodes if high_water is None or node["updatedAt"] >= high_water]
+                count += self.index.upsert(repo, kind, fresh)
+                for node in fresh:
+                    if newest is None or node["updatedAt"] > newest:
+                        newest = node["updatedAt"]
+                if after is None or len(fresh) < len(nodes):
+                    break
+            if newest is not None:
+                self.index.set_high_water(repo, kind, newest)
+        self.index.mark_synced(repo)
+        return count
+
+    def run_once(self) -> None:
+        """すべての対象リポジトリを同期（失敗したリポジトリは次の周期に再試行する）"""
+        started = time.monotonic()
+        _request_context.tool = "index_sync"
+        _request_context.priority = GitHubScheduler.BACKGROUND
+        try:
+            for repo in self.repos:
+                try:
+                    count = self.sync_repo(repo)
+                    self.synced += 1
+                    print(f"index synced: {repo} ({count} changed)", file=sys.stderr)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"index sync failed: {repo}: {e}", file=sys.stderr)
+        finally:
+            _request_context.tool = ""
+            _request_context.priority = None
+        self.last_duration = time.monotonic() - started
+
+    def start(self) -> None:
+        """同期スレッドを開始（起動直後に1回同期し、以降は interval 秒ごとに同期する）"""
+        def loop():
+            while True:
+                self.run_once()
+                time.sleep(self.interval)
+
+        threading.Thread(target=loop, name="gh-proxy-index-sync", daemon=True).start()
+
+    def stats(self) -> Dict[str, Any]:
+        """同期回数と最後の同期の所要時間"""
+        stats = self.index.stats()
+        stats["synced"] = self.synced
+        stats["failed"] = self.failed
+        stats["lastDurationSeconds"] = round(self.last_duration, 3) if self.last_duration is not None else None
+        return stats
+
+
+def execute_gh_search_local(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """gh_search_local ツールの実行"""
+    repo = repo.lower()
+    if repo not in INDEX_REPOS:
+        raise ToolExecutionError(f"{repo} はローカルインデックスの対象ではありません（GH_PROXY_INDEX_REPOS）")
+    synced_at = local_index.synced_at(repo)
+    if synced_at is None:
+        raise ToolExecutionError(f"{repo} のローカルインデックスは同期中です。しばらくしてから再試行してください")
+
+    kind = arguments.get("kind", "all")
+    results = local_index.search(
+        repo, arguments["query"], None if kind == "all" else kind,
+        PR_STATES[arguments.get("state", "all")], arguments.get("limit", 20)
+    )
+    return gh_json_text({"results": results, "syncedAt": format_timestamp(synced_at)})
+
+
+def encode_changes_cursor(repo: str, kind: str, seq: int) -> str:
+    """gh_changes_since の次回の呼び出しに指定する不透明なカーソルを生成"""
+    token = {"repo": repo, "kind": kind, "epoch": local_index.epoch, "seq": seq}
+    return base64.urlsafe_b64encode(json.dumps(token, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_changes_cursor(repo: str, kind: str, cursor: str) -> Optional[int]:
+    """
+    gh_changes_since の cursor 引数を検証し、変更番号を返す
+
+    インデックスが作り直されて epoch が異なる場合は None を返す（最初から取得し直す）。
+    """
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        seq = int(token["seq"])
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        raise ValidationError("cursor が無効な形式です")
+    if token.get("repo") != repo or token.get("kind") != kind:
+        raise ValidationError("cursor は異なる条件で発行されたものです。同じリポジトリと kind を指定してください")
+    if token.get("epoch") != local_index.epoch:
+        return None
+    return seq
+
+
+def execute_gh_changes_since(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """gh_changes_since ツールの実行"""
+    repo = repo.lower()
+    if repo not in INDEX_REPOS:
+        raise ToolExecutionError(f"{repo} はローカルインデックスの対象ではありません（GH_PROXY_INDEX_REPOS）")
+    if "cursor" in arguments and "since" in arguments:
+        raise ValidationError("cursor と since は同時に指定できません")
+    synced_at = local_index.synced_at(repo)
+    if synced_at is None:
+        raise ToolExecutionError(f"{repo} のローカルインデックスは同期中です。しばらくしてから再試行してください")
+
+    kind = arguments.get("kind", "all")
+    after = 0
+    reset = False
+    if "cursor" in arguments:
+        seq = decode_changes_cursor(repo, kind, arguments["cursor"])
+        if seq is None:
+            reset = True
+        else:
+            after = seq
+    changes, next_seq, has_more = local_index.changes(
+        repo, after, arguments.get("since"), None if kind == "all" else kind, arguments.get("limit", 100)
+    )
+    return gh_json_text({
+        "changes": changes,
+        "cursor": encode_changes_cursor(repo, kind, next_seq),
+        "hasMore": has_more,
+        "reset": reset,
+        "syncedAt": format_timestamp(synced_at)
+    })
+
+
+def index_diff(path: str) -> List[Dict[str, Any]]:
+    """
+    unified diff のファイルを1行ずつ読み、ファイルごとの範囲（バイトオフセット）と追加・削除行数を求める
+
+    パスは diff --git ヘッダーの b/ 側（+++ 行や rename to 行があればそちら）を使用する。
+    """
+    files: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    in_hunk = False
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"diff --git "):
+                if current is not None:
+                    current["end"] = offset
+                header = line[len(b"diff --git "):].rstrip(b"\r\n").decode("utf-8", "replace")
+                current = {
+                    "path": header.rsplit(" b/", 1)[-1].strip('"'),
+                    "additions": 0,
+                    "deletions": 0,
+                    "start": offset,
+                    "end": offset
+                }
+                files.append(current)
+                in_hunk = False
+            elif current is not None:
+                if line.startswith(b"@@"):
+                    in_hunk = True
+                elif in_hunk and line.startswith(b"+"):
+                    current["additions"] += 1
+                elif in_hunk and line.startswith(b"-"):
+                    current["deletions"] += 1
+                elif not in_hunk and line.startswith(b"+++ b/"):
+                    current["path"] = line[len(b"+++ b/"):].rstrip(b"\r\n").decode("utf-8", "replace")
+                elif not in_hunk and line.startswith(b"rename to "):
+                    current["path"] = line[len(b"rename to "):].rstrip(b"\r\n").decode("utf-8", "replace")
+            offset += len(line)
+    if current is not None:
+        current["end"] = offset
+    return files
+
+
+def split_pages(mm: Any, start: int, end: int, boundaries: List[int], page_bytes: int) -> List[Tuple[int, int]]:
+    """
+    [start, end) を page_bytes 以下のページに分割
+
+    ページの区切りはファイルの境界（boundaries）を優先し、ファイルが1ページに収まらない場合は
+    行の境界、1行が収まらない場合は UTF-8 の文字境界で区切る。
+    """
+    pages = []
+    while start < end:
+        limit = start + page_bytes
+        if end <= limit:
+            cut = end
+        else:
+            index = bisect.bisect_right(boundaries, limit) - 1
+            if index >= 0 and boundaries[index] > start:
+                cut = boundaries[index]
+            else:
+                newline = mm.rfind(b"\n", start, limit)
+                if newline >= start:
+                    cut = newline + 1
+                else:
+                    cut = limit
+                    while cut > start + 1 and mm[cut] & 0xC0 == 0x80:
+                        cut -= 1
+        pages.append((start, cut))
+        start = cut
+    return pages
+
+
+class DiffStore:
+    """
+    gh pr diff の出力を一時ファイルに保持し、ページ単位で読み出すストア
+
+    差分は gh の標準出力を直接一時ファイルへ書き出してメモリに載せず、読み出しは mmap で
+    必要な範囲のみ行う。ファイルの索引とページの区切りは書き出し時に一度だけ求め、
+    有効期間（ttl）内の2ページ目以降やファイル指定の読み出しでは gh を再実行しない。
+    合計サイズが max_bytes を超えた場合は最も長く使われていない差分から削除する。
+    """
+
+    class _Entry:
+        def __init__(self, path: str, size: int, files: List[Dict[str, Any]], pages: List[Tuple[int, int]]):
+            self.path = path
+            self.size = size
+            self.files = files
+            self.pages = pages
+            self.fetched = time.monotonic()
+
+    def __init__(self, page_bytes: int, ttl: float, max_bytes: int):
+        self.page_bytes = page_bytes
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: "collections.OrderedDict[Tuple[str, int], DiffStore._Entry]" = collections.OrderedDict()
+        self.bytes = 0
+        self.directory: Optional[str] = None
+        self.spills = 0
+        self.hits = 0
+
+    def _directory(self) -> str:
+        """一時ファイルの置き場所（初回に作成し、終了時に削除する）"""
+        with self.lock:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="gh-proxy-diff-")
+                atexit.register(shutil.rmtree, self.directory, True)
+            return self.directory
+
+    def _discard(self, entry: "DiffStore._Entry") -> None:
+        """差分を削除（読み出し中のリクエストは開いたファイルをそのまま読める）"""
+        self.bytes -= entry.size
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        """有効期間切れの差分と、合計サイズの上限を超えた分の差分を削除（呼び出し側でロックを保持）"""
+        now = time.monotonic()
+        for key in [key for key, entry in self.entries.items() if now - entry.fetched >= self.ttl]:
+            self._discard(self.entries.pop(key))
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self._discard(entry)
+
+    def _spill(self, repo: str, number: int) -> "DiffStore._Entry":
+        """gh pr diff を実行して一時ファイルに書き出し、索引を作成して登録"""
+        fd, path = tempfile.mkstemp(prefix=f"{number}-", suffix=".diff", dir=self._directory())
+        os.close(fd)
+        args = ["pr", "diff", str(number), "--repo", repo]
+        try:
+            _, stderr, code = gh_scheduler.call(lambda: _spawn_gh_command(args, TIMEOUT, path), gh_retry_after)
+            if code != 0:
+                raise ToolExecutionError(f"gh pr diff failed: {stderr}")
+            size = os.path.getsize(path)
+            if size > self.max_bytes:
+                raise ToolExecutionError(
+                    f"差分が大きすぎます（{size} バイト、上限 {self.max_bytes} バイト: GH_PROXY_DIFF_MAX_BYTES）"
+                )
+            files = index_diff(path)
+            pages: List[Tuple[int, int]] = []
+            if size:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    pages = split_pages(mm, 0, size, [item["start"] for item in files], self.page_bytes)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+        entry = self._Entry(path, size, files, pages)
+        key = (repo.lower(), number)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self._discard(old)
+            self.entries[key] = entry
+            self.bytes += size
+            self.spills += 1
+            self._evict()
+        return entry
+
+    def open(self, repo: str, number: int, refresh: bool = False) -> Tuple["DiffStore._Entry", Any]:
+        """
+        PR の差分とその一時ファイルを開いたファイルオブジェクトを取得
+
+        有効期間内の差分があればそれを使い、なければ gh pr diff を実行する（同じ PR への同時の
+        要求は1回の実行にまとめる）。ファイルは削除と競合しないようロックを保持したまま開く。
+        """
+        key = (repo.lower(), number)
+        for _ in range(2):
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and not refresh and time.monotonic() - entry.fetched < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, open(entry.path, "rb")
+            entry = gh_single_flight.run(("pr-diff", key[0], str(number)), lambda: self._spill(repo, number))
+            with self.lock:
+                if self.entries.get(key) is entry:
+                    return entry, open(entry.path, "rb")
+            # 読み出す前に削除された場合はもう一度取得する
+            refresh = False
+        raise ToolExecutionError("差分を保持できませんでした。GH_PROXY_DIFF_MAX_BYTES を見直してください")
+
+    def stats(self) -> Dict[str, int]:
+        """保持している差分の数と合計サイズ、gh の実行回数と再利用した回数"""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "spills": self.spills,
+                "hits": self.hits
+            }
+
+
+# PR の差分の一時ファイルストア
+diff_store = DiffStore(DIFF_PAGE_BYTES, DIFF_TTL, DIFF_MAX_BYTES)
+
+
+def execute_gh_pr_diff(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    gh_pr_diff ツールの実行
+
+    最初の content は差分の索引（1ページ目の場合は変更ファイルごとの追加・削除行数と
+    そのファイルが始まるページの一覧を含む）、2番目の content は要求されたページの差分。
+    """
+    number = arguments["number"]
+    path = arguments.get("path")
+    page = arguments.get("page", 1)
+    entry, f = diff_store.open(repo, number, arguments.get("refresh", False))
+    with f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if entry.size else b""
+        try:
+            pages = entry.pages
+            if path is not None:
+                file = next((item for item in entry.files if item["path"] == path), None)
+                if file is None:
+                    raise ToolExecutionError(f"{path} は PR #{number} の差分に含まれていません")
+                pages = split_pages(mm, file["start"], file["end"], [], diff_store.page_bytes)
+            if page > max(len(pages), 1):
+                raise ToolExecutionError(f"page には {len(pages)} 以下を指定してください")
+            text = mm[pages[page - 1][0]:pages[page - 1][1]].decode("utf-8", "replace") if pages else ""
+        finally:
+            if entry.size:
+                mm.close()
+
+    index: Dict[str, Any] = {
+        "number": number,
+        "page": page,
+        "totalPages": max(len(pages), 1),
+        "bytes": pages[-1][1] - pages[0][0] if pages else 0
+    }
+    if path is not None:
+        index["path"] = path
+    elif page == 1:
+        starts = [start for start, _ in entry.pages]
+        index["files"] = [{
+            "path": item["path"],
+            "additions": item["additions"],
+            "deletions": item["deletions"],
+            "page": bisect.bisect_right(starts, item["start"])
+        } for item in entry.files]
+        index["additions"] = sum(item["additions"] for item in entry.files)
+        index["deletions"] = sum(item["deletions"] for item in entry.files)
+    return gh_json_text(index) + [{"type": "text", "text": text}]
+
+
+# ローカル全文検索インデックス（GH_PROXY_INDEX_REPOS を指定した場合のみ）
+local_index: Optional[LocalIndex] = LocalIndex(INDEX_PATH, INDEX_TOKENIZER) if INDEX_REPOS else None
+index_syncer: Optional[IndexSyncer] = IndexSyncer(
+    local_index, INDEX_REPOS, INDEX_INTERVAL
+) if local_index is not None else None
+
+
+class CompiledTool:
+    """起動時にコンパイルしたツール（検証関数と実行関数）"""
+
+    def __init__(self, definition: Dict[str, Any], handler: Callable[[str, Dict[str, Any]], List[Dict[str, Any]]]):
+        self.name = definition["name"]
+        self.definition = definition
+        self.validate = compile_validator(definition["inputSchema"])
+        self.handler = handler
+
+
+def compile_tool_registry(tools: List[Dict[str, Any]],
+                          handlers: Dict[str, Callable[[str, Dict[str, Any]], List[Dict[str, Any]]]]) -> Dict[str, CompiledTool]:
+    """ツール定義と実行関数からツール名で引けるレジストリを生成"""
+    registry = {}
+    for definition in tools:
+        name = definition["name"]
+        if name not in handlers:
+            raise RuntimeError(f"ツールの実行関数が定義されていません: {name}")
+        registry[name] = CompiledTool(definition, handlers[name])
+    return registry
+
+
+# ツール名と実行関数の対応（gh コマンドで実行するツールは HTTP バックエンドでは API に直接接続する）
+TOOL_HANDLERS: Dict[str, Callable[[str, Dict[str, Any]], List[Dict[str, Any]]]] = {
+    name: HTTP_TOOL_HANDLERS[name] if BACKEND == "http" and name in HTTP_TOOL_HANDLERS else tool
+    for name, tool in GH_CLI_TOOLS.items()
+}
+TOOL_HANDLERS.update({
+    "gh_pr_bundle": execute_gh_pr_bundle,
+    "gh_issue_bundle": execute_gh_issue_bundle,
+    "gh_pr_bundle_multi": execute_gh_pr_bundle_multi,
+    "gh_pr_list_page": lambda repo, arguments: execute_gh_list_page(repo, arguments, "gh_pr_list_page"),
+    "gh_issue_list_page": lambda repo, arguments: execute_gh_list_page(repo, arguments, "gh_issue_list_page"),
+    "gh_search_local": execute_gh_search_local,
+    "gh_changes_since": execute_gh_changes_since,
+    "gh_pr_diff": execute_gh_pr_diff,
+    "gh_multi_pr_list": lambda repo, arguments: execute_gh_multi_list(repo, arguments, "gh_multi_pr_list"),
+    "gh_multi_issue_list": lambda repo, arguments: execute_gh_multi_list(repo, arguments, "gh_multi_issue_list"),
+})
+
+# 起動時にコンパイルしたツールレジストリ
+TOOL_REGISTRY = compile_tool_registry(TOOLS, TOOL_HANDLERS)
+
+
+def truncate_bodies(value: Any, max_length: int) -> Any:
+    """body フィールドの文字列を max_length 文字で切り詰める（コメントなどネストした要素も対象）"""
+    if isinstance(value, list):
+        return [truncate_bodies(item, max_length) for item in value]
+    if not isinstance(value, dict):
+        return value
+    truncated = {}
+    for key, item in value.items():
+        if key == "body" and isinstance(item, str) and len(item) > max_length:
+            truncated[key] = f"{item[:max_length]}\n…（以下 {len(item) - max_length} 文字省略）"
+        else:
+            truncated[key] = truncate_bodies(item, max_length)
+    return truncated
+
+
+def truncate_content(content: List[Dict[str, Any]], max_length: int) -> List[Dict[str, Any]]:
+    """content の各 JSON テキストに含まれる本文を切り詰める"""
+    result = []
+    for item in content:
+        try:
+            data = json.loads(item["text"])
+        except (KeyError, ValueError):
+            result.append(item)
+            continue
+        result.extend(gh_json_text(truncate_bodies(data, max_length)))
+    return result
+
+
+def execute_tool(tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    ツールを実行
+
+    Args:
+        tool_name: ツール名
+        arguments: ツール引数
+
+    Returns:
+        MCP content 形式の結果リスト
+    """
+    tool = TOOL_REGISTRY.get(tool_name)
+    if tool is None:
+        raise ValidationError(f"未知のツール: {tool_name}")
+
+    # 複数リポジトリのツールは owner / repository_name ではなく repositories で対象を受け取る
+    repo = f"{arguments['owner']}/{arguments['repository_name']}" if "owner" in arguments else ""
+
+    content = tool.handler(repo, arguments)
+    if "max_body_length" in arguments:
+        content = truncate_content(content, arguments["max_body_length"])
+    return content
+
+
+class ResponseCache:
+    """
+    ツール実行結果のインメモリキャッシュ
+
+    キーはツール名と正規化した引数。ツールごとの TTL で失効し、
+    本文の合計サイズが上限を超えると最も古く使われたエントリから破棄する。
+    """
+
+    def __init__(self, max_bytes: int, ttls: Dict[str, int]):
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.lock = threading.Lock()
+        # key -> (expires_at, repo, size, content)
+        self.entries: "collections.OrderedDict[str, Tuple[float, str, int, List[Dict[str, Any]]]]" = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits: Dict[str, int] = collections.defaultdict(int)
+        self.misses: Dict[str, int] = collections.defaultdict(int)
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+        """ツール名と引数からキャッシュキーを生成（owner/repository_nameは大文字小文字を区別しない）"""
+        normalized = {k: v for k, v in arguments.items() if k != "refresh"}
+        for field in ("owner", "repository_name"):
+            if isinstance(normalized.get(field), str):
+                normalized[field] = normalized[field].lower()
+        return tool_name + ":" + json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+    @staticmethod
+    def repo_of(arguments: Dict[str, Any]) -> str:
+        """引数から owner/repository_name 形式のリポジトリ名を取得"""
+        return f"{arguments.get('owner', '')}/{arguments.get('repository_name', '')}".lower()
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return self.ttls.get(tool_name, 0) > 0
+
+    def get(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """有効なエントリがあれば返す"""
+        key = self.make_key(tool_name, arguments)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses[tool_name] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits[tool_name] += 1
+            return entry[3]
+
+    def put(self, tool_name: str, arguments: Dict[str, Any], content: List[Dict[str, Any]]) -> None:
+        """実行結果を保存"""
+        size = sum(len(item.get("text", "")) for item in content)
+        if size > self.max_bytes:
+            return
+        key = self.make_key(tool_name, arguments)
+        expires_at = time.monotonic() + self.ttls[tool_name]
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (expires_at, self.repo_of(arguments), size, content)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def age(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[float]:
+        """有効なエントリが保存されてからの経過秒数（エントリがなければ None、ヒット数には数えない）"""
+        key = self.make_key(tool_name, arguments)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= now:
+                return None
+            return now - (entry[0] - self.ttls[tool_name])
+
+    def invalidate(self, repo: Optional[str] = None) -> int:
+        """指定リポジトリ（Noneの場合は全体）のエントリを破棄し、破棄した件数を返す"""
+        with self.lock:
+            if repo is None:
+                keys = list(self.entries)
+            else:
+                repo = repo.lower()
+                keys = [key for key, entry in self.entries.items() if entry[1] == repo]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミス数などの統計情報"""
+        with self.lock:
+            tools = sorted(set(self.hits) | set(self.misses))
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "tools": {
+                    name: {"hits": self.hits[name], "misses": self.misses[name], "ttl": self.ttls.get(name, 0)}
+                    for name in tools
+                }
+            }
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry[2]
+
+
+# グローバルレスポンスキャッシュ
+response_cache = ResponseCache(CACHE_MAX_BYTES, CACHE_TTLS)
+
+
+class DiskCache:
+    """
+    ツール実行結果の SQLite キャッシュ
+
+    プロセス再起動後も結果を保持する。各エントリには対応する REST リソースの
+    ETag を記録し、有効期間を過ぎたエントリは If-None-Match 付きリクエストで再検証する。
+    """
+
+    def __init__(self, path: str, ttls: Dict[str, int]):
+        self.ttls = ttls
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                endpoint TEXT,
+                etag TEXT,
+                content TEXT NOT NULL,
+                validated_at REAL NOT NULL
+            )
+            """
         )
-        return result.stdout, result.stderr, result.returncode
-    except subprocess.TimeoutExpired:
-        raise ToolExecutionError(f"コマンド実行がタイムアウトしました（{timeout}秒）")
-    except FileNotFoundError:
-        raise ToolExecutionError("gh コマンドが見つかりません。GitHub CLI をインストールしてください")
-    except Exception as e:
-        raise ToolExecutionError(f"コマンド実行中にエラーが発生しました: {str(e)}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_repo ON entries (repo)")
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.modified = 0
 
+    def get(self, key: str) -> Optional[Tuple[Optional[str], Optional[str], List[Dict[str, Any]], float]]:
+        """(endpoint, etag, content, validated_at) を返す"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT endpoint, etag, content, validated_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]), row[3]
 
-def execute_gh_repo_view(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """gh_repo_view ツールの実行"""
-    args = ["repo", "view", repo, "--json", "name,owner,description,url,stargazerCount,forkCount,createdAt,updatedAt"]
-    stdout, stderr, code = execute_gh_command(args)
+    def put(self, key: str, tool_name: str, repo: str, endpoint: Optional[str], etag: Optional[str],
+            content: List[Dict[str, Any]]) -> None:
+        """実行結果を保存"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, tool, repo, endpoint, etag, content, validated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, tool_name, repo, endpoint, etag, json.dumps(content, ensure_ascii=False), time.time())
+            )
 
-    if code != 0:
-        raise ToolExecutionError(f"gh repo view failed: {stderr}")
+    def touch(self, key: str) -> None:
+        """再検証済みとして検証時刻を更新"""
+        with self.lock:
+            self.conn.execute("UPDATE entries SET validated_at = ? WHERE key = ?", (time.time(), key))
 
-    return [{"type": "text", "text": stdout}]
+    def invalidate(self, repo: Optional[str] = None) -> int:
+        """指定リポジトリ（Noneの場合は全体）のエントリを削除し、削除した件数を返す"""
+        with self.lock:
+            if repo is None:
+                cursor = self.conn.execute("DELETE FROM entries")
+            else:
+                cursor = self.conn.execute("DELETE FROM entries WHERE repo = ?", (repo.lower(),))
+            return cursor.rowcount
 
+    def record(self, counter: str) -> None:
+        """統計カウンタを加算"""
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
 
-def execute_gh_pr_list(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """gh_pr_list ツールの実行"""
-    args = ["pr", "list", "--repo", repo, "--json", "number,title,state,author,createdAt,updatedAt"]
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・再検証結果などの統計情報"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "notModified": self.not_modified,
+            "modified": self.modified
+        }
 
-    if "state" in arguments:
-        args.extend(["--state", arguments["state"]])
 
-    if "limit" in arguments:
-        args.extend(["--limit", str(arguments["limit"])])
+def validator_endpoint(tool_name: str, arguments: Dict[str, Any]) -> Optional[str]:
+    """
+    ツール結果の鮮度を確認するための REST エンドポイントを返す
 
-    if "search" in arguments:
-        args.extend(["--search", arguments["search"]])
+    検索クエリ付きの一覧など対応するリソースがない場合は None。
+    """
+    repo = f"{arguments['owner']}/{arguments['repository_name']}"
+    if tool_name == "gh_repo_view":
+        return f"repos/{repo}"
+    if tool_name == "gh_pr_view":
+        return f"repos/{repo}/pulls/{arguments['number']}"
+    if tool_name == "gh_issue_view":
+        return f"repos/{repo}/issues/{arguments['number']}"
+    if tool_name in ("gh_pr_comments", "gh_issue_comments"):
+        # コメント一覧はページ単位の ETag になり、31件目以降の追加を検出できないため、
+        # コメントの追加で updated_at が変わる親の Issue（PR も Issue として参照できる）で再検証する
+        return f"repos/{repo}/issues/{arguments['number']}"
+    if tool_name in ("gh_pr_list", "gh_issue_list") and "search" not in arguments:
+        # merged は closed の一覧で代用する（一覧が変われば ETag も変わるため安全側に倒れる）
+        state = arguments.get("state", "open")
+        if state == "merged":
+            state = "closed"
+        resource = "pulls" if tool_name == "gh_pr_list" else "issues"
+        return f"repos/{repo}/{resource}?state={state}&per_page={arguments.get('limit', 30)}"
+    return None
 
-    stdout, stderr, code = execute_gh_command(args)
 
-    if code != 0:
-        raise ToolExecutionError(f"gh pr list failed: {stderr}")
+def parse_http_status_and_etag(output: str) -> Tuple[Optional[int], Optional[str]]:
+    """gh api -i の出力からステータスコードと ETag ヘッダーを取り出す"""
+    lines = output.splitlines()
+    if not lines or not lines[0].startswith("HTTP/"):
+        return None, None
+    try:
+        status = int(lines[0].split()[1])
+    except (IndexError, ValueError):
+        return None, None
+    etag = None
+    for line in lines[1:]:
+        if not line.strip():
+            break
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "etag":
+            etag = value.strip()
+    return status, etag
 
-    return [{"type": "text", "text": stdout}]
 
+def fetch_etag(endpoint: str, etag: Optional[str] = None) -> Tuple[Optional[int], Optional[str]]:
+    """
+    gh api でリソースの ETag を取得
 
-def execute_gh_pr_view(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """gh_pr_view ツールの実行"""
-    number = arguments["number"]
-    args = ["pr", "view", str(number), "--repo", repo, "--json", "number,title,body,state,author,createdAt,updatedAt,mergeable,mergedAt"]
+    etag を指定した場合は If-None-Match 付きで問い合わせる。変更がなければ 304 が返り、
+    レート制限にはカウントされない。取得に失敗した場合は (None, None) を返す。
+    """
+    if BACKEND == "http":
+        headers = {"If-None-Match": etag} if etag else {}
+        try:
+            status, response_headers, _ = github_client.request("GET", "/" + endpoint, headers=headers)
+        except ToolExecutionError:
+            return None, None
+        return status, response_headers.get("etag")
 
-    stdout, stderr, code = execute_gh_command(args)
+    args = ["api", "-i", endpoint]
+    if etag:
+        args.extend(["-H", f"If-None-Match: {etag}"])
+    try:
+        # 304 でも gh は非ゼロで終了するため、終了コードではなく出力のステータス行で判定する
+        stdout, _, _ = execute_gh_command(args)
+    except ToolExecutionError:
+        return None, None
+    return parse_http_status_and_etag(stdout)
 
-    if code != 0:
-        raise ToolExecutionError(f"gh pr view failed: {stderr}")
 
-    return [{"type": "text", "text": stdout}]
+# グローバルディスクキャッシュ（GH_PROXY_DISK_CACHE 指定時のみ）
+disk_cache: Optional[DiskCache] = DiskCache(DISK_CACHE_PATH, CACHE_TTLS) if DISK_CACHE_PATH else None
 
 
-def execute_gh_issue_list(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """gh_issue_list ツールの実行"""
-    args = ["issue", "list", "--repo", repo, "--json", "number,title,state,author,createdAt,updatedAt"]
+def execute_tool_persistent(tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    ディスクキャッシュを経由してツールを実行
 
-    if "state" in arguments:
-        args.extend(["--state", arguments["state"]])
+    有効期間内のエントリはそのまま返す。期限切れのエントリは ETag で再検証し、
+    304 であれば gh のツール実行を行わずに保存済みの結果を返す。
 
-    if "limit" in arguments:
-        args.extend(["--limit", str(arguments["limit"])])
+    ETag はツールの実行（gh pr view --json など）とは別の gh api 呼び出しでしか得られないため、
+    初回の取得では ETag を保存せず有効期間だけで管理する。ETag のないエントリが期限切れ後に再び参照された場合にのみ
+    ETag を取得し、以降は 304 で済ませる。再検証で 304 以外が返った場合はその応答の ETag を使う。
+    """
+    key = ResponseCache.make_key(tool_name, arguments)
+    endpoint = validator_endpoint(tool_name, arguments)
+    entry = None if arguments.get("refresh", False) else disk_cache.get(key)
 
-    if "search" in arguments:
-        args.extend(["--search", arguments["search"]])
+    new_etag = None
+    if entry is not None:
+        _, old_etag, content, validated_at = entry
+        if time.time() - validated_at < disk_cache.ttls[tool_name]:
+            disk_cache.record("hits")
+            annotate_trace(cache="disk")
+            return content
+        if endpoint and old_etag:
+            status, new_etag = fetch_etag(endpoint, old_etag)
+            if status == 304:
+                disk_cache.record("not_modified")
+                disk_cache.touch(key)
+                annotate_trace(cache="not_modified")
+                return content
+            disk_cache.record("modified")
+        elif endpoint:
+            # 期限切れ後にも参照されたエントリなので、次回から再検証できるよう ETag を取得する
+            # （ツール実行より前に取得し、間に更新があっても次回の再検証で検出できるようにする）
+            _, new_etag = fetch_etag(endpoint)
+    else:
+        disk_cache.record("misses")
 
-    stdout, stderr, code = execute_gh_command(args)
+    content = execute_tool(tool_name, arguments)
+    disk_cache.put(key, tool_name, ResponseCache.repo_of(arguments), endpoint, new_etag, content)
+    return content
 
-    if code != 0:
-        raise ToolExecutionError(f"gh issue list failed: {stderr}")
 
-    return [{"type": "text", "text": stdout}]
+def execute_tool_cached(tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    キャッシュを経由してツールを実行
 
+    メモリキャッシュ、ディスクキャッシュ（有効な場合）の順に参照する。
+    引数 refresh が true の場合はキャッシュを参照せずに実行し、結果でキャッシュを更新する。
+    エラー結果はキャッシュしない。
+    """
+    if not CACHE_ENABLED or not response_cache.is_cacheable(tool_name):
+        return execute_tool(tool_name, arguments)
 
-def execute_gh_issue_view(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """gh_issue_view ツールの実行"""
-    number = arguments["number"]
-    args = ["issue", "view", str(number), "--repo", repo, "--json", "number,title,body,state,author,createdAt,updatedAt"]
+    if prefetcher is not None:
+        prefetcher.record(tool_name, arguments)
 
-    stdout, stderr, code = execute_gh_command(args)
+    if not arguments.get("refresh", False):
+        content = response_cache.get(tool_name, arguments)
+        if content is not None:
+            annotate_trace(cache="hit")
+            return content
 
-    if code != 0:
-        raise ToolExecutionError(f"gh issue view failed: {stderr}")
+    annotate_trace(cache="miss")
+    return fetch_and_cache(tool_name, arguments)
 
-    return [{"type": "text", "text": stdout}]
 
+def fetch_and_cache(tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """メモリキャッシュを参照せずにツールを実行し、結果をキャッシュに保存"""
+    if disk_cache is not None:
+        content = execute_tool_persistent(tool_name, arguments)
+    else:
+        content = execute_tool(tool_name, arguments)
+    response_cache.put(tool_name, arguments, content)
+    return content
 
-def execute_gh_pr_comments(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """gh_pr_comments ツールの実行"""
-    number = arguments["number"]
-    args = ["pr", "view", str(number), "--repo", repo, "--json", "comments"]
 
-    stdout, stderr, code = execute_gh_command(args)
+class Prefetcher:
+    """
+    アクセス頻度に基づくキャッシュのバックグラウンド更新
 
-    if code != 0:
-        raise ToolExecutionError(f"gh pr view failed: {stderr}")
+    対象ツールの呼び出しごと（ツール名と正規化した引数）にアクセス回数を記録し、
+    半減期で減衰させたスコアの上位について、TTL の8割（freshness 秒の方が長い場合は freshness 秒）より
+    古くなった（または失効した）キャッシュエントリをバックグラウンドで取得し直す。
+    同時実行数と1分あたりの呼び出し回数の上限を超える更新は次の周期に回す。
+    """
 
-    return [{"type": "text", "text": stdout}]
+    # 記録する呼び出しの上限（超えた場合はスコアの最も低いものを破棄）
+    MAX_TRACKED = 1000
 
+    def __init__(self, tools: List[str], top: int, freshness: float, half_life: float, min_score: float,
+                 concurrency: int, calls_per_minute: int, interval: float):
+        self.tools = frozenset(tools)
+        self.top = top
+        self.freshness = freshness
+        self.half_life = half_life
+        self.min_score = min_score
+        self.calls_per_minute = calls_per_minute
+        self.interval = interval
+        self.lock = threading.Lock()
+        # key -> [スコア, 最終アクセス時刻, ツール名, 引数]
+        self.tracked: Dict[str, List[Any]] = {}
+        self.in_progress = set()
+        self.call_times: "collections.deque[float]" = collections.deque()
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency,
+            thread_name_prefix="gh-proxy-prefetch"
+        )
+        self.refreshed = 0
+        self.failed = 0
+        self.deferred = 0
 
-def execute_gh_issue_comments(repo: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """gh_issue_comments ツールの実行"""
-    number = arguments["number"]
-    args = ["issue", "view", str(number), "--repo", repo, "--json", "comments"]
+    def _decayed(self, entry: List[Any], now: float) -> float:
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
 
-    stdout, stderr, code = execute_gh_command(args)
+    def record(self, tool_name: str, arguments: Dict[str, Any]) -> None:
+        """アクセスを記録"""
+        if tool_name not in self.tools:
+            return
+        key = ResponseCache.make_key(tool_name, arguments)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.tracked.get(key)
+            if entry is None:
+                if len(self.tracked) >= self.MAX_TRACKED:
+                    coldest = min(self.tracked, key=lambda k: self._decayed(self.tracked[k], now))
+                    del self.tracked[coldest]
+                arguments = {k: v for k, v in arguments.items() if k != "refresh"}
+                entry = self.tracked[key] = [0.0, now, tool_name, arguments]
+            entry[0] = self._decayed(entry, now) + 1
+            entry[1] = now
 
-    if code != 0:
-        raise ToolExecutionError(f"gh issue view failed: {stderr}")
+    def hot(self) -> List[Tuple[str, float, str, Dict[str, Any]]]:
+        """スコアの高い順に更新対象の (key, スコア, ツール名, 引数) を返す"""
+        now = time.monotonic()
+        with self.lock:
+            scored = [
+                (key, self._decayed(entry, now), entry[2], entry[3])
+                for key, entry in self.tracked.items()
+            ]
+        scored = [item for item in scored if item[1] >= self.min_score]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:self.top]
 
-    return [{"type": "text", "text": stdout}]
+    def _take_budget(self) -> bool:
+        """1分あたりの呼び出し回数の上限内であれば1回分を確保する"""
+        now = time.monotonic()
+        with self.lock:
+            while self.call_times and self.call_times[0] <= now - 60:
+                self.call_times.popleft()
+            if len(self.call_times) >= self.calls_per_minute:
+                return False
+            self.call_times.append(now)
+            return True
 
+    def run_once(self) -> int:
+        """更新が必要なエントリの取得を開始し、開始した件数を返す"""
+        started = 0
+        for key, _, tool_name, arguments in self.hot():
+            with self.lock:
+                if key in self.in_progress:
+                    continue
+            age = response_cache.age(tool_name, arguments)
+            # 失効の少し前に更新する（freshness はアクセスの多いエントリを更新しすぎないための下限）
+            if age is not None and age < max(self.freshness, response_cache.ttls[tool_name] * 0.8):
+                continue
+            if not self.slots.acquire(blocking=False):
+                with self.lock:
+                    self.deferred += 1
+                break
+            if not self._take_budget():
+                self.slots.release()
+                with self.lock:
+                    self.deferred += 1
+                break
+            with self.lock:
+                self.in_progress.add(key)
+            self.executor.submit(self._refresh, key, tool_name, arguments)
+            started += 1
+        return started
 
-def execute_tool(tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """
-    ツールを実行
+    def _refresh(self, key: str, tool_name: str, arguments: Dict[str, Any]) -> None:
+        _request_context.tool = tool_name
+        _request_context.priority = GitHubScheduler.BACKGROUND
+        try:
+            fetch_and_cache(tool_name, dict(arguments, refresh=True))
+            with self.lock:
+                self.refreshed += 1
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            print(f"prefetch failed: {tool_name} {arguments}: {e}", file=sys.stderr)
+        finally:
+            _request_context.tool = ""
+            _request_context.priority = None
+            with self.lock:
+                self.in_progress.discard(key)
+            self.slots.release()
 
-    Args:
-        tool_name: ツール名
-        arguments: ツール引数
+    def start(self) -> None:
+        """更新スレッドを開始"""
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"prefetch error: {e}", file=sys.stderr)
 
-    Returns:
-        MCP content 形式の結果リスト
-    """
-    owner = arguments["owner"]
-    repo_name = arguments["repository_name"]
-    repo = f"{owner}/{repo_name}"
+        threading.Thread(target=loop, name="gh-proxy-prefetcher", daemon=True).start()
 
-    if tool_name == "gh_repo_view":
-        return execute_gh_repo_view(repo, arguments)
-    elif tool_name == "gh_pr_list":
-        return execute_gh_pr_list(repo, arguments)
-    elif tool_name == "gh_pr_view":
-        return execute_gh_pr_view(repo, arguments)
-    elif tool_name == "gh_issue_list":
-        return execute_gh_issue_list(repo, arguments)
-    elif tool_name == "gh_issue_view":
-        return execute_gh_issue_view(repo, arguments)
-    elif tool_name == "gh_pr_comments":
-        return execute_gh_pr_comments(repo, arguments)
-    elif tool_name == "gh_issue_comments":
-        return execute_gh_issue_comments(repo, arguments)
-    else:
-        raise ValidationError(f"未知のツール: {tool_name}")
+    def stats(self) -> Dict[str, Any]:
+        """更新回数と現在の上位の呼び出し"""
+        with self.lock:
+            counts = {
+                "tracked": len(self.tracked),
+                "refreshed": self.refreshed,
+                "failed": self.failed,
+                "deferred": self.deferred,
+                "inProgress": len(self.in_progress),
+            }
+        return {
+            **counts,
+            "hot": [
+                {"tool": tool_name, "arguments": arguments, "score": round(score, 2)}
+                for _, score, tool_name, arguments in self.hot()
+            ]
+        }
+
+
+# バックグラウンド更新（GH_PROXY_PREFETCH=1 かつキャッシュが有効な場合のみ）
+prefetcher: Optional[Prefetcher] = Prefetcher(
+    ["gh_pr_list", "gh_issue_list", "gh_repo_view"],
+    PREFETCH_TOP, PREFETCH_FRESHNESS, PREFETCH_HALF_LIFE, PREFETCH_MIN_SCORE,
+    max(1, PREFETCH_CONCURRENCY // WORKER_SHARE), max(1, PREFETCH_CALLS_PER_MINUTE // WORKER_SHARE), PREFETCH_INTERVAL
+) if PREFETCH_ENABLED and CACHE_ENABLED else None
 
 
 def handle_initialize(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -507,22 +4218,118 @@ def handle_tools_call(params: Dict[str, Any]) -> Dict[str, Any]:
         raise ValidationError("ツール名が指定されていません")
 
     tool_name = params["name"]
+    if not isinstance(tool_name, str):
+        raise ValidationError("ツール名は文字列である必要があります")
     arguments = params.get("arguments", {})
+    if not isinstance(arguments, dict):
+        raise ValidationError("arguments はオブジェクトである必要があります")
+    label = tool_label(tool_name)
+    metrics.inc("gh_proxy_tool_calls_total", tool=label)
 
     # 引数検証
-    validate_arguments(tool_name, arguments)
+    started = time.monotonic()
+    try:
+        with span("validation"):
+            validate_arguments(tool_name, arguments)
+    except ValidationError:
+        metrics.inc("gh_proxy_tool_errors_total", tool=label, type="validation")
+        raise
+    finally:
+        metrics.observe("gh_proxy_phase_seconds", time.monotonic() - started, tool=label, phase="validation")
+    if cassette is not None:
+        cassette.record_call(tool_name, arguments)
 
     # ツール実行
+    _request_context.tool = tool_name
+    _request_context.queue_wait = 0.0
+    _request_context.scheduled = False
+    started = time.monotonic()
     try:
-        content = execute_tool(tool_name, arguments)
-        return {
+        content = execute_tool_cached(tool_name, arguments)
+        return with_schedule_meta({
             "content": content
-        }
+        })
     except ToolExecutionError as e:
-        return {
+        error_type = "cancelled" if isinstance(e, RequestCancelledError) else "execution"
+        metrics.inc("gh_proxy_tool_errors_total", tool=tool_name, type=error_type)
+        result = {
             "content": [{"type": "text", "text": f"エラー: {str(e)}"}],
             "isError": True
         }
+        if isinstance(e, RateLimitedError):
+            result["_meta"] = {"retryAfter": int(e.retry_after) + 1}
+        return with_schedule_meta(result)
+    except Exception:
+        metrics.inc("gh_proxy_tool_errors_total", tool=tool_name, type="internal")
+        raise
+    finally:
+        _request_context.tool = ""
+        metrics.observe("gh_proxy_phase_seconds", time.monotonic() - started, tool=tool_name, phase="execution")
+
+
+def with_schedule_meta(result: Dict[str, Any]) -> Dict[str, Any]:
+    """gh / API を呼び出した場合は、スケジューラーでの待ち時間と残りクォータを _meta に追加"""
+    if not getattr(_request_context, "scheduled", False):
+        return result
+    meta = result.setdefault("_meta", {})
+    meta["queueWaitMs"] = round(_request_context.queue_wait * 1000, 1)
+    if gh_scheduler.remaining is not None:
+        meta["rateLimitRemaining"] = gh_scheduler.remaining
+    return result
+
+
+def handle_cache_stats(params: Dict[str, Any]) -> Dict[str, Any]:
+    """cache/stats メソッドの処理（gh-proxy 独自拡張）"""
+    stats = response_cache.stats()
+    if disk_cache is not None:
+        stats["disk"] = disk_cache.stats()
+    if prefetcher is not None:
+        stats["prefetch"] = prefetcher.stats()
+    if index_syncer is not None:
+        stats["index"] = index_syncer.stats()
+    stats["diff"] = diff_store.stats()
+    if cassette is not None:
+        stats["cassette"] = cassette.stats()
+    return stats
+
+
+def handle_cache_invalidate(params: Dict[str, Any]) -> Dict[str, Any]:
+    """cache/invalidate メソッドの処理（gh-proxy 独自拡張）"""
+    repo = None
+    if "owner" in params or "repository_name" in params:
+        if "owner" not in params or "repository_name" not in params:
+            raise ValidationError("owner と repository_name は両方指定する必要があります")
+        repo = ResponseCache.repo_of(params)
+    invalidated = response_cache.invalidate(repo)
+    if disk_cache is not None:
+        invalidated += disk_cache.invalidate(repo)
+    return {"invalidated": invalidated}
+
+
+def handle_gh_stats(params: Dict[str, Any]) -> Dict[str, Any]:
+    """gh/stats メソッドの処理（gh-proxy 独自拡張）"""
+    stats = gh_single_flight.stats()
+    stats["scheduler"] = gh_scheduler.stats()
+    stats["inFlightRequests"] = len(in_flight_requests)
+    if WORKER_ID is not None:
+        stats["worker"] = {"id": int(WORKER_ID), "pid": os.getpid()}
+    return stats
+
+
+def handle_cancelled(params: Dict[str, Any], session: str) -> Dict[str, Any]:
+    """
+    notifications/cancelled 通知の処理
+
+    requestId が一致する実行中の tools/call をキャンセルし、実行中の gh プロセスを強制終了する。
+    既に完了したリクエストや未知の id は無視する。
+    """
+    if not isinstance(params, dict) or "requestId" not in params:
+        raise ValidationError("requestId が指定されていません")
+    cancelled = in_flight_requests.cancel(session, params["requestId"])
+    if cancelled:
+        metrics.inc("gh_proxy_cancelled_requests_total", cancelled, reason="notification")
+        print(f"request cancelled: id={params['requestId']} reason={params.get('reason', '')}", file=sys.stderr)
+    return {"cancelled": cancelled}
 
 
 def create_error_response(request_id: Any, code: int, message: str, data: Any = None) -> Dict[str, Any]:
@@ -551,8 +4358,23 @@ def create_success_response(request_id: Any, result: Any) -> Dict[str, Any]:
     }
 
 
-def handle_jsonrpc_request(request: Dict[str, Any]) -> Dict[str, Any]:
-    """JSON-RPCリクエストを処理"""
+# handle_jsonrpc_request が処理するメソッド
+METHODS = frozenset({
+    "initialize", "tools/list", "tools/call", "notifications/cancelled",
+    "cache/stats", "cache/invalidate", "gh/stats",
+})
+
+
+def handle_jsonrpc_request(request: Dict[str, Any], session: str = "",
+                           connection: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """
+    JSON-RPCリクエストを処理
+
+    Args:
+        request: JSON-RPC リクエスト
+        session: Mcp-Session-Id ヘッダーの値（notifications/cancelled の対象を特定するために使用）
+        connection: HTTP リクエスト単位のキャンセル通知（クライアントの切断時にキャンセルされる）
+    """
     # JSON-RPC 2.0 の基本検証
     if request.get("jsonrpc") != "2.0":
         return create_error_response(
@@ -566,6 +4388,7 @@ def handle_jsonrpc_request(request: Dict[str, Any]) -> Dict[str, Any]:
     params = request.get("params", {})
 
     print(f'method={method}, params={json.dumps(params)}', file=sys.stderr)
+    metrics.inc("gh_proxy_requests_total", method=method_label(method))
 
     if not method:
         return create_error_response(
@@ -581,7 +4404,20 @@ def handle_jsonrpc_request(request: Dict[str, Any]) -> Dict[str, Any]:
         elif method == "tools/list":
             result = handle_tools_list(params)
         elif method == "tools/call":
-            result = handle_tools_call(params)
+            with in_flight_requests.track(session, request_id, connection) as token:
+                _request_context.cancel = token
+                try:
+                    result = handle_tools_call(params)
+                finally:
+                    _request_context.cancel = None
+        elif method == "notifications/cancelled":
+            result = handle_cancelled(params, session)
+        elif method == "cache/stats":
+            result = handle_cache_stats(params)
+        elif method == "cache/invalidate":
+            result = handle_cache_invalidate(params)
+        elif method == "gh/stats":
+            result = handle_gh_stats(params)
         else:
             return create_error_response(
                 request_id,
@@ -605,9 +4441,88 @@ def handle_jsonrpc_request(request: Dict[str, Any]) -> Dict[str, Any]:
         )
 
 
-def application(environ: Dict[str, Any], start_response) -> List[bytes]:
-    """WSGI アプリケーション"""
-    # POSTメソッドのみ許可
+# バッチリクエストのエントリを処理するワーカープール
+batch_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=BATCH_WORKERS,
+    thread_name_prefix="gh-proxy-batch"
+)
+
+
+def is_notification(request: Any) -> bool:
+    """id を持たない JSON-RPC 通知かどうか"""
+    return isinstance(request, dict) and "id" not in request
+
+
+def handle_jsonrpc_entry(request: Any, session: str = "",
+                         connection: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """バッチ内の1エントリを処理（オブジェクトでないエントリは Invalid Request）"""
+    if not isinstance(request, dict):
+        return create_error_response(None, INVALID_REQUEST, "リクエストはオブジェクトである必要があります")
+    return handle_jsonrpc_request(request, session, connection)
+
+
+def handle_jsonrpc_batch(requests: List[Any], session: str = "",
+                         connection: Optional[CancelToken] = None) -> List[Dict[str, Any]]:
+    """
+    JSON-RPCバッチリクエストを処理
+
+    各エントリはワーカープールで並行に処理し、レスポンスはリクエストの順序で返す。
+    通知（id なし）のレスポンスは含めない。
+    """
+    trace = current_trace()
+
+    def handle(request: Any) -> Dict[str, Any]:
+        _request_context.trace = trace
+        try:
+            with span("entry", method=response_label(request)):
+                return handle_jsonrpc_entry(request, session, connection)
+        finally:
+            _request_context.trace = None
+
+    responses = batch_executor.map(handle, requests)
+    return [
+        response
+        for request, response in zip(requests, responses)
+        if not is_notification(request)
+    ]
+
+
+def application(environ: Dict[str, Any], start_response) -> Iterator[bytes]:
+    """WSGI アプリケーション（POST リクエストごとにトレースを記録する）"""
+    path = environ.get("PATH_INFO", "")
+    if path.startswith("/debug/"):
+        return handle_debug(environ, start_response)
+
+    trace = tracer.begin(environ["REQUEST_METHOD"], path) if environ["REQUEST_METHOD"] == "POST" else None
+    if trace is None:
+        return dispatch_request(environ, start_response)
+    _request_context.trace = trace
+    try:
+        chunks = dispatch_request(environ, start_response)
+    except BaseException:
+        tracer.finish(trace)
+        raise
+    finally:
+        _request_context.trace = None
+    if isinstance(chunks, list):
+        tracer.finish(trace)
+        return chunks
+    # SSE の応答は送出が終わるまでトレースを続ける
+    return tracer.follow(chunks, trace)
+
+
+def dispatch_request(environ: Dict[str, Any], start_response) -> Iterator[bytes]:
+    """HTTP リクエストの処理"""
+    # メトリクス（GET /metrics）
+    if environ["REQUEST_METHOD"] == "GET" and environ.get("PATH_INFO") == "/metrics":
+        body = metrics.render().encode("utf-8")
+        start_response("200 OK", [
+            ("Content-Type", "text/plain; version=0.0.4; charset=utf-8"),
+            ("Content-Length", str(len(body)))
+        ])
+        return [body]
+
+    # それ以外は POST メソッドのみ許可
     if environ["REQUEST_METHOD"] != "POST":
         start_response("405 Method Not Allowed", [("Content-Type", "text/plain")])
         return [b"Method Not Allowed"]
@@ -620,36 +4535,947 @@ def application(environ: Dict[str, Any], start_response) -> List[bytes]:
 
     # リクエストボディの読み取り
     content_length = int(environ.get("CONTENT_LENGTH", 0))
-    request_body = environ["wsgi.input"].read(content_length)
-    request = json.loads(request_body.decode("utf-8"))
+    try:
+        with span("parse", bytes=content_length):
+            request_body = environ["wsgi.input"].read(content_length)
+            request = json.loads(request_body.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        response = create_error_response(None, PARSE_ERROR, f"JSONの解析に失敗しました: {str(e)}")
+        return json_response(environ, start_response, response)
+    trace = current_trace()
+    if trace is not None:
+        trace.name = response_label(request)
 
-    # JSON-RPCリクエスト処理
-    response = handle_jsonrpc_request(request)
-    response_body = json.dumps(response).encode("utf-8")
+    # notifications/cancelled の対象を特定するセッションと、クライアントの切断を通知するキャンセル通知
+    session = environ.get("HTTP_MCP_SESSION_ID", "")
+    connection = environ.get("gh_proxy.cancel")
 
-    start_response("200 OK", [
-        ("Content-Type", "application/json"),
-        ("Content-Length", str(len(response_body)))
-    ])
+    # JSON-RPCリクエスト処理（配列の場合はバッチ）
+    if isinstance(request, list):
+        if not request:
+            response = create_error_response(None, INVALID_REQUEST, "空のバッチリクエストです")
+        else:
+            response = handle_jsonrpc_batch(request, session, connection)
+            if not response:
+                # 通知のみのバッチにはレスポンス本文を返さない
+                start_response("202 Accepted", [("Content-Length", "0")])
+                return [b""]
+    elif not isinstance(request, dict):
+        response = create_error_response(None, INVALID_REQUEST, "リクエストはオブジェクトである必要があります")
+    elif wants_event_stream(environ, request):
+        params = request["params"]
+        print(f'method=tools/call (stream), params={json.dumps(params)}', file=sys.stderr)
+        # wants_event_stream で STREAMING_TOOLS のツールであることを確認済み
+        label = params["name"]
+        metrics.inc("gh_proxy_requests_total", method="tools/call")
+        metrics.inc("gh_proxy_tool_calls_total", tool=label)
+        started = time.monotonic()
+        try:
+            with span("validation"):
+                validate_arguments(params["name"], params["arguments"])
+                # 200 を返した後では Invalid params を返せないため、cursor もここで検証する
+                arguments = params["arguments"]
+                decode_list_cursor(label, f"{arguments['owner']}/{arguments['repository_name']}", arguments)
+        except ValidationError as e:
+            metrics.inc("gh_proxy_tool_errors_total", tool=label, type="validation")
+            return json_response(environ, start_response, create_error_response(request.get("id"), INVALID_PARAMS, str(e)))
+        start_response("200 OK", [
+            ("Content-Type", "text/event-stream"),
+            ("Cache-Control", "no-cache")
+        ])
+        metrics.observe("gh_proxy_phase_seconds", time.monotonic() - started, tool=label, phase="validation")
+        if cassette is not None:
+            cassette.record_call(params["name"], params["arguments"])
+        return stream_tool_call(request.get("id"), params["name"], params["arguments"], session, connection)
+    else:
+        response = handle_jsonrpc_request(request, session, connection)
+        if is_notification(request):
+            start_response("202 Accepted", [("Content-Length", "0")])
+            return [b""]
+
+    return json_response(environ, start_response, response, response_label(request))
+
+
+def response_label(request: Any) -> str:
+    """レスポンスのメトリクスのラベル（tools/call はツール名、バッチは batch、それ以外はメソッド名）"""
+    if isinstance(request, list):
+        return "batch"
+    if not isinstance(request, dict):
+        return ""
+    params = request.get("params")
+    if request.get("method") == "tools/call" and isinstance(params, dict):
+        return tool_label(params.get("name"))
+    return method_label(request.get("method"))
+
+
+def tool_label(name: Any) -> str:
+    """メトリクスのツール名ラベル（クライアントの入力で系列が増えないよう、未登録のツールは unknown）"""
+    return name if isinstance(name, str) and name in TOOL_REGISTRY else "unknown"
+
+
+def method_label(method: Any) -> str:
+    """メトリクスのメソッド名ラベル（未知のメソッドは unknown）"""
+    return method if isinstance(method, str) and method in METHODS else "unknown"
+
+
+def dump_json(value: Any) -> str:
+    """レスポンス用のコンパクトな JSON 文字列を生成（非 ASCII 文字はエスケープしない）"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def accepts_gzip(environ: Dict[str, Any]) -> bool:
+    """Accept-Encoding で gzip を受け付けているか判定（q=0 は拒否として扱う）"""
+    for coding in environ.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        params = params.strip().replace(" ", "")
+        if not params.startswith("q="):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+# プロファイルの最長時間（秒）
+PROFILE_MAX_SECONDS = 60.0
+# 同時に実行するプロファイルは1つまで
+_profile_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    全スレッドのサンプリングプロファイラー
+
+    cProfile は有効にしたスレッドの呼び出ししか計測できないため、interval 秒ごとに
+    sys._current_frames() で全スレッドのスタックを取得して集計する。
+    関数ごとの自己サンプル数（スタックの先頭にあった回数）と累積サンプル数（スタックに含まれていた回数）、
+    スタックごとのサンプル数を記録する。待機中のスレッドのサンプルは include_idle を指定しない限り除外する。
+    """
+
+    # スタックの先頭がこれらの関数であれば待機中とみなす（ファイル名, 関数名）
+    IDLE_FRAMES = {
+        ("threading.py", "wait"),
+        ("threading.py", "_wait_for_tstate_lock"),
+        ("queue.py", "get"),
+        ("thread.py", "_worker"),
+        ("unix_events.py", "_do_waitpid"),
+        ("subprocess.py", "_try_wait"),
+        ("selectors.py", "select"),
+        ("socketserver.py", "serve_forever"),
+    }
+
+    def __init__(self, interval: float, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.idle = 0
+        self.elapsed = 0.0
+        self.self_counts: "collections.Counter[str]" = collections.Counter()
+        self.total_counts: "collections.Counter[str]" = collections.Counter()
+        self.stacks: "collections.Counter[str]" = collections.Counter()
+        self.labels: Dict[Any, str] = {}
+
+    def run(self, seconds: float, cancel: Optional[CancelToken] = None) -> None:
+        """seconds 秒間（キャンセルされた場合はそれまで）サンプリング"""
+        own = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline and not (cancel is not None and cancel.cancelled):
+            self.sample(own)
+            time.sleep(self.interval)
+        self.elapsed = time.perf_counter() - started
+
+    def sample(self, own: int) -> None:
+        """現在の全スレッド（own を除く）のスタックを1回ずつ記録"""
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if not self.include_idle and (os.path.basename(codes[0].co_filename), codes[0].co_name) in self.IDLE_FRAMES:
+                self.idle += 1
+                continue
+            self.samples += 1
+            labels = [self._label(code) for code in reversed(codes)]
+            self.self_counts[labels[-1]] += 1
+            self.total_counts.update(set(labels))
+            self.stacks[";".join(labels)] += 1
+
+    def _label(self, code: Any) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self.labels[code] = label
+        return label
+
+    def report(self, limit: int) -> Dict[str, Any]:
+        """自己サンプル数・累積サンプル数の上位 limit 件の関数と、サンプル数の上位 limit 件のスタック"""
+        def percent(count: int) -> float:
+            return round(count * 100 / self.samples, 1) if self.samples else 0.0
+
+        def function(label: str) -> Dict[str, Any]:
+            own, total = self.self_counts[label], self.total_counts[label]
+            return {"function": label, "self": own, "selfPercent": percent(own),
+                    "total": total, "totalPercent": percent(total)}
+
+        return {
+            "seconds": round(self.elapsed, 3),
+            "intervalMs": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "idleSamples": self.idle,
+            "functions": [function(label) for label, _ in self.self_counts.most_common(limit)],
+            "cumulative": [function(label) for label, _ in self.total_counts.most_common(limit)],
+            "stacks": [{"stack": stack, "samples": count} for stack, count in self.stacks.most_common(limit)],
+        }
+
+    def collapsed(self) -> str:
+        """flamegraph.pl などで読み込める collapsed 形式（1行に「関数;関数;... サンプル数」）"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def is_loopback_client(environ: Dict[str, Any]) -> bool:
+    """リクエストの送信元がループバックアドレスかどうか"""
+    try:
+        return ipaddress.ip_address(environ.get("REMOTE_ADDR", "")).is_loopback
+    except ValueError:
+        return False
+
+
+def debug_response(start_response, status: str, body: Any) -> List[bytes]:
+    """デバッグ用エンドポイントの応答（文字列はテキスト、それ以外は JSON）"""
+    if isinstance(body, str):
+        content_type = "text/plain; charset=utf-8"
+    else:
+        content_type = "application/json"
+        body = dump_json(body)
+    data = body.encode("utf-8")
+    start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(data)))])
+    return [data]
+
+
+def handle_debug(environ: Dict[str, Any], start_response) -> List[bytes]:
+    """
+    デバッグ用エンドポイント（ループバックアドレスからの GET のみ）
+
+    GET /debug/traces?limit=&min_ms=&name=  直近のトレース（新しい順）
+    GET /debug/profile?seconds=&interval_ms=&limit=&idle=&format=  全スレッドのサンプリングプロファイル
+    """
+    if not is_loopback_client(environ):
+        return debug_response(start_response, "403 Forbidden", "Forbidden")
+    if environ["REQUEST_METHOD"] != "GET":
+        return debug_response(start_response, "405 Method Not Allowed", "Method Not Allowed")
+    query = urllib.parse.parse_qs(environ.get("QUERY_STRING", ""))
+
+    def param(name: str, default: str) -> str:
+        return query.get(name, [default])[-1]
+
+    path = environ.get("PATH_INFO", "")
+    try:
+        if path == "/debug/traces":
+            traces = tracer.recent(int(param("limit", "50")), float(param("min_ms", "0")), param("name", ""))
+            return debug_response(start_response, "200 OK", {"tracing": tracer.stats(), "traces": traces})
+        if path == "/debug/profile":
+            seconds = float(param("seconds", "10"))
+            interval = float(param("interval_ms", "5")) / 1000
+            limit = int(param("limit", "30"))
+            output = param("format", "json")
+            if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0 < interval <= 1 or output not in ("json", "collapsed"):
+                raise ValueError(path)
+            if not _profile_lock.acquire(blocking=False):
+                return debug_response(start_response, "409 Conflict", "別のプロファイルを実行中です")
+            try:
+                profiler = SamplingProfiler(interval, include_idle=param("idle", "0") == "1")
+                profiler.run(seconds, environ.get("gh_proxy.cancel"))
+            finally:
+                _profile_lock.release()
+            if output == "collapsed":
+                return debug_response(start_response, "200 OK", profiler.collapsed())
+            return debug_response(start_response, "200 OK", profiler.report(limit))
+    except ValueError:
+        return debug_response(start_response, "400 Bad Request", "パラメーターが正しくありません")
+    return debug_response(start_response, "404 Not Found", "Not Found")
+
+
+def json_response(environ: Dict[str, Any], start_response, response: Any, label: str = "") -> List[bytes]:
+    """JSON レスポンスを返す（クライアントが対応していれば gzip で圧縮）"""
+    started = time.monotonic()
+    with span("serialization") as attributes:
+        response_body = dump_json(response).encode("utf-8")
+        attributes["bytes"] = len(response_body)
+
+        headers = [("Content-Type", "application/json")]
+        if GZIP_ENABLED:
+            headers.append(("Vary", "Accept-Encoding"))
+            if len(response_body) >= GZIP_MIN_BYTES and accepts_gzip(environ):
+                response_body = gzip.compress(response_body, compresslevel=6)
+                headers.append(("Content-Encoding", "gzip"))
+                attributes["gzipBytes"] = len(response_body)
+    headers.append(("Content-Length", str(len(response_body))))
+    metrics.observe("gh_proxy_phase_seconds", time.monotonic() - started, tool=label, phase="serialization")
+    metrics.observe("gh_proxy_response_bytes", len(response_body), tool=label)
+
+    start_response("200 OK", headers)
     return [response_body]
 
 
+# asyncモードで受け付けるリクエスト行・ヘッダー・本文の上限
+MAX_HEADER_COUNT = 100
+MAX_REQUEST_LINE = 65536
+MAX_REQUEST_BODY = 16 * 1024 * 1024
+# StreamReader のバッファの上限（MAX_REQUEST_LINE を超える行を読み切って 400 を返せるよう、それより大きくする）
+STREAM_LIMIT = MAX_REQUEST_LINE * 2
+# 停止時に接続を閉じてから接続の処理の終了を待つ時間（秒）
+DRAIN_CLOSE_TIMEOUT = 5.0
+# 処理中にクライアントの切断を確認する間隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class AsyncHTTPServer:
+    """
+    asyncio ベースの HTTP/1.1 サーバー
+
+    keep-alive 接続を維持したまま、各リクエストを WSGI アプリケーションとして
+    スレッドプールで処理する。gh コマンドはイベントループ上で asyncio サブプロセスとして
+    実行されるため、遅い呼び出しが他のリクエストをブロックしない。
+    処理中にクライアントが切断した場合は、environ の gh_proxy.cancel に渡したキャンセル通知で
+    リクエストをキャンセルする。
+    SIGTERM を受け取ると、新しい接続の受け付けを止め、処理中のリクエストの完了を待ってから
+    （最大 WORKER_GRACEFUL_TIMEOUT 秒）終了する。
+    max_requests 件のリクエストを処理すると on_recycle を1回だけ呼び出す（指定がなければそのまま終了する）。
+    """
+
+    def __init__(self, app, host: str, port: int, threads: int = HANDLER_THREADS,
+                 reuse_port: bool = False, max_requests: int = 0,
+                 on_ready: Optional[Callable[[], None]] = None,
+                 on_recycle: Optional[Callable[[str], None]] = None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.max_requests = max_requests
+        self.on_ready = on_ready
+        self.on_recycle = on_recycle or self.shutdown
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=threads,
+            thread_name_prefix="gh-proxy"
+        )
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.stopped: Optional[asyncio.Event] = None
+        self.draining = False
+        self.requests = 0
+        # 処理中のリクエスト数と、開いている接続（接続を処理するタスク）・次のリクエストを待っている接続
+        self.active = 0
+        self.connections: Dict[asyncio.StreamWriter, "asyncio.Task[None]"] = {}
+        self.idle = set()
+
+    async def serve_forever(self) -> None:
+        """サーバーを起動し、shutdown が呼び出されるまで接続を受け付ける"""
+        global _gh_loop, _gh_semaphore
+        loop = asyncio.get_running_loop()
+        _gh_loop = loop
+        _gh_semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        self.stopped = asyncio.Event()
+        try:
+            self.server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port, reuse_port=self.reuse_port, limit=STREAM_LIMIT
+            )
+            async with self.server:
+                try:
+                    loop.add_signal_handler(signal.SIGTERM, self.shutdown, "SIGTERM")
+                except (NotImplementedError, RuntimeError):
+                    pass
+                if self.on_ready is not None:
+                    self.on_ready()
+                else:
+                    print(f"サーバーが起動しました: http://127.0.0.1:{self.port}")
+                    print("Ctrl+C で停止します")
+                await self.stopped.wait()
+                await self._drain()
+        finally:
+            _gh_loop = None
+            _gh_semaphore = None
+            self.executor.shutdown(wait=False)
+
+    def shutdown(self, reason: str) -> None:
+        """新しい接続の受け付けを止めて serve_forever を終了させる（イベントループ上で呼び出す）"""
+        if self.draining:
+            return
+        self.draining = True
+        print(f"サーバーを停止しています（{reason}）...")
+        self.server.close()
+        for writer in list(self.idle):
+            writer.close()
+        self.stopped.set()
+
+    async def _drain(self) -> None:
+        """処理中のリクエストの完了を待ち、残った接続を閉じる（処理中のリクエストはキャンセルされる）"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WORKER_GRACEFUL_TIMEOUT
+        while self.active and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        for writer in list(self.connections):
+            writer.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections.values()), timeout=DRAIN_CLOSE_TIMEOUT)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """1つの接続上のリクエストを keep-alive で順に処理"""
+        peer = writer.get_extra_info("peername") or ("", 0)
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while not self.draining:
+                self.idle.add(writer)
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except ValueError:
+                    # STREAM_LIMIT を超えても改行がない
+                    await self._write_simple(writer, "400 Bad Request", b"Request line too long")
+                    break
+                finally:
+                    self.idle.discard(writer)
+                if not request_line:
+                    break
+                if request_line in (b"\r\n", b"\n"):
+                    continue
+
+                self.active += 1
+                self.requests += 1
+                if self.max_requests and self.requests == self.max_requests:
+                    self.on_recycle(f"{self.requests} 件のリクエストを処理しました")
+                try:
+                    keep_alive = await self._handle_request(request_line, reader, writer, peer)
+                finally:
+                    self.active -= 1
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                self.connections.pop(writer, None)
+
+    async def _handle_request(self, request_line: bytes, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter, peer: Tuple[str, int]) -> bool:
+        """
+        1リクエストを処理してレスポンスを書き出す
+
+        Returns:
+            接続を維持する場合 True
+        """
+        try:
+            method, target, version = request_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        except ValueError:
+            await self._write_simple(writer, "400 Bad Request", b"Bad Request")
+            return False
+        if len(request_line) > MAX_REQUEST_LINE or not version.startswith("HTTP/1."):
+            await self._write_simple(writer, "400 Bad Request", b"Bad Request")
+            return False
+
+        headers: Dict[str, str] = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # STREAM_LIMIT を超えても改行がない
+                line = None
+            if line is None or len(line) > MAX_REQUEST_LINE:
+                await self._write_simple(writer, "431 Request Header Fields Too Large", b"Header line too long")
+                return False
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADER_COUNT:
+                await self._write_simple(writer, "431 Request Header Fields Too Large", b"Too many headers")
+                return False
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            await self._write_simple(writer, "501 Not Implemented", b"Chunked request body is not supported")
+            return False
+
+        try:
+            content_length = int(headers.get("content-length", "0"))
+        except ValueError:
+            await self._write_simple(writer, "400 Bad Request", b"Invalid Content-Length")
+            return False
+        if content_length < 0:
+            await self._write_simple(writer, "400 Bad Request", b"Invalid Content-Length")
+            return False
+        if content_length > MAX_REQUEST_BODY:
+            await self._write_simple(writer, "413 Payload Too Large", b"Request body too large")
+            return False
+        body = await reader.readexactly(content_length) if content_length > 0 else b""
+
+        path, _, query = target.partition("?")
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": urllib.parse.unquote(path, "latin-1"),
+            "QUERY_STRING": query,
+            "CONTENT_TYPE": headers.get("content-type", ""),
+            "CONTENT_LENGTH": str(content_length),
+            "SERVER_NAME": self.host or "127.0.0.1",
+            "SERVER_PORT": str(self.port),
+            "SERVER_PROTOCOL": version,
+            "REMOTE_ADDR": peer[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in headers.items():
+            if name in ("content-type", "content-length"):
+                continue
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+        cancel = CancelToken()
+        environ["gh_proxy.cancel"] = cancel
+
+        loop = asyncio.get_running_loop()
+        try:
+            status, response_headers, chunks = await self._run_app(
+                loop.run_in_executor(self.executor, self._call_app, environ), reader, cancel
+            )
+        except Exception as e:
+            print(f"アプリケーションエラー: {e}", file=sys.stderr)
+            await self._write_simple(writer, "500 Internal Server Error", b"Internal Server Error")
+            return False
+
+        header_names = {name.lower() for name, _ in response_headers}
+        lines = [f"{version} {status}"]
+        lines.extend(f"{name}: {value}" for name, value in response_headers)
+        chunked = "content-length" not in header_names and version != "HTTP/1.0"
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        elif "content-length" not in header_names:
+            keep_alive = False
+        keep_alive = keep_alive and not self.draining
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+        try:
+            while True:
+                chunk = await self._run_app(loop.run_in_executor(self.executor, next, chunks, None), reader, cancel)
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                if chunked:
+                    writer.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                else:
+                    writer.write(chunk)
+                await writer.drain()
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+    async def _run_app(self, future: "asyncio.Future[Any]", reader: asyncio.StreamReader, cancel: CancelToken) -> Any:
+        """スレッドプールでの処理の完了を待つ（待機中にクライアントが切断した場合はリクエストをキャンセルする）"""
+        while True:
+            done, _ = await asyncio.wait([future], timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return future.result()
+            if reader.at_eof() and cancel.cancel():
+                metrics.inc("gh_proxy_cancelled_requests_total", reason="disconnect")
+                print("client disconnected: request cancelled", file=sys.stderr)
+
+    def _call_app(self, environ: Dict[str, Any]):
+        """WSGI アプリケーションを呼び出し、ステータス・ヘッダー・本文イテレータを返す"""
+        state: Dict[str, Any] = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            state["status"] = status
+            state["headers"] = response_headers
+
+        result = self.app(environ, start_response)
+        iterator = iter(result)
+        # 最初のチャンクまで評価して start_response の呼び出しを確定させる
+        first = next(iterator, None)
+        if "status" not in state:
+            raise RuntimeError("start_response が呼び出されていません")
+
+        def chunks():
+            try:
+                if first is not None:
+                    yield first
+                yield from iterator
+            finally:
+                close = getattr(result, "close", None)
+                if close is not None:
+                    close()
+
+        return state["status"], state["headers"], chunks()
+
+    async def _write_simple(self, writer: asyncio.StreamWriter, status: str, body: bytes) -> None:
+        """エラー応答を書き出して接続を閉じる前提の簡易レスポンス"""
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+
+def serve_wsgi() -> None:
+    """wsgiref で1接続ずつ処理するサーバーを起動"""
+    with make_server("", PORT, application) as httpd:
+        print(f"サーバーが起動しました: http://127.0.0.1:{PORT}")
+        print("Ctrl+C で停止します")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nサーバーを停止しています...")
+
+
+def serve_async() -> None:
+    """asyncio ベースの keep-alive 対応サーバーを起動"""
+    server = AsyncHTTPServer(application, "", PORT)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nサーバーを停止しています...")
+
+
+# ワーカープロセスが RSS と親プロセスの終了を確認する間隔（秒）
+WORKER_CHECK_INTERVAL = 5.0
+
+
+def read_rss_bytes() -> int:
+    """現在のプロセスの RSS（バイト）。/proc がない環境ではピーク値を返す"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss は Linux では KB、macOS ではバイト
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def notify_supervisor(message: bytes) -> bool:
+    """親プロセス（WorkerSupervisor）にパイプで通知（親プロセスが終了している場合は False）"""
+    if WORKER_NOTIFY_FD < 0:
+        return False
+    try:
+        os.write(WORKER_NOTIFY_FD, message)
+        return True
+    except OSError:
+        return False
+
+
+def serve_worker() -> None:
+    """
+    WorkerSupervisor が起動したワーカープロセスとしてサーバーを起動
+
+    待ち受けソケットは SO_REUSEPORT で他のワーカーと同じポートに bind し、接続の振り分けはカーネルに任せる。
+    WORKER_MAX_REQUESTS 件のリクエストを処理するか RSS が WORKER_MAX_RSS_MB を超えると親プロセスに入れ替えを依頼し、
+    代わりのワーカーが起動して SIGTERM を受け取るまでは接続を受け付け続ける。
+    """
+    # Ctrl+C は親プロセスが受け取り、ワーカーには SIGTERM で停止を伝える
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    supervisor = os.getppid()
+    recycling = []
+
+    def recycle(reason: str) -> None:
+        if recycling:
+            return
+        recycling.append(reason)
+        print(f"ワーカー {WORKER_ID}（pid {os.getpid()}）の入れ替えを依頼します（{reason}）")
+        if not notify_supervisor(WorkerSupervisor.RECYCLE):
+            server.shutdown(reason)
+            return
+        # 親プロセスが代わりのワーカーを起動できなかった場合も一定時間後には終了する
+        asyncio.get_running_loop().call_later(
+            WorkerSupervisor.READY_TIMEOUT + WORKER_GRACEFUL_TIMEOUT, server.shutdown, reason
+        )
+
+    async def monitor() -> None:
+        while not server.draining:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            if os.getppid() != supervisor:
+                server.shutdown("親プロセスが終了しました")
+            elif WORKER_MAX_RSS_MB and read_rss_bytes() > WORKER_MAX_RSS_MB * 1024 * 1024:
+                recycle(f"RSS が {WORKER_MAX_RSS_MB} MB を超えました")
+
+    def on_ready() -> None:
+        print(f"ワーカー {WORKER_ID}（pid {os.getpid()}）が起動しました")
+        notify_supervisor(WorkerSupervisor.READY)
+        asyncio.ensure_future(monitor())
+
+    server = AsyncHTTPServer(application, "", PORT, reuse_port=True, max_requests=WORKER_MAX_REQUESTS,
+                             on_ready=on_ready, on_recycle=recycle)
+    asyncio.run(server.serve_forever())
+
+
+class WorkerSupervisor:
+    """
+    --workers N で起動した親プロセス
+
+    自身はリクエストを処理せず、N 個のワーカープロセス（serve_worker）を起動して監視する。
+    ワーカーは同じスクリプトを新しいインタープリターで実行するため、キャッシュやインデックスの
+    SQLite 接続などをプロセス間で共有しない。
+    ワーカーとはワーカーごとのパイプでつながり、ワーカーは起動完了（READY）と入れ替えの依頼（RECYCLE）を通知する。
+    入れ替えと SIGHUP による再起動では、代わりのワーカーの起動完了を待ってから古いワーカーに SIGTERM を送るため、
+    その間も接続を受け付け続ける。予期せず終了したワーカーは同じ番号で起動し直す。
+    SIGTERM / SIGINT ではすべてのワーカーを停止して終了する。
+    """
+
+    READY = b"1"
+    RECYCLE = b"R"
+    # 起動直後に異常終了した場合の判定時間（秒）と、連続してそうなった場合に起動をあきらめる回数
+    CRASH_WINDOW = 5.0
+    MAX_CRASHES = 5
+    # ワーカーの起動完了を待つ時間（秒）
+    READY_TIMEOUT = 30.0
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.slots: Dict[int, subprocess.Popen] = {}
+        self.started_at: Dict[int, float] = {}
+        # 通知用パイプの読み出し側 -> ワーカー
+        self.pipes: Dict[int, subprocess.Popen] = {}
+        # 置き換えられて停止を待っているワーカー
+        self.retiring: List[subprocess.Popen] = []
+        self.crashes = 0
+        self.stopping = False
+        self.restart_requested = False
+
+    def spawn(self, slot: int) -> subprocess.Popen:
+        """ワーカーを起動（通知用パイプの読み出し側を pipes に登録する）"""
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, GH_PROXY_WORKER_ID=str(slot), GH_PROXY_WORKER_NOTIFY_FD=str(write_fd),
+                   GH_PROXY_WORKERS=str(self.workers))
+        try:
+            proc = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env, pass_fds=(write_fd,))
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        self.pipes[read_fd] = proc
+        self.started_at[slot] = time.monotonic()
+        return proc
+
+    def _close_pipe(self, read_fd: int) -> None:
+        del self.pipes[read_fd]
+        os.close(read_fd)
+
+    def _pipe_of(self, proc: subprocess.Popen) -> Optional[int]:
+        return next((fd for fd, owner in self.pipes.items() if owner is proc), None)
+
+    def wait_ready(self, proc: subprocess.Popen) -> bool:
+        """ワーカーの起動完了を待つ（起動前に終了した場合やタイムアウトした場合は False）"""
+        read_fd = self._pipe_of(proc)
+        readable, _, _ = select.select([read_fd], [], [], self.READY_TIMEOUT)
+        if readable and os.read(read_fd, 1) == self.READY:
+            return True
+        self._close_pipe(read_fd)
+        return False
+
+    def start(self) -> bool:
+        """すべてのワーカーを起動し、起動完了を待つ"""
+        for slot in range(self.workers):
+            self.slots[slot] = self.spawn(slot)
+        return all([self.wait_ready(self.slots[slot]) for slot in range(self.workers)])
+
+    def replace(self, slot: int) -> bool:
+        """代わりのワーカーを起動し、起動完了後に古いワーカーを停止する"""
+        proc = self.spawn(slot)
+        if not self.wait_ready(proc):
+            print(f"ワーカー {slot} の代わりのプロセスが起動しませんでした", file=sys.stderr)
+            proc.kill()
+            proc.wait()
+            return False
+        old = self.slots[slot]
+        self.slots[slot] = proc
+        old.terminate()
+        self.retiring.append(old)
+        return True
+
+    def rolling_restart(self) -> None:
+        """ワーカーを1つずつ新しいものに置き換える"""
+        print("ワーカーを順に再起動しています...")
+        for slot in sorted(self.slots):
+            if self.stopping:
+                return
+            if not self.replace(slot):
+                print("再起動を中止します", file=sys.stderr)
+                return
+        print("ワーカーの再起動が完了しました")
+
+    def poll_pipes(self, timeout: float) -> None:
+        """ワーカーからの通知を待ち、入れ替えの依頼があれば代わりのワーカーを起動する"""
+        try:
+            readable, _, _ = select.select(list(self.pipes), [], [], timeout)
+        except InterruptedError:
+            return
+        for read_fd in readable:
+            proc = self.pipes[read_fd]
+            data = os.read(read_fd, 64)
+            if not data:
+                self._close_pipe(read_fd)
+                continue
+            slot = next((slot for slot, current in self.slots.items() if current is proc), None)
+            if self.RECYCLE in data and slot is not None and not self.stopping:
+                self.replace(slot)
+
+    def check_workers(self) -> bool:
+        """予期せず終了したワーカーを起動し直す（起動直後の異常終了が続いた場合は False）"""
+        for slot, proc in list(self.slots.items()):
+            code = proc.poll()
+            if code is None:
+                continue
+            if code != 0 and time.monotonic() - self.started_at[slot] < self.CRASH_WINDOW:
+                self.crashes += 1
+                if self.crashes >= self.MAX_CRASHES:
+                    print(f"ワーカーが起動直後に異常終了を繰り返しています（終了コード {code}）", file=sys.stderr)
+                    return False
+            else:
+                self.crashes = 0
+            print(f"ワーカー {slot}（pid {proc.pid}）が終了しました（終了コード {code}）。起動し直します")
+            self.slots[slot] = self.spawn(slot)
+        self.retiring = [proc for proc in self.retiring if proc.poll() is None]
+        return True
+
+    def stop(self) -> None:
+        """すべてのワーカーに SIGTERM を送り、終了しないものは猶予時間の後に強制終了する"""
+        procs = list(self.slots.values()) + self.retiring
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+        deadline = time.monotonic() + WORKER_GRACEFUL_TIMEOUT + WORKER_CHECK_INTERVAL
+        for proc in procs:
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        for read_fd in list(self.pipes):
+            self._close_pipe(read_fd)
+
+    def run(self) -> int:
+        """ワーカーを起動して停止の指示まで監視し、終了コードを返す"""
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_restart(signum, frame):
+            self.restart_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_restart)
+
+        code = 0
+        if not self.start():
+            print("ワーカーが起動しませんでした（ポートが使用中でないか確認してください）", file=sys.stderr)
+            code = 1
+        else:
+            print(f"サーバーが起動しました: http://127.0.0.1:{PORT}（ワーカー {self.workers} 個）")
+            print("Ctrl+C で停止、SIGHUP でワーカーを順に再起動します")
+        while code == 0 and not self.stopping:
+            self.poll_pipes(0.5)
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            if not self.check_workers():
+                code = 1
+        print("\nサーバーを停止しています...")
+        self.stop()
+        return code
+
+
+def parse_args(argv: List[str]) -> Any:
+    """コマンドライン引数を解析（指定しなかった項目は環境変数の値を使う）"""
+    import argparse
+    parser = argparse.ArgumentParser(description="GitHub CLI MCP Proxy Server")
+    parser.add_argument(
+        "--workers", type=int, default=WORKERS,
+        help="ワーカープロセス数（SO_REUSEPORT で同じポートを共有する。0で単一プロセス）"
+    )
+    return parser.parse_args(argv)
+
+
 def main():
     """メイン関数"""
+    # ワーカープロセスとして起動された場合（WorkerSupervisor が起動する）
+    if WORKER_ID is not None:
+        if prefetcher is not None:
+            prefetcher.start()
+        # インデックスの同期はワーカー 0 のみが行い、他のワーカーは同じファイルを参照のみ行う
+        # （GH_PROXY_INDEX を指定しない場合は親プロセスが一時ファイルを用意する）
+        if index_syncer is not None and WORKER_ID == "0":
+            index_syncer.start()
+        serve_worker()
+        return
+
+    args = parse_args(sys.argv[1:])
     print(f"GitHub CLI MCP Proxy Server")
     print(f"Protocol Version: {PROTOCOL_VERSION}")
     print(f"Server: {SERVER_NAME} v{SERVER_VERSION}")
     print(f"Port: {PORT}")
+    print(f"Mode: {SERVER_MODE}")
     print()
-    print("サーバーを起動しています...")
 
-    with make_server("", PORT, application) as httpd:
-        print(f"サーバーが起動しました: http://127.0.0.1:{PORT}")
-        print("Ctrl+C で停止します")
+    if args.workers > 0:
+        if SERVER_MODE != "async" or not hasattr(socket, "SO_REUSEPORT"):
+            print("エラー: --workers は async モードかつ SO_REUSEPORT に対応した OS でのみ使用できます", file=sys.stderr)
+            sys.exit(1)
+        if cassette is not None and cassette.mode == "record":
+            print("エラー: カセットの記録（GH_PROXY_CASSETTE_MODE=record）は単一プロセスでのみ使用できます", file=sys.stderr)
+            sys.exit(1)
+        print(f"ワーカーを {args.workers} 個起動しています...")
+        index_dir = None
+        if INDEX_REPOS and not INDEX_PATH:
+            # メモリ上のインデックスをワーカーごとに同期すると GitHub への呼び出しがワーカー数倍になるため、
+            # 終了時に削除する一時ファイルをワーカー間で共有する
+            index_dir = tempfile.mkdtemp(prefix="gh-proxy-index-")
+            os.environ["GH_PROXY_INDEX"] = os.path.join(index_dir, "index.sqlite3")
         try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print("\nサーバーを停止しています...")
+            code = WorkerSupervisor(args.workers).run()
+        finally:
+            if index_dir is not None:
+                shutil.rmtree(index_dir, ignore_errors=True)
+        sys.exit(code)
+
+    if prefetcher is not None:
+        prefetcher.start()
+    if index_syncer is not None:
+        index_syncer.start()
+    print("サーバーを起動しています...")
+
+    if SERVER_MODE == "wsgi":
+        serve_wsgi()
+    elif SERVER_MODE == "async":
+        serve_async()
+    else:
+        print(f"エラー: 未知のサーバーモード: {SERVER_MODE}", file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -2,6 +2,10 @@
 # TTSクライアント - 行ごと順次処理
 
 TTS_SERVER="${TTS_SERVER:-host.docker.internal:37721}"
+# 読み上げの優先度（high / normal / low）
+TTS_PRIORITY="${TTS_PRIORITY:-normal}"
+# 1 の場合は読み上げが終わるまで待つ（デフォルトはキューに入れた時点で戻る）
+TTS_WAIT="${TTS_WAIT:-0}"
 
 # TTSを実行する関数
 send_to_tts() {
@@ -12,7 +16,7 @@ send_to_tts() {
 
     echo -n "$text" | curl -s -f -X POST \
         --data-binary @- \
-        "http://${TTS_SERVER}/tts" || {
+        "http://${TTS_SERVER}/tts?priority=${TTS_PRIORITY}&wait=${TTS_WAIT}" || {
         echo "エラー: TTSサーバーへの接続に失敗しました: $text" >&2
         return 1
     }
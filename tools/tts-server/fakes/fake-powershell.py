@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+powershell.exe のスタンドイン
+
+Windows 以外の環境で tts-server を動作確認するために TTS_POWERSHELL に指定します。
+tts-server が標準入力に書き込む SpeechSynthesizer / SoundPlayer の呼び出しを1行ずつ解釈し、
+音声を出力する代わりに指定した時間だけ待ちます。
+SetOutputToWaveFile で出力先を指定した Speak ではダミーの WAV ファイルを書き出します。
+
+使い方:
+    TTS_POWERSHELL=tools/tts-server/fakes/fake-powershell.py python3 tools/tts-server/tts-server.py
+
+環境変数:
+    FAKE_PS_SPEAK_SECONDS: 読み上げ・再生1回あたりの時間（秒、デフォルト 0.3）
+    FAKE_PS_RENDER_SECONDS: WAV ファイルへの合成1回あたりの時間（秒、デフォルト 0.1）
+    FAKE_PS_WAV_BYTES: 書き出す WAV ファイルのサイズ（バイト、デフォルト 32000）
+    FAKE_PS_STARTUP_SECONDS: 起動時（SpeechSynthesizer の生成時）の遅延（秒、デフォルト 0）
+"""
+
+import os
+import re
+import struct
+import sys
+import time
+
+SPEAK_SECONDS = float(os.environ.get('FAKE_PS_SPEAK_SECONDS', '0.3'))
+RENDER_SECONDS = float(os.environ.get('FAKE_PS_RENDER_SECONDS', '0.1'))
+WAV_BYTES = int(os.environ.get('FAKE_PS_WAV_BYTES', '32000'))
+STARTUP_SECONDS = float(os.environ.get('FAKE_PS_STARTUP_SECONDS', '0'))
+
+WAVE_FILE = re.compile(r"\$s\.SetOutputToWaveFile\('((?:[^']|'')*)'\)")
+
+
+def wav_bytes(size: int) -> bytes:
+    """16kHz / 16bit / モノラルの無音の WAV"""
+    data = max(size - 44, 0)
+    return (b'RIFF' + struct.pack('<I', 36 + data) + b'WAVEfmt ' +
+            struct.pack('<IHHIIHH', 16, 1, 1, 16000, 32000, 2, 16) +
+            b'data' + struct.pack('<I', data) + b'\0' * data)
+
+
+def main():
+    # 出力先: None は既定の出力デバイス、"" は破棄（SetOutputToNull）、それ以外は WAV ファイルのパス
+    output = None
+    for line in sys.stdin:
+        line = line.strip()
+        match = WAVE_FILE.match(line)
+        if match:
+            output = match.group(1).replace("''", "'")
+        elif line.startswith('$s = New-Object'):
+            time.sleep(STARTUP_SECONDS)
+        elif line.startswith('$s.SetOutputToNull'):
+            output = ''
+        elif line.startswith('$s.SetOutputToDefaultAudioDevice'):
+            output = None
+        elif line.startswith('$s.Speak('):
+            if output:
+                time.sleep(RENDER_SECONDS)
+                with open(output, 'wb') as f:
+                    f.write(wav_bytes(WAV_BYTES))
+            elif output is None:
+                time.sleep(SPEAK_SECONDS)
+        elif line.startswith('$p.PlaySync'):
+            time.sleep(SPEAK_SECONDS)
+        elif line == "Write-Output 'DONE'":
+            print('DONE', flush=True)
+        elif line == 'exit':
+            break
+
+
+if __name__ == '__main__':
+    main()
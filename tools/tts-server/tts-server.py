@@ -1,10 +1,22 @@
 #!/usr/bin/env python3
 import atexit
+import collections
+import contextlib
+import hashlib
+import heapq
+import itertools
+import json
+import os
 import subprocess
 import base64
 import ipaddress
+import shutil
+import sys
 import threading
-from wsgiref.simple_server import make_server
+import time
+import urllib.parse
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
 
 import traceback
 
@@ -13,13 +25,295 @@ PORT = 37721
 # デフォルトの読み上げ速度（-10から10、0が標準）
 SPEED = 5  # 少し速めに設定
 
+# 読み上げに使う音声（SpeechSynthesizer.SelectVoice の名前、空の場合は既定の音声）
+VOICE = os.environ.get('TTS_VOICE', '')
+
+# 合成した音声（WAV）のキャッシュのディレクトリと容量の上限（MB、0でキャッシュしない）
+CACHE_DIR = os.environ.get('TTS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'tts-server'))
+CACHE_MAX_MB = int(os.environ.get('TTS_CACHE_MAX_MB', '200'))
+# 起動時に合成してキャッシュしておくフレーズの一覧（1行に1フレーズ、空の場合は行わない）
+CACHE_PREWARM = os.environ.get('TTS_CACHE_PREWARM',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'phrases.txt'))
+
+# PowerShell の実行ファイル（動作確認では fakes/fake-powershell.py に置き換える）
+POWERSHELL = os.environ.get('TTS_POWERSHELL', 'powershell.exe')
+# 合成用の PowerShell プロセス数（0の場合は1つのプロセスで合成と再生を順に行う）
+POOL_SIZE = int(os.environ.get('TTS_POOL_SIZE', '0'))
+# 再生を待っている項目の後に先行して合成しておく件数（TTS_POOL_SIZE を指定した場合のみ）
+LOOKAHEAD = int(os.environ.get('TTS_LOOKAHEAD', '2'))
+if POOL_SIZE > 0 and CACHE_MAX_MB <= 0:
+    sys.exit('TTS_POOL_SIZE を指定する場合は音声キャッシュを有効にしてください（TTS_CACHE_MAX_MB）')
+
+# 読み上げキューの上限（0で無制限）
+MAX_BACKLOG = int(os.environ.get('TTS_MAX_BACKLOG', '20'))
+# キューが上限に達した場合に破棄するもの（oldest: 最も古いもの、lowest: 最も優先度の低いもの）
+DROP_POLICY = os.environ.get('TTS_DROP_POLICY', 'lowest')
+if DROP_POLICY not in ('oldest', 'lowest'):
+    sys.exit(f'TTS_DROP_POLICY は oldest または lowest を指定してください: {DROP_POLICY}')
+
+# 読み上げの優先度（?priority=、値が小さいほど先に読み上げる）
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+# GET /debug/traces で参照できるように保持する直近のトレースの件数（0で記録しない）
+TRACE_BUFFER = int(os.environ.get('TTS_TRACE_BUFFER', '100'))
+# GET /debug/profile の最長時間（秒）
+PROFILE_MAX_SECONDS = 60
+# 同時に実行するプロファイルは1つまで
+profile_lock = threading.Lock()
+
 # グローバルロック
 tts_lock = threading.Lock()
 
+# 受け付けるリクエスト（メソッド, パス）
+ROUTES = {('POST', '/tts'), ('GET', '/stats'), ('GET', '/debug/traces'), ('GET', '/debug/profile')}
+# ループバックからのみ受け付けるリクエスト（読み上げたテキストやスタックを含むため）
+DEBUG_ROUTES = {('GET', '/debug/traces'), ('GET', '/debug/profile')}
+
+
+# トレース: リクエストごとに各区間（parse / queue / subprocess / serialize）の開始オフセットと所要時間を記録する
+traces = collections.deque(maxlen=max(TRACE_BUFFER, 1))
+trace_ids = itertools.count(1)
+_local = threading.local()
+
+
+def start_trace(path, **fields):
+    """トレースを開始して現在のスレッドに設定"""
+    if TRACE_BUFFER <= 0:
+        return None
+    trace = dict({
+        'id': next(trace_ids),
+        'path': path,
+        'startedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'durationMs': None,
+        'spans': [],
+    }, **fields)
+    _local.trace = (trace, time.perf_counter())
+    return trace
+
+
+def finish_trace(trace):
+    """トレースを完了してリングバッファに追加"""
+    if trace is None:
+        return
+    _, origin = _local.trace
+    _local.trace = None
+    trace['durationMs'] = round((time.perf_counter() - origin) * 1000, 3)
+    traces.append(trace)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """with ブロックの実行を現在のトレースのスパンとして記録"""
+    current = getattr(_local, 'trace', None)
+    if current is None:
+        yield attributes
+        return
+    trace, origin = current
+    started = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        trace['spans'].append(dict({
+            'name': name,
+            'startMs': round((started - origin) * 1000, 3),
+            'durationMs': round((time.perf_counter() - started) * 1000, 3),
+        }, **attributes))
+
+
+def profile(seconds, interval=0.005):
+    """
+    全スレッドのスタックを interval 秒ごとに取得し、関数ごとのサンプル数を集計
+
+    cProfile は有効にしたスレッドしか計測できないため、sys._current_frames() でサンプリングする。
+    （自己サンプル数, 累積サンプル数）の関数ごとの辞書と、スタックごとのサンプル数を返す。
+    """
+    own = threading.get_ident()
+    functions = collections.defaultdict(lambda: [0, 0])
+    stacks = collections.Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            # 接続を待っているだけのメインスレッドは除く
+            if stack[0].startswith('select (selectors.py'):
+                continue
+            functions[stack[0]][0] += 1
+            for name in set(stack):
+                functions[name][1] += 1
+            stacks[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return functions, stacks
+
+
+def ps_quote(value):
+    """PowerShell の単一引用符の文字列リテラル"""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def remove_file(path):
+    """ファイルを削除（既に削除されていても何もしない）"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class AudioCache:
+    """
+    合成した音声（WAV）のキャッシュ
+
+    (テキスト, 速度, 音声) のハッシュをファイル名として directory に保存し、合計サイズが max_bytes を
+    超えた場合は最も長く使われていないものから削除する。使用順はファイルの更新時刻で保持する（再起動後も引き継ぐ）。
+    一度しか読み上げないテキストでディスクを消費しないよう、キャッシュにないテキストは2回目の読み上げから合成する
+    （admit）。直近に一度だけ読み上げたテキストのキーを SEEN_MAX 件まで覚えておく。
+    """
+
+    SEEN_MAX = 4096
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # キー → ファイルサイズ（使用順）
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        # 一度だけ読み上げたテキストのキー（古い順）
+        self.seen = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.direct = 0
+        self.rendered = 0
+        self.evicted = 0
+        self.prewarmed = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.wav'):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-len('.wav')], stat.st_size))
+            elif name.endswith('.tmp'):
+                # 合成の途中で終了した一時ファイル
+                os.remove(path)
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.bytes += size
+        with self.lock:
+            self._evict()
+
+        # PowerShell に渡すパス（WSL 上で動作している場合は Windows のパスに変換する）
+        self.shell_directory = directory
+        self.shell_separator = os.sep
+        if shutil.which('wslpath'):
+            result = subprocess.run(['wslpath', '-w', directory], capture_output=True, text=True)
+            if result.returncode == 0:
+                self.shell_directory = result.stdout.strip()
+                self.shell_separator = '\\'
+
+    @staticmethod
+    def make_key(text, rate, voice):
+        return hashlib.sha256(json.dumps([text, rate, voice], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def shell_path(self, path):
+        """PowerShell に渡すパス"""
+        return self.shell_directory + self.shell_separator + os.path.basename(path)
+
+    def temp_path(self, key):
+        return os.path.join(self.directory, f'{key}.{threading.get_ident()}.tmp')
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        """キャッシュ済みの音声のパス（ない場合は None）"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        path = os.path.join(self.directory, key + '.wav')
+        try:
+            os.utime(path)
+        except OSError:
+            # ファイルが外部から削除されていた
+            with self.lock:
+                self.bytes -= self.entries.pop(key, 0)
+            return None
+        return path
+
+    def admit(self, key):
+        """キャッシュにないテキストを合成してキャッシュするか（以前にも読み上げていれば True）"""
+        with self.lock:
+            if self.seen.pop(key, None) is not None:
+                return True
+            self.seen[key] = True
+            if len(self.seen) > self.SEEN_MAX:
+                self.seen.popitem(last=False)
+            self.direct += 1
+            return False
+
+    def put(self, key, temp):
+        """合成した一時ファイルをキャッシュに登録してパスを返す（合成に失敗していた場合は None）"""
+        try:
+            size = os.path.getsize(temp)
+        except OSError:
+            return None
+        if size == 0:
+            os.remove(temp)
+            return None
+        path = os.path.join(self.directory, key + '.wav')
+        os.replace(temp, path)
+        with self.lock:
+            self.bytes -= self.entries.pop(key, 0)
+            self.entries[key] = size
+            self.bytes += size
+            self.rendered += 1
+            self._evict()
+        return path
+
+    def _evict(self):
+        """容量の上限を超えている間、最も長く使われていないものを削除（直前に追加したものは残す）"""
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evicted += 1
+            try:
+                os.remove(os.path.join(self.directory, key + '.wav'))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else None,
+                'rendered': self.rendered,
+                'direct': self.direct,
+                'evicted': self.evicted,
+                'prewarmed': self.prewarmed,
+            }
+
 
 class TTSEngine:
-    def __init__(self):
+    def __init__(self, cache=None, warm=False):
         self.lock = threading.Lock()
+        self.cache = cache
+        # 起動時に空の合成を1回行い、最初の読み上げまでに音声の読み込みを済ませておく
+        self.warm = warm
         self.process = None
         self._start_process()
         atexit.register(self._cleanup)
@@ -27,7 +321,7 @@ class TTSEngine:
     def _start_process(self):
         """PowerShellプロセスを起動して保持"""
         self.process = subprocess.Popen(
-            ['powershell.exe', '-ExecutionPolicy', 'Bypass', '-NoLogo', '-Command', '-'],
+            [POWERSHELL, '-ExecutionPolicy', 'Bypass', '-NoLogo', '-Command', '-'],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -37,67 +331,128 @@ class TTSEngine:
         # 初期化
         self.process.stdin.write("Add-Type -AssemblyName System.Speech\n")
         self.process.stdin.write("$s = New-Object System.Speech.Synthesis.SpeechSynthesizer\n")
+        if VOICE:
+            self.process.stdin.write(f"$s.SelectVoice({ps_quote(VOICE)})\n")
+        if self.warm:
+            self.process.stdin.write("$s.SetOutputToNull()\n")
+            self.process.stdin.write("$s.Speak(' ')\n")
+            self.process.stdin.write("$s.SetOutputToDefaultAudioDevice()\n")
         self.process.stdin.flush()
 
-    def speak(self, text, rate=SPEED):
-        """テキストを読み上げ"""
-        with self.lock:
-            try:
-                encoded = base64.b64encode(text.encode('utf-8')).decode()
-                commands = [
-                    f"$s.Rate = {rate}",
-                    f"$bytes = [Convert]::FromBase64String('{encoded}')",
-                    "$text = [System.Text.Encoding]::UTF8.GetString($bytes)",
-                    "$s.Speak($text)",
-                    "Write-Output 'DONE'"
-                ]
-
-                for cmd in commands:
-                    self.process.stdin.write(cmd + "\n")
-                self.process.stdin.flush()
+    def speak(self, text, rate=SPEED, cached=True):
+        """テキストを読み上げ（キャッシュ済みか以前にも読み上げたテキストは合成した音声を再生）"""
+        with span('queue'):
+            self.lock.acquire()
+        try:
+            path = self._cached_audio(text, rate) if self.cache is not None and cached else None
+            if path is None:
+                with span('subprocess') as attributes:
+                    attributes['ok'] = self._speak(text, rate)
+                    return attributes['ok']
+            with span('play') as attributes:
+                attributes['ok'] = self._play(path)
+                return attributes['ok']
+        finally:
+            self.lock.release()
 
-                # 完了を待つ
-                while True:
-                    line = self.process.stdout.readline()
-                    if 'DONE' in line:
-                        break
+    def prewarm(self, text, rate=SPEED):
+        """キャッシュにない場合は合成してキャッシュしておく"""
+        if self.cache.contains(AudioCache.make_key(text, rate, VOICE)):
+            return
+        if self.render(text, rate) is not None:
+            with self.cache.lock:
+                self.cache.prewarmed += 1
 
-                return True
-            except:
-                # プロセスが死んでいたら再起動
-                self._cleanup()
-                self._start_process()
-                return False
+    def render(self, text, rate):
+        """合成してキャッシュに登録し、パスを返す（合成に失敗した場合は None）"""
+        key = AudioCache.make_key(text, rate, VOICE)
+        with self.lock:
+            temp = self.cache.temp_path(key)
+            return self.cache.put(key, temp) if self._render(text, rate, temp) else None
 
-    def speak(self, text, rate=SPEED):
-        """テキストを読み上げ"""
+    def render_scratch(self, text, rate):
+        """キャッシュに登録せずに一時ファイルへ合成し、パスを返す（合成に失敗した場合は None）"""
+        temp = self.cache.temp_path(AudioCache.make_key(text, rate, VOICE))
         with self.lock:
-            try:
-                encoded = base64.b64encode(text.encode('utf-8')).decode()
-                commands = [
-                    f"$s.Rate = {rate}",
-                    f"$bytes = [Convert]::FromBase64String('{encoded}')",
-                    "$text = [System.Text.Encoding]::UTF8.GetString($bytes)",
-                    "$s.Speak($text)",
-                    "Write-Output 'DONE'"
-                ]
-
-                for cmd in commands:
-                    self.process.stdin.write(cmd + "\n")
-                self.process.stdin.flush()
+            ok = self._render(text, rate, temp)
+        if ok and os.path.exists(temp) and os.path.getsize(temp) > 0:
+            return temp
+        remove_file(temp)
+        return None
 
-                # 完了を待つ
-                while True:
-                    line = self.process.stdout.readline()
-                    if 'DONE' in line:
-                        break
+    def play(self, path):
+        """WAV ファイルを再生"""
+        with self.lock:
+            return self._play(path)
 
-                return True
-            except:
-                # プロセスが死んでいたら再起動
-                self._cleanup()
-                self._start_process()
-                return False
+    def _cached_audio(self, text, rate):
+        """
+        キャッシュ済みの音声のパス
+
+        キャッシュにない場合、以前にも読み上げたテキストであれば合成してキャッシュする。
+        初めてのテキストと合成に失敗した場合は None（直接読み上げる）。
+        """
+        key = AudioCache.make_key(text, rate, VOICE)
+        path = self.cache.get(key)
+        if path is not None:
+            return path
+        if not self.cache.admit(key):
+            return None
+        with span('render') as attributes:
+            temp = self.cache.temp_path(key)
+            path = self.cache.put(key, temp) if self._render(text, rate, temp) else None
+            attributes['ok'] = path is not None
+        return path
+
+    def _text_commands(self, text, rate):
+        encoded = base64.b64encode(text.encode('utf-8')).decode()
+        return [
+            f"$s.Rate = {rate}",
+            f"$bytes = [Convert]::FromBase64String('{encoded}')",
+            "$text = [System.Text.Encoding]::UTF8.GetString($bytes)",
+        ]
+
+    def _speak(self, text, rate):
+        """既定の出力デバイスに直接読み上げ"""
+        return self._run(self._text_commands(text, rate) + ["$s.Speak($text)"])
+
+    def _render(self, text, rate, path):
+        """WAV ファイルに合成"""
+        return self._run(self._text_commands(text, rate) + [
+            f"$s.SetOutputToWaveFile({ps_quote(self.cache.shell_path(path))})",
+            "$s.Speak($text)",
+            "$s.SetOutputToDefaultAudioDevice()",
+        ])
+
+    def _play(self, path):
+        """WAV ファイルを再生"""
+        return self._run([
+            f"$p = New-Object System.Media.SoundPlayer {ps_quote(self.cache.shell_path(path))}",
+            "$p.PlaySync()",
+            "$p.Dispose()",
+        ])
+
+    def _run(self, commands):
+        """PowerShell でコマンドを実行して完了を待つ（self.lock を保持して呼び出す）"""
+        try:
+            for cmd in commands + ["Write-Output 'DONE'"]:
+                self.process.stdin.write(cmd + "\n")
+            self.process.stdin.flush()
+
+            # 完了を待つ
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    raise EOFError('PowerShell が終了しました')
+                if 'DONE' in line:
+                    break
+
+            return True
+        except:
+            # プロセスが死んでいたら再起動
+            self._cleanup()
+            self._start_process()
+            return False
 
     def _cleanup(self):
         """クリーンアップ"""
@@ -110,49 +465,399 @@ class TTSEngine:
             except:
                 self.process.kill()
 
-# グローバルTTSエンジン
-tts_engine = TTSEngine()
+# グローバル音声キャッシュとTTSエンジン（TTS_POOL_SIZE を指定した場合は SynthesisPool のプロセスを使う）
+audio_cache = AudioCache(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024) if CACHE_MAX_MB > 0 else None
+tts_engine = TTSEngine(audio_cache) if POOL_SIZE <= 0 else None
+
+
+def prewarm_cache(path):
+    """フレーズの一覧を既定の速度で合成してキャッシュしておく（空行と # で始まる行は除く）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            phrases = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    except OSError as e:
+        print(f'プリウォームのフレーズ一覧を読み込めません: {e}')
+        return
+    engine = tts_engine if tts_engine is not None else synthesis_pool.workers[0]
+    for phrase in phrases:
+        engine.prewarm(phrase)
+
+
+class SpeechQueue:
+    """
+    優先度付きの読み上げキュー
+
+    リクエストは直ちに受け付けてキューに入れ、単一の消費スレッドが優先度順（同じ優先度は到着順）に読み上げる。
+    キューが max_backlog 件に達した場合は policy に従って1件破棄する。
+    oldest は最も古いもの、lowest は最も優先度の低いもののうち最も古いものを破棄する
+    （lowest で新しいリクエストの優先度がキュー内のすべてより低い場合は新しいリクエストを破棄する）。
+    pool を指定した場合は engine の代わりに SynthesisPool で先行して合成した音声を再生する。
+    """
+
+    def __init__(self, engine, max_backlog, policy, pool=None):
+        self.engine = engine
+        self.max_backlog = max_backlog
+        self.policy = policy
+        self.pool = pool
+        self.condition = threading.Condition()
+        # (優先度, 到着順, 項目)
+        self.heap = []
+        self.sequence = itertools.count()
+        # キューから取り出して再生を待っている・再生中の項目
+        self.current = None
+        self.playing = False
+        self.accepted = 0
+        self.played = 0
+        self.failed = 0
+        self.dropped = 0
+        threading.Thread(target=self._run, name='tts-queue', daemon=True).start()
+        if pool is not None:
+            pool.start(self)
+
+    def put(self, text, rate, priority):
+        """読み上げを受け付けて項目を返す（新しいリクエストを破棄した場合は None）"""
+        item = {
+            'text': text,
+            'rate': rate,
+            'priority': priority,
+            'enqueued': time.perf_counter(),
+            'done': threading.Event(),
+            # 読み上げの結果（破棄された場合は None のまま）
+            'ok': None,
+            # SynthesisPool での合成の状態と、合成した音声のパス（scratch はキャッシュに登録していない一時ファイル）
+            'claimed': False,
+            'ready': threading.Event(),
+            'audio': None,
+            'scratch': False,
+            'discarded': False,
+        }
+        victim = None
+        with self.condition:
+            if self.max_backlog > 0 and len(self.heap) >= self.max_backlog:
+                victim = self._victim(priority)
+                self.dropped += 1
+                if victim is None:
+                    return None
+                self.heap = [entry for entry in self.heap if entry[2] is not victim]
+                heapq.heapify(self.heap)
+                victim['done'].set()
+            heapq.heappush(self.heap, (priority, next(self.sequence), item))
+            self.accepted += 1
+            self.condition.notify()
+        if self.pool is not None:
+            if victim is not None:
+                self.pool.discard(victim)
+            self.pool.wake()
+        return item
+
+    def upcoming(self, count):
+        """再生を待っている項目と、その後に読み上げる最大 count 件（読み上げの順）"""
+        with self.condition:
+            items = [self.current] if self.current is not None else []
+            return items + [entry[2] for entry in heapq.nsmallest(count, self.heap)]
+
+    def _victim(self, priority):
+        """破棄する項目（新しいリクエストを破棄する場合は None）"""
+        if self.policy == 'oldest':
+            return min(self.heap, key=lambda entry: entry[1])[2]
+        lowest = max(self.heap, key=lambda entry: (entry[0], -entry[1]))
+        if priority > lowest[0]:
+            return None
+        return lowest[2]
+
+    def _run(self):
+        """キューの項目を1件ずつ読み上げる"""
+        while True:
+            with self.condition:
+                while not self.heap:
+                    self.condition.wait()
+                _, _, item = heapq.heappop(self.heap)
+                self.current = item
+                self.playing = True
+            waited = time.perf_counter() - item['enqueued']
+            trace = start_trace('(queue)', priority=item['priority'], queuedMs=round(waited * 1000, 3))
+            try:
+                if self.pool is not None:
+                    item['ok'] = self.pool.play(item)
+                else:
+                    item['ok'] = self.engine.speak(item['text'], item['rate'])
+            finally:
+                finish_trace(trace)
+                with self.condition:
+                    self.current = None
+                    self.playing = False
+                    if item['ok']:
+                        self.played += 1
+                    else:
+                        self.failed += 1
+                item['done'].set()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'backlog': len(self.heap),
+                'maxBacklog': self.max_backlog,
+                'policy': self.policy,
+                'playing': self.playing,
+                'accepted': self.accepted,
+                'played': self.played,
+                'failed': self.failed,
+                'dropped': self.dropped,
+            }
+
+
+class SynthesisPool:
+    """
+    合成と再生のパイプライン
+
+    size 個の合成用の PowerShell プロセスが、読み上げキューで再生を待っている項目とその後の lookahead 件を
+    読み上げの順に先行して WAV に合成して音声キャッシュに登録し、再生用の別の PowerShell プロセスが
+    合成済みの音声を続けて再生する。合成用のプロセスは起動時に空の合成を済ませておき、
+    いずれかのプロセスが再起動している間も他のプロセスで合成を続ける。
+    キャッシュに登録しないテキスト（AudioCache.admit が False）は一時ファイルに合成し、再生後（または破棄時）に削除する。
+    """
+
+    def __init__(self, size, lookahead, cache):
+        self.lookahead = lookahead
+        self.cache = cache
+        self.workers = [TTSEngine(cache, warm=True) for _ in range(size)]
+        self.player = TTSEngine(cache, warm=True)
+        self.queue = None
+        self.condition = threading.Condition()
+        # キューの項目が追加・取り出されるたびに増やす（待機中の合成スレッドが変化を見落とさないように）
+        self.generation = 0
+        self.rendering = 0
+        self.rendered = 0
+        # 再生の順番が来た時点で合成が済んでいた項目数と、合成の完了を待った項目数
+        self.ahead = 0
+        self.stalls = 0
+
+    def start(self, queue):
+        """queue の項目の合成を開始"""
+        self.queue = queue
+        for index, worker in enumerate(self.workers):
+            threading.Thread(target=self._work, args=(worker,), name=f'tts-synth-{index}', daemon=True).start()
+
+    def wake(self):
+        """キューの変化を合成スレッドに通知"""
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+
+    def play(self, item):
+        """項目の合成が終わるのを待って再生"""
+        with self.condition:
+            if item['ready'].is_set():
+                self.ahead += 1
+            else:
+                self.stalls += 1
+        # 先行して合成する範囲が1件進む
+        self.wake()
+        with span('synthesis'):
+            item['ready'].wait()
+        path = item['audio']
+        try:
+            with span('play') as attributes:
+                if path is not None and os.path.exists(path):
+                    attributes['ok'] = self.player.play(path)
+                else:
+                    # 合成に失敗した（または削除された）場合は再生用のプロセスで直接読み上げる
+                    attributes['ok'] = self.player.speak(item['text'], item['rate'], cached=False)
+                return attributes['ok']
+        finally:
+            if item['scratch']:
+                remove_file(path)
+
+    def discard(self, item):
+        """キューから破棄された項目の一時ファイルを削除"""
+        with self.condition:
+            item['discarded'] = True
+            path = item['audio'] if item['scratch'] else None
+        if path is not None:
+            remove_file(path)
+
+    def _claim(self):
+        """まだ誰も合成していない直近の項目を1件確保（なければキューが変化するまで待つ）"""
+        while True:
+            with self.condition:
+                generation = self.generation
+            upcoming = self.queue.upcoming(self.lookahead)
+            with self.condition:
+                for item in upcoming:
+                    if not item['claimed']:
+                        item['claimed'] = True
+                        self.rendering += 1
+                        return item
+                while self.generation == generation:
+                    self.condition.wait()
+
+    def _work(self, worker):
+        """合成スレッド（1つの合成用プロセスを使う）"""
+        while True:
+            item = self._claim()
+            try:
+                key = AudioCache.make_key(item['text'], item['rate'], VOICE)
+                path = self.cache.get(key)
+                scratch = False
+                if path is None:
+                    if self.cache.admit(key):
+                        path = worker.render(item['text'], item['rate'])
+                    else:
+                        # 一度しか読み上げないかもしれないテキストはキャッシュを消費しない
+                        path = worker.render_scratch(item['text'], item['rate'])
+                        scratch = path is not None
+                with self.condition:
+                    item['audio'] = path
+                    item['scratch'] = scratch
+                    discarded = item['discarded']
+                if discarded and scratch:
+                    remove_file(path)
+            finally:
+                with self.condition:
+                    self.rendering -= 1
+                    self.rendered += 1
+                item['ready'].set()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'size': len(self.workers),
+                'lookahead': self.lookahead,
+                'rendering': self.rendering,
+                'rendered': self.rendered,
+                'ahead': self.ahead,
+                'stalls': self.stalls,
+            }
+
+
+# グローバル読み上げキュー（TTS_POOL_SIZE を指定した場合は合成と再生のパイプラインで読み上げる）
+synthesis_pool = SynthesisPool(POOL_SIZE, LOOKAHEAD, audio_cache) if POOL_SIZE > 0 else None
+speech_queue = SpeechQueue(tts_engine, MAX_BACKLOG, DROP_POLICY, synthesis_pool)
 
 def is_allowed(environ):
     """最小限のバリデーション"""
     try:
         ip_addr = ipaddress.ip_address(environ.get('REMOTE_ADDR', ''))
-        return (ip_addr.is_private or ip_addr.is_loopback) and \
-               environ.get('PATH_INFO') == '/tts' and \
-               environ.get('REQUEST_METHOD') == 'POST'
+        route = (environ.get('REQUEST_METHOD'), environ.get('PATH_INFO'))
+        if route in DEBUG_ROUTES:
+            return ip_addr.is_loopback
+        return (ip_addr.is_private or ip_addr.is_loopback) and route in ROUTES
     except:
         return False
 
+def debug_traces(params, start_response):
+    """直近のトレース（新しい順、?limit=&min_ms=）"""
+    limit = int(params.get('limit', ['50'])[-1])
+    min_ms = float(params.get('min_ms', ['0'])[-1])
+    result = [trace for trace in reversed(traces) if trace['durationMs'] >= min_ms][:limit]
+    body = json.dumps({'traces': result}, ensure_ascii=False).encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [body]
+
+def debug_profile(params, start_response):
+    """?seconds= の間サンプリングした関数ごとのサンプル数（?format=collapsed で flamegraph.pl 形式）"""
+    seconds = float(params.get('seconds', ['10'])[-1])
+    limit = int(params.get('limit', ['30'])[-1])
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise ValueError(seconds)
+    if not profile_lock.acquire(blocking=False):
+        start_response('409 Conflict', [('Content-Type', 'text/plain; charset=utf-8')])
+        return ['別のプロファイルを実行中です\n'.encode('utf-8')]
+    try:
+        functions, stacks = profile(seconds)
+    finally:
+        profile_lock.release()
+    if params.get('format', [''])[-1] == 'collapsed':
+        lines = [f'{stack} {count}' for stack, count in stacks.most_common()]
+    else:
+        lines = [f'{"self":>8} {"total":>8}  function']
+        ranked = sorted(functions.items(), key=lambda item: item[1], reverse=True)
+        lines += [f'{own:>8} {total:>8}  {name}' for name, (own, total) in ranked[:limit]]
+    start_response('200 OK', [('Content-Type', 'text/plain; charset=utf-8')])
+    return [('\n'.join(lines) + '\n').encode('utf-8')]
+
 def app(environ, start_response):
     if not is_allowed(environ):
         start_response('403 Forbidden', [])
         return [b'']
 
-    length = int(environ.get('CONTENT_LENGTH', 0))
-    text = environ['wsgi.input'].read(length).decode('utf-8')
-
-    # 速度パラメータ取得
-    query_string = environ.get('QUERY_STRING', '')
-    rate = SPEED
-    if query_string:
-        params = dict(param.split('=') for param in query_string.split('&') if '=' in param)
+    if environ['REQUEST_METHOD'] == 'GET':
         try:
-            rate = int(params.get('rate', SPEED))
-            rate = max(-10, min(10, rate))
-        except:
-            traceback.print_exc()
+            params = urllib.parse.parse_qs(environ.get('QUERY_STRING', ''))
+            if environ['PATH_INFO'] == '/stats':
+                start_response('200 OK', [('Content-Type', 'application/json')])
+                stats = {
+                    'queue': speech_queue.stats(),
+                    'cache': audio_cache.stats() if audio_cache else None,
+                    'pool': synthesis_pool.stats() if synthesis_pool else None,
+                }
+                return [json.dumps(stats).encode('utf-8')]
+            if environ['PATH_INFO'] == '/debug/traces':
+                return debug_traces(params, start_response)
+            return debug_profile(params, start_response)
+        except ValueError:
+            start_response('400 Bad Request', [])
+            return [b'Bad Request']
 
-    if tts_engine.speak(text, rate):
-        start_response('200 OK', [])
-        return [b'OK']
-    else:
-        start_response('500 Internal Server Error', [])
-        return [b'TTS Failed']
+    trace = start_trace(environ['PATH_INFO'])
+    try:
+        return speak_request(environ, start_response)
+    finally:
+        finish_trace(trace)
+
+def speak_request(environ, start_response):
+    with span('parse') as attributes:
+        length = int(environ.get('CONTENT_LENGTH', 0))
+        text = environ['wsgi.input'].read(length).decode('utf-8')
+        attributes['chars'] = len(text)
+
+        # 速度・優先度・完了待ちのパラメータ取得
+        params = urllib.parse.parse_qs(environ.get('QUERY_STRING', ''))
+        rate = SPEED
+        if 'rate' in params:
+            try:
+                rate = int(params['rate'][-1])
+                rate = max(-10, min(10, rate))
+            except:
+                traceback.print_exc()
+        priority = PRIORITIES.get(params.get('priority', [''])[-1], PRIORITIES['normal'])
+        wait = params.get('wait', [''])[-1] == '1'
+        attributes.update(rate=rate, priority=priority, wait=wait)
+
+    item = speech_queue.put(text, rate, priority)
+    if item is not None and wait:
+        # ?wait=1 の場合は読み上げが終わるまで待つ
+        with span('queue'):
+            item['done'].wait()
+
+    with span('serialize'):
+        if item is None or (wait and item['ok'] is None):
+            start_response('503 Service Unavailable', [])
+            return [b'Dropped']
+        elif not wait:
+            start_response('202 Accepted', [])
+            return [b'Accepted']
+        elif item['ok']:
+            start_response('200 OK', [])
+            return [b'OK']
+        else:
+            start_response('500 Internal Server Error', [])
+            return [b'TTS Failed']
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """リクエストごとにスレッドで処理する（読み上げは SpeechQueue の消費スレッドで1件ずつ）"""
+    daemon_threads = True
 
 def main():
-    with make_server('0.0.0.0', PORT, app) as httpd:
+    with make_server('0.0.0.0', PORT, app, server_class=ThreadingWSGIServer) as httpd:
         print('TTS Server on :', PORT)
-        print('(Thread-safe with TTS synchronization)')
+        print(f'(Queued: max backlog {MAX_BACKLOG or "unlimited"}, drop {DROP_POLICY})')
+        if synthesis_pool is not None:
+            print(f'(Synthesis pool: {POOL_SIZE} workers, look-ahead {LOOKAHEAD})')
+        if audio_cache is not None:
+            print(f'(Audio cache: {CACHE_DIR}, {CACHE_MAX_MB} MB)')
+            if CACHE_PREWARM:
+                threading.Thread(target=prewarm_cache, args=(CACHE_PREWARM,), name='tts-prewarm', daemon=True).start()
         httpd.serve_forever()
 
 if __name__ == '__main__':